@@ -1,7 +1,8 @@
 # flake8: noqa
 from .build_data_frame import build_data_frame, prepare_df
 from .finta import TA
-from .run_backtest import run_backtest
+from .run_backtest import run_backtest, run_backtests
+from .streaming import create_streaming_indicator, streaming_map
 from .transformers_map import transformers_map
 from .validate_backtest import validate_backtest
 
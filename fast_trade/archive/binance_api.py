@@ -1,15 +1,20 @@
 import datetime
-import math
 import os
-import random
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Optional
 from datetime import UTC
 
+import numpy as np
 import pandas as pd
 import requests
 
-API_DELAY = float(os.getenv("API_DELAY", 0.3))
+from .rate_limit import BINANCE_KLINES_WEIGHT, get_rate_limiter, record_response
+
+# each request gets 15 hours of 1 minute klines, the api returns at most 1000
+HOURS_TO_INCREMENT = 15
+# number of windows of a symbol downloaded at once
+PIPELINE_WORKERS = int(os.getenv("BINANCE_PIPELINE_WORKERS", 4))
 
 # Cache for available symbols with timestamp
 _available_symbols_cache: Optional[List[str]] = None
@@ -96,7 +101,10 @@ def get_oldest_date_available(symbol):
     endTime = int(datetime.datetime.now(UTC).timestamp() * 1000)
     url = f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval=1m&startTime=0&endTime={endTime}&limit=1"
 
-    data = requests.get(url).json()
+    get_rate_limiter("binance").acquire(BINANCE_KLINES_WEIGHT)
+    req = requests.get(url)
+    record_response("binance", req)
+    data = req.json()
     try:
         oldest_date = datetime.datetime.fromtimestamp(data[0][0] / 1000)
         return oldest_date
@@ -105,89 +113,146 @@ def get_oldest_date_available(symbol):
         return datetime.datetime.now(UTC) - datetime.timedelta(days=1)
 
 
+def get_kline_windows(
+    start_date: datetime.datetime,
+    end_date: datetime.datetime,
+    hours: int = HOURS_TO_INCREMENT,
+) -> List[tuple]:
+    """
+    Split the dates into the windows requested from the api
+
+    Returns:
+        List[tuple]: (start ms, end ms) of each window. Both ends are inclusive in the api, so each
+        window ends 1ms before the next one starts and no candle is downloaded twice.
+    """
+    start_ms = int(start_date.timestamp()) * 1000
+    end_ms = int(end_date.timestamp()) * 1000
+    step_ms = hours * 60 * 60 * 1000
+
+    windows = []
+    for window_start in range(start_ms, end_ms, step_ms):
+        windows.append((window_start, min(window_start + step_ms, end_ms) - 1))
+
+    return windows
+
+
+def fetch_kline_window(symbol: str, start_ms: int, end_ms: int) -> np.ndarray:
+    """
+    Download a single window of 1 minute klines
+
+    Returns:
+        np.ndarray: The klines as float64 rows of date (ms), open, high, low, close, volume
+    """
+    url = (
+        "https://api.binance.com/api/v3/klines"
+        f"?symbol={symbol}&interval=1m"
+        f"&startTime={start_ms}&endTime={end_ms}&limit=1000"
+    )
+
+    error_count = 0
+    while True:
+        # shared with every other download from binance
+        get_rate_limiter("binance").acquire(BINANCE_KLINES_WEIGHT)
+        req = requests.get(url)
+        record_response("binance", req)
+        if req.status_code == 200:
+            return binance_klines_to_array(req.json())
+
+        print(f"Error: {symbol} {req.text}")
+        error_count += 1
+        if error_count > 3:
+            raise Exception(
+                f"Download failed for {symbol} after 3 errors. Error: {req.text}"
+            )
+        if req.status_code != 429:
+            # a 429 already paused the rate limiter
+            time.sleep(error_count)
+
+
 def get_binance_klines(
     symbol,
     start_date: datetime.datetime,
     end_date: datetime.datetime,
     status_update=lambda x: None,
-    store_func=lambda x, y: None,
+    store_func=lambda x, y, z: None,
+    max_workers: int = PIPELINE_WORKERS,
+    return_df: bool = False,
 ):
+    """
+    Download the 1 minute klines of a symbol
+
+    Args:
+        symbol (str): The symbol to download
+        start_date (datetime.datetime): The first date to download
+        end_date (datetime.datetime): The last date to download, capped at now
+        status_update (callable): Called with a status dict after each window
+        store_func (callable): Called with (df, symbol, "binance") once for each downloaded window
+        max_workers (int): Number of windows downloaded at once. They all share the binance rate limiter.
+        return_df (bool): Also return all the klines as one dataframe. Every window is then kept
+            until the download is done, so the memory grows with the length of the download.
+
+    Returns:
+        tuple: (pd.DataFrame of the klines, or None unless return_df is set, final status dict)
+
+    Explainer
+    ---------
+    The windows are computed up front and a few are downloaded at a time. Each window is converted
+    to a float array as soon as it arrives and handed to store_func on its own, so every row is
+    converted and written once. Unless return_df is set, a window is dropped once it's stored,
+    so the memory used doesn't grow with the length of the backfill.
+    """
     start_date = start_date.replace(tzinfo=datetime.timezone.utc)
     end_date = end_date.replace(tzinfo=datetime.timezone.utc)
 
-    curr_date = start_date
-
-    HOURS_TO_INCREMENT = 15
-
-    end_date = end_date.replace(tzinfo=datetime.timezone.utc)
     now = datetime.datetime.now().replace(tzinfo=datetime.timezone.utc)
     if end_date > now:
         end_date = now.replace(second=0, microsecond=0)
 
-    # calculate the estimated number of calls
-    total_duration_hours = (end_date - curr_date).total_seconds() / 3600
-    num_calls = math.ceil(total_duration_hours / HOURS_TO_INCREMENT)
+    windows = get_kline_windows(start_date, end_date)
+    num_calls = len(windows)
     total_api_calls = 0
-    klines = []
+    batches = []
     start_time = time.time()
-    error_count = 0
-    while curr_date < end_date:
-        next_end_date = curr_date + datetime.timedelta(hours=HOURS_TO_INCREMENT)
-        startTime = int(curr_date.timestamp()) * 1000
-        endTime = int(next_end_date.timestamp()) * 1000
-
-        print(f"Getting {symbol} from {curr_date} to {next_end_date}")
 
-        url = (
-            "https://api.binance.com/api/v3/klines"
-            f"?symbol={symbol}&interval=1m"
-            f"&startTime={startTime}&endTime={endTime}&limit=1000"
-        )
+    print(f"Getting {symbol} from {start_date} to {end_date} in {num_calls} windows")
 
-        req = requests.get(url)
-        total_api_calls += 1
-        if req.status_code == 200:
-            curr_date = next_end_date
-            klines.extend(req.json())
-            error_count = 0  # Reset error count on successful request
-        else:
-            # print(req)
-            # raise Exception(f"Error with {symbol}")
-            print(f"Error: {symbol} {req.text}")
-            error_count += 1
-            if error_count > 3:
-                raise Exception(
-                    f"Download failed for {symbol} after 3 errors. Error: {req.text}"
+    executor = ThreadPoolExecutor(max_workers=max(max_workers, 1))
+    try:
+        pending = set()
+        next_window = 0
+        while pending or next_window < num_calls:
+            # only keep a few windows in flight, so a slow store_func doesn't pile up results
+            while next_window < num_calls and len(pending) < max_workers * 2:
+                pending.add(
+                    executor.submit(fetch_kline_window, symbol, *windows[next_window])
                 )
-            if req.status_code == 429:
-                # sleeep for some time
-                time.sleep(10)
-                continue
-        sleeper = random.random() * API_DELAY
-        if sleeper < 0.1:
-            sleeper += 0.1
-
-        if total_api_calls % 30 == 0:
-            sleeper += random.randint(1, 3)
-            kline_df = binance_kline_to_df(klines)
-            store_func(kline_df, symbol, "binance")
-
-        status_obj = {
-            "symbol": symbol,
-            "perc_complete": round(total_api_calls / num_calls * 100, 2),
-            "call_count": total_api_calls,
-            "total_calls": num_calls,
-            "total_time": round(time.time() - start_time, 2),
-            # "sleep_time": sleeper,
-            "est_time_remaining": round(
-                (time.time() - start_time)
-                / total_api_calls
-                * (num_calls - total_api_calls),
-                2,
-            ),
-        }
-        status_update(status_obj)
-        time.sleep(sleeper)
+                next_window += 1
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = future.result()
+                total_api_calls += 1
+                if len(batch):
+                    if return_df:
+                        batches.append(batch)
+                    store_func(kline_array_to_df(batch), symbol, "binance")
+
+                elapsed = time.time() - start_time
+                status_update(
+                    {
+                        "symbol": symbol,
+                        "perc_complete": round(total_api_calls / num_calls * 100, 2),
+                        "call_count": total_api_calls,
+                        "total_calls": num_calls,
+                        "total_time": round(elapsed, 2),
+                        "est_time_remaining": round(
+                            elapsed / total_api_calls * (num_calls - total_api_calls),
+                            2,
+                        ),
+                    }
+                )
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
     status_obj = {
         "symbol": symbol,
@@ -198,10 +263,38 @@ def get_binance_klines(
         "est_time_remaining": 0,
     }
     status_update(status_obj)
-    klines_df = binance_kline_to_df(klines)
+
+    if not return_df:
+        return None, status_obj
+
+    klines = np.concatenate(batches) if batches else np.empty((0, 6))
+    klines_df = kline_array_to_df(klines).sort_index()
+    klines_df = klines_df[~klines_df.index.duplicated(keep="last")]
+
     return klines_df, status_obj
 
 
+def binance_klines_to_array(klines: list) -> np.ndarray:
+    """
+    Convert the klines from the api to float64 rows of date (ms), open, high, low, close, volume
+    """
+    if not klines:
+        return np.empty((0, 6))
+
+    return np.array([kline[:6] for kline in klines], dtype=np.float64)
+
+
+def kline_array_to_df(klines: np.ndarray) -> pd.DataFrame:
+    """Build a dataframe indexed by date from the rows of binance_klines_to_array"""
+    return pd.DataFrame(
+        klines[:, 1:],
+        index=pd.DatetimeIndex(
+            pd.to_datetime(klines[:, 0].astype(np.int64), unit="ms"), name="date"
+        ),
+        columns=["open", "high", "low", "close", "volume"],
+    )
+
+
 def binance_kline_to_df(klines):
     new_df = pd.DataFrame(klines, columns=BINANCE_KLINE_REST_HEADER_MATCH)
 
@@ -1,18 +1,22 @@
 import datetime
-import math
 import os
-import random
 import time
 import typing
-from pprint import pprint
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Optional
 from datetime import UTC
 
+import numpy as np
 import pandas as pd
 import requests
 
-API_DELAY = os.getenv("API_DELAY", 0.3)
+from .rate_limit import get_rate_limiter, record_response
+
 BASE_URL = "https://api.exchange.coinbase.com"
+# each request gets 3 hours of 1 minute candles, the api returns at most 300
+HOURS_PER_REQUEST = 3
+# number of windows of a product downloaded at once
+PIPELINE_WORKERS = int(os.getenv("COINBASE_PIPELINE_WORKERS", 4))
 
 # Cache for asset IDs with timestamp
 _asset_ids_cache: Optional[List[str]] = None
@@ -26,6 +30,9 @@ CB_REST_HEADER_MATCH = [
     "close",
     "volume",
 ]
+CANDLE_DTYPE = np.dtype(
+    [("date", np.int64)] + [(name, np.float64) for name in CB_REST_HEADER_MATCH[1:]]
+)
 
 
 def get_products() -> typing.List[dict]:
@@ -67,125 +74,199 @@ def get_asset_ids() -> List[str]:
     return ids
 
 
+def get_candle_windows(
+    start: datetime.datetime, end: datetime.datetime, hours: int = HOURS_PER_REQUEST
+) -> List[tuple]:
+    """Split the dates into the (start, end) epoch second windows requested from the api"""
+    start_s = int(start.timestamp())
+    end_s = int(end.timestamp())
+    step_s = hours * 60 * 60
+
+    windows = []
+    for window_start in range(start_s, end_s, step_s):
+        windows.append((window_start, min(window_start + step_s, end_s)))
+
+    return windows
+
+
+def candles_to_records(candles: list, start_s: int, end_s: int) -> np.ndarray:
+    """
+    Convert the candles of a window to a record array sorted by date, one row per date
+
+    Args:
+        candles (list): [date, low, high, open, close, volume] rows from the api
+        start_s (int): The start of the window in epoch seconds
+        end_s (int): The end of the window in epoch seconds, excluded so windows don't share a candle
+
+    Returns:
+        np.ndarray: Records with the CANDLE_DTYPE fields
+    """
+    if not candles:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+
+    values = np.array([candle[:6] for candle in candles], dtype=np.float64)
+    dates = values[:, 0].astype(np.int64)
+
+    in_window = (dates >= start_s) & (dates < end_s)
+    values = values[in_window]
+    # np.unique sorts the dates, and the windows don't overlap, so each date is only ever kept once
+    dates, first = np.unique(dates[in_window], return_index=True)
+    values = values[first]
+
+    records = np.empty(len(dates), dtype=CANDLE_DTYPE)
+    records["date"] = dates
+    for i, name in enumerate(CB_REST_HEADER_MATCH[1:], start=1):
+        records[name] = values[:, i]
+
+    return records
+
+
+def records_to_df(records: np.ndarray) -> pd.DataFrame:
+    """Build a dataframe indexed by date from the records of candles_to_records"""
+    return pd.DataFrame(
+        {name: records[name] for name in CB_REST_HEADER_MATCH[1:]},
+        index=pd.DatetimeIndex(pd.to_datetime(records["date"], unit="s"), name="date"),
+    )
+
+
+def fetch_candle_window(product_id: str, start_s: int, end_s: int) -> np.ndarray:
+    """
+    Download the 1 minute candles of a single window
+
+    Returns:
+        np.ndarray: Records with the CANDLE_DTYPE fields
+    """
+    url = f"{BASE_URL}/products/{product_id}/candles"
+    headers = {"Content-Type": "application/json"}
+    params = {"granularity": 60, "start": str(start_s), "end": str(end_s)}
+
+    bad_errors = 0
+    while True:
+        # shared with every other download from coinbase
+        get_rate_limiter("coinbase").acquire()
+        res = requests.get(url, params=params, headers=headers)
+        record_response("coinbase", res)
+        if res.status_code < 400:
+            return candles_to_records(res.json(), start_s, end_s)
+
+        print("Error ", res.status_code, res.text)
+        bad_errors += 1
+        if bad_errors > 4:
+            raise Exception(f"Api Error: {res.status_code} {res.text}")
+        if res.status_code != 429:
+            # a 429 already paused the rate limiter
+            time.sleep(2 * bad_errors)
+
+
+def iter_candle_batches(
+    product_id: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    max_workers: int = PIPELINE_WORKERS,
+):
+    """
+    Download the windows between the dates a few at a time
+
+    Yields:
+        tuple: (record array of a window, number of windows done, total number of windows).
+        Windows are yielded as they finish, not in date order.
+    """
+    windows = get_candle_windows(start, end)
+    num_windows = len(windows)
+    done_count = 0
+
+    executor = ThreadPoolExecutor(max_workers=max(max_workers, 1))
+    try:
+        pending = set()
+        next_window = 0
+        while pending or next_window < num_windows:
+            # only keep a few windows in flight, so a slow consumer doesn't pile up results
+            while next_window < num_windows and len(pending) < max_workers * 2:
+                pending.add(
+                    executor.submit(
+                        fetch_candle_window, product_id, *windows[next_window]
+                    )
+                )
+                next_window += 1
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                done_count += 1
+                yield future.result(), done_count, num_windows
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 def get_product_candles(
     product_id: str,
     start: datetime = None,
     end: datetime = None,
     update_status: callable = lambda x: None,
-    store_func: callable = lambda x: None,
+    store_func: callable = lambda x, y, z: None,
+    max_workers: int = PIPELINE_WORKERS,
+    return_df: bool = False,
 ):
-    """Returns the candle data for a given product"""
-
-    # print("Fetching data for: ", product_id, start, end)
+    """
+    Returns the candle data for a given product
+
+    Args:
+        product_id (str): The product to download, ex. BTC-USD
+        start (datetime.datetime, optional): Defaults to the oldest day with data
+        end (datetime.datetime, optional): Defaults to now
+        update_status (callable): Called with a status dict after each window
+        store_func (callable): Called with (df, product_id, "coinbase") once for each downloaded window
+        max_workers (int): Number of windows downloaded at once. They all share the coinbase rate limiter.
+        return_df (bool): Also return all the candles as one dataframe. Every window is then kept
+            until the download is done, so the memory grows with the length of the download.
+
+    Returns:
+        tuple: (pd.DataFrame of the candles, newest first, or None unless return_df is set, final status dict)
+    """
     if not start:
         # fetch the oldest date for this symbol
         start = get_oldest_day(product_id)
 
-    # can't be more than 1 hour in the past
     end = end or datetime.datetime.now(UTC)
-    start = start or (end - datetime.timedelta(hours=3))
-
-    # end = end + datetime.timedelta(days=1)
 
     start = start.replace(tzinfo=datetime.timezone.utc)
     end = end.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(UTC)
+    if end > now:
+        end = now
 
-    # print("start", start, "end", end)
-    # return
-    # while datetime.datetime.fromisoformat(
-    currentDate = start
-    df = pd.DataFrame()
-
-    # calculate the estimated number of calls
-    total_duration_hours = (end - start).total_seconds() / 3600
-    num_calls = math.ceil(total_duration_hours / 3)
-    # print("estimated number of calls: ", num_calls)
-    call_count = 0
-    # print("start", start, "end", end)
+    batches = []
     status_obj = {}
-    bad_errors = 0
     start_time = time.time()
-    while currentDate < end:
-        # print("currentDate", currentDate, "end", end)
-        currentDate = currentDate.replace(tzinfo=datetime.timezone.utc)
-        next_end = currentDate + datetime.timedelta(hours=3)
-        now = datetime.datetime.now(UTC).replace(tzinfo=datetime.timezone.utc)
-        next_end = next_end.replace(tzinfo=datetime.timezone.utc)
-        if next_end > now:
-            next_end = now
-
-        params = {
-            "granularity": 60,
-            "start": str(int(currentDate.timestamp())),
-            "end": str(int(next_end.timestamp())),
-        }
-
-        df = get_single_candle(product_id, params, df)
-        if df.empty:
-            print(f"Error Downloading {product_id}")
-            bad_errors += 1
-            if bad_errors > 4:
-                raise Exception(
-                    f"Error Downloading: for {product_id} from {start} to {end}"
-                )
-            time.sleep(2 * bad_errors)
-            continue
-        call_count += 1
-        if call_count % 10 == 0:
-            store_func(df, product_id, "coinbase")
+    for records, call_count, num_calls in iter_candle_batches(
+        product_id, start, end, max_workers=max_workers
+    ):
+        if len(records):
+            if return_df:
+                batches.append(records)
+            # only the new window is stored, each row is written once
+            store_func(records_to_df(records), product_id, "coinbase")
 
+        elapsed = time.time() - start_time
         status_obj = {
             "symbol": product_id,
             "perc_complete": round(call_count / num_calls * 100, 2),
             "call_count": call_count,
             "total_calls": num_calls,
-            "total_time": round(time.time() - start_time, 2),
-            # "sleep_time": sleeper,
+            "total_time": round(elapsed, 2),
             "est_time_remaining": round(
-                (time.time() - start_time) / call_count * (num_calls - call_count), 2
+                elapsed / call_count * (num_calls - call_count), 2
             ),
         }
         update_status(status_obj)
-        currentDate = next_end
-    if not df.empty:
-        df.sort_index(inplace=True, ascending=False)
 
-    return df, status_obj
+    if not return_df:
+        return None, status_obj
 
+    records = np.concatenate(batches) if batches else np.empty(0, dtype=CANDLE_DTYPE)
+    df = records_to_df(records)
+    df.sort_index(inplace=True, ascending=False)
 
-def get_single_candle(product_id: str, params: dict = {}, df=pd.DataFrame()):
-    url = f"{BASE_URL}/products/{product_id}/candles"
-    headers = {"Content-Type": "application/json"}
-    try:
-        res = requests.get(url, params=params, headers=headers)
-        bad_errors = 0
-        if res.status_code > 399:
-            bad_errors += 1
-            # skip this call
-            print("Error ", res.status_code, res.text)
-            # bad_errors += 1
-            if bad_errors > 1:
-                time.sleep(bad_errors * bad_errors * bad_errors)
-
-            if bad_errors > 5:
-                raise Exception(f"Api Error: {res.status_code} {res.text}")
-            # Warning("skipping call ", res.status_code, res.text)
-        # print("res", res.status_code, res.text)
-        res = res.json()
-        new_df = df_from_candles(res)
-        if new_df.empty:
-            bad_errors += 1
-            if bad_errors > 1:
-                raise Exception(f"Error Downloading: for {product_id}")
-            return pd.DataFrame()
-        sleep_time = random.random() * 0.5 + 0.1
-        time.sleep(sleep_time)
-        df = pd.concat([df, new_df])
-        df.drop_duplicates(inplace=True)
-        return df
-    except Exception as e:
-        print("error", e)
-        return pd.DataFrame()
+    return df, status_obj
 
 
 def df_from_candles(klines):
@@ -215,9 +296,10 @@ def get_oldest_day(
             "end": int((middle_date + datetime.timedelta(minutes=1)).timestamp()),
         }
 
+        get_rate_limiter("coinbase").acquire()
         response = requests.get(url, params=params)
+        record_response("coinbase", response)
         call_count += 1
-        time.sleep(random.random() * 0.2 + 0.1)
         if response.status_code != 200:
             time.sleep(2)
             raise Exception(f"API request failed: {response.text}")
@@ -0,0 +1,377 @@
+import datetime
+import os
+import typing
+
+import pandas as pd
+
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive"))
+
+# file extension of each columnar format
+COLUMNAR_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+KLINE_COLUMNS = ["open", "close", "high", "low", "volume"]
+
+
+def import_pyarrow():
+    """
+    Import pyarrow only when a columnar archive is used, so it stays an optional dependency
+
+    Returns:
+        module: pyarrow
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "pyarrow is required for the parquet and arrow archive formats. "
+            "Install it with `pip install pyarrow` or set ARCHIVE_FORMAT=sqlite"
+        )
+
+    return pyarrow
+
+
+def check_archive_format(archive_format: str):
+    if archive_format not in COLUMNAR_FORMATS:
+        raise ValueError(
+            f"Archive format {archive_format} not supported. Use one of {list(COLUMNAR_FORMATS)}"
+        )
+
+
+def get_symbol_path(symbol: str, exchange: str) -> str:
+    """
+    Each symbol is a directory of monthly partitions, ex. ARCHIVE_PATH/binance/BTCUSDT/2024-01.parquet
+    """
+    return os.path.join(ARCHIVE_PATH, exchange, symbol)
+
+
+def get_partitions(
+    symbol: str, exchange: str, archive_format: str
+) -> typing.List[typing.Tuple[pd.Period, str]]:
+    """
+    Get the monthly partitions of a symbol
+
+    Returns:
+        typing.List[typing.Tuple[pd.Period, str]]: A sorted list of the month and the path to its file
+    """
+    check_archive_format(archive_format)
+    symbol_path = get_symbol_path(symbol, exchange)
+    if not os.path.isdir(symbol_path):
+        return []
+
+    ext = COLUMNAR_FORMATS[archive_format]
+    partitions = []
+    for file_name in os.listdir(symbol_path):
+        if file_name.startswith("_") or not file_name.endswith(ext):
+            continue
+        month = pd.Period(file_name.replace(ext, ""), freq="M")
+        partitions.append((month, os.path.join(symbol_path, file_name)))
+
+    partitions.sort()
+    return partitions
+
+
+def symbol_exists(symbol: str, exchange: str, archive_format: str) -> bool:
+    return len(get_partitions(symbol, exchange, archive_format)) > 0
+
+
+def read_partition(path: str, archive_format: str, columns: list = None):
+    """
+    Read a single partition as a pyarrow table. Arrow files are memory mapped, so only the
+    columns that are used get paged in.
+    """
+    pa = import_pyarrow()
+    read_columns = None if columns is None else ["date"] + list(columns)
+
+    if archive_format == "parquet":
+        return pa.parquet.read_table(path, columns=read_columns, memory_map=True)
+
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    if read_columns is not None:
+        table = table.select(read_columns)
+
+    return table
+
+
+def write_partition(df: pd.DataFrame, path: str, archive_format: str):
+    """Write a partition to a temp file first, so a reader never sees a half written file"""
+    pa = import_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=True)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if archive_format == "parquet":
+        pa.parquet.write_table(table, tmp_path)
+    else:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    os.replace(tmp_path, path)
+
+
+def table_to_df(table) -> pd.DataFrame:
+    df = table.to_pandas()
+    if "date" in df.columns:
+        df = df.set_index("date")
+
+    return df
+
+
+def standardize_klines(df: pd.DataFrame) -> pd.DataFrame:
+    new_df = df[~df.index.duplicated(keep="last")]
+    new_df = new_df.reindex(columns=KLINE_COLUMNS)
+    new_df = new_df.apply(pd.to_numeric)
+    new_df.index = pd.DatetimeIndex(new_df.index, name="date").as_unit("ns")
+
+    return new_df.sort_index()
+
+
+def write_klines(
+    df: pd.DataFrame, symbol: str, exchange: str, archive_format: str = "parquet"
+) -> str:
+    """
+    Store the klines as monthly partitions, merging with the months that are already stored
+
+    Args:
+        df (pd.DataFrame): The kline dataframe to store, indexed by date
+        symbol (str): The symbol of the klines
+        exchange (str): The exchange of the klines
+        archive_format (str): "parquet" or "arrow"
+
+    Returns:
+        str: The path to the symbol directory
+    """
+    check_archive_format(archive_format)
+    symbol_path = get_symbol_path(symbol, exchange)
+    os.makedirs(symbol_path, exist_ok=True)
+
+    if df.empty:
+        return symbol_path
+
+    df = standardize_klines(df)
+    ext = COLUMNAR_FORMATS[archive_format]
+
+    for month, month_df in df.groupby(df.index.to_period("M")):
+        path = os.path.join(symbol_path, f"{month}{ext}")
+        if os.path.exists(path):
+            existing_df = table_to_df(read_partition(path, archive_format))
+            month_df = pd.concat([existing_df, month_df])
+            month_df = month_df[~month_df.index.duplicated(keep="last")].sort_index()
+
+        write_partition(month_df, path, archive_format)
+
+    return symbol_path
+
+
+class KlineWriter:
+    """
+    Buffers the klines of a download and writes each month once it's complete, instead of
+    rewriting the month's partition for every downloaded window. The download moves forward in time,
+    so the months before the newest one buffered are done. close() writes the rest.
+
+    write() has the same arguments as update_klines_to_db, so it can be used as a store_func.
+    """
+
+    def __init__(self, archive_format: str = "parquet"):
+        check_archive_format(archive_format)
+        self.archive_format = archive_format
+        # (symbol, exchange) -> {month: [dataframes]}
+        self._months = {}
+
+    def write(self, df: pd.DataFrame, symbol: str, exchange: str) -> str:
+        """Buffer the klines, writing the months that are complete"""
+        months = self._months.setdefault((symbol, exchange), {})
+        if not df.empty:
+            df = standardize_klines(df)
+            for month, month_df in df.groupby(df.index.to_period("M")):
+                months.setdefault(month, []).append(month_df)
+
+        if months:
+            last_month = max(months)
+            done = [month for month in months if month < last_month]
+            self._write_months(symbol, exchange, done)
+
+        return get_symbol_path(symbol, exchange)
+
+    def close(self):
+        """Write everything that's still buffered"""
+        for symbol, exchange in list(self._months):
+            self._write_months(symbol, exchange, list(self._months[(symbol, exchange)]))
+
+    def _write_months(self, symbol: str, exchange: str, months_to_write: list):
+        months = self._months[(symbol, exchange)]
+        for month in sorted(months_to_write):
+            write_klines(
+                pd.concat(months[month]), symbol, exchange, self.archive_format
+            )
+            # only dropped once written, so a failed write can be retried by close()
+            del months[month]
+
+
+def to_naive_utc(date) -> typing.Optional[pd.Timestamp]:
+    """The klines are stored in naive UTC, tz-aware dates are converted to it like db_helpers.to_epoch_ms"""
+    if date is None:
+        return None
+
+    ts = pd.Timestamp(date)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return ts
+
+
+def read_klines(
+    symbol: str,
+    exchange: str,
+    start_date: datetime.datetime = None,
+    end_date: datetime.datetime = None,
+    archive_format: str = "parquet",
+    columns: list = None,
+) -> pd.DataFrame:
+    """
+    Read the klines between the dates, only opening the months that overlap them
+
+    Args:
+        symbol (str): The symbol of the klines
+        exchange (str): The exchange of the klines
+        start_date (datetime.datetime, optional): The first date to include
+        end_date (datetime.datetime, optional): The last date to include
+        archive_format (str): "parquet" or "arrow"
+        columns (list, optional): The kline columns to read. Defaults to all of them.
+
+    Returns:
+        pd.DataFrame: The klines indexed by date
+    """
+    pa = import_pyarrow()
+    start_date = to_naive_utc(start_date)
+    end_date = to_naive_utc(end_date)
+    start_month = None if start_date is None else pd.Period(start_date, freq="M")
+    end_month = None if end_date is None else pd.Period(end_date, freq="M")
+
+    tables = []
+    for month, path in get_partitions(symbol, exchange, archive_format):
+        if start_month is not None and month < start_month:
+            continue
+        if end_month is not None and month > end_month:
+            continue
+        tables.append(read_partition(path, archive_format, columns=columns))
+
+    if not tables:
+        empty_columns = KLINE_COLUMNS if columns is None else list(columns)
+        return pd.DataFrame(
+            columns=empty_columns, index=pd.DatetimeIndex([], name="date")
+        )
+
+    df = table_to_df(pa.concat_tables(tables, promote_options="default"))
+
+    # only the first and last months can have rows outside of the dates
+    if start_date is not None:
+        df = df[df.index >= start_date]
+    if end_date is not None:
+        df = df[df.index <= end_date]
+
+    return df
+
+
+def get_max_date(
+    symbol: str, exchange: str, archive_format: str = "parquet"
+) -> typing.Optional[datetime.datetime]:
+    """
+    Get the last date stored for the symbol, only reading the last partition
+
+    Returns:
+        datetime.datetime | None: The last date, or None if nothing is stored
+    """
+    partitions = get_partitions(symbol, exchange, archive_format)
+    if not partitions:
+        return None
+
+    table = read_partition(partitions[-1][1], archive_format, columns=[])
+    dates = table.column("date").to_pandas()
+    if dates.empty:
+        return None
+
+    return dates.max().to_pydatetime()
+
+
+def migrate_sqlite_to_columnar(
+    symbol: str,
+    exchange: str,
+    archive_format: str = "parquet",
+    remove_sqlite: bool = False,
+    chunk_size: int = 500_000,
+) -> str:
+    """
+    Copy a symbol from its .sqlite archive into monthly partitions
+
+    Args:
+        symbol (str): The symbol to migrate
+        exchange (str): The exchange of the symbol
+        archive_format (str): "parquet" or "arrow"
+        remove_sqlite (bool): Delete the .sqlite file once it's copied
+        chunk_size (int): Number of rows to read from sqlite at a time
+
+    Returns:
+        str: The path to the symbol directory
+    """
+    from .db_helpers import connect_to_klines_db, from_epoch_ms
+
+    check_archive_format(archive_format)
+    db_path = os.path.join(ARCHIVE_PATH, exchange, f"{symbol}.sqlite")
+    symbol_path = get_symbol_path(symbol, exchange)
+
+    with connect_to_klines_db(db_path) as conn:
+        chunks = pd.read_sql_query(
+            "SELECT * FROM klines ORDER BY date", conn, chunksize=chunk_size
+        )
+        writer = KlineWriter(archive_format)
+        for chunk in chunks:
+            chunk.date = from_epoch_ms(chunk.date)
+            chunk = chunk.set_index("date")
+            symbol_path = writer.write(chunk, symbol, exchange)
+        writer.close()
+
+    if remove_sqlite:
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    return symbol_path
+
+
+def migrate_archive(
+    archive_format: str = "parquet",
+    exchange: str = None,
+    remove_sqlite: bool = False,
+    **kwargs,
+):
+    """
+    Migrate every .sqlite archive (optionally only for one exchange) to the columnar format
+
+    Args:
+        archive_format (str): "parquet" or "arrow"
+        exchange (str, optional): Only migrate this exchange
+        remove_sqlite (bool): Delete the .sqlite files once they're copied
+    """
+    check_archive_format(archive_format)
+    import_pyarrow()
+
+    count = 0
+    for asset_exchange in sorted(os.listdir(ARCHIVE_PATH)):
+        exchange_path = os.path.join(ARCHIVE_PATH, asset_exchange)
+        if exchange is not None and asset_exchange != exchange:
+            continue
+        if asset_exchange.startswith("_") or not os.path.isdir(exchange_path):
+            continue
+
+        for file_name in sorted(os.listdir(exchange_path)):
+            if file_name.startswith("_") or not file_name.endswith(".sqlite"):
+                continue
+            symbol = file_name.replace(".sqlite", "")
+            print(f"Migrating {symbol} from {asset_exchange} to {archive_format}")
+            migrate_sqlite_to_columnar(
+                symbol, asset_exchange, archive_format, remove_sqlite=remove_sqlite
+            )
+            count += 1
+
+    print(f"Migrated {count} symbols to {archive_format}")
+    return count
@@ -3,9 +3,21 @@ import os
 import sqlite3
 import typing
 
+import numpy as np
 import pandas as pd
 
+from ..utils import resample
+from . import columnar_store
+
 ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive"))
+# "sqlite", or "parquet"/"arrow" for monthly columnar partitions (requires pyarrow)
+ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "sqlite")
+
+# stored in PRAGMA user_version, bump it when the klines table changes
+# 0: table created by DataFrame.to_sql, TEXT dates, no key
+# 1: INTEGER epoch ms primary key, WITHOUT ROWID
+KLINES_SCHEMA_VERSION = 1
+KLINE_COLUMNS = ["open", "close", "high", "low", "volume"]
 
 
 # update the kline archive by the given symbol and exchange
@@ -20,11 +32,23 @@ def get_local_assets() -> typing.List[typing.Tuple[str, str]]:
     all_assets = []
 
     for exchange in os.listdir(ARCHIVE_PATH):
-        for symbol in os.listdir(os.path.join(ARCHIVE_PATH, exchange)):
-            if symbol.startswith("_") or not symbol.endswith(".sqlite"):
+        exchange_path = os.path.join(ARCHIVE_PATH, exchange)
+        if exchange.startswith("_") or not os.path.isdir(exchange_path):
+            continue
+        for symbol in os.listdir(exchange_path):
+            if symbol.startswith("_"):
                 # ignore files that start with an underscore
                 continue
-            all_assets.append((exchange, symbol.replace(".sqlite", "")))
+            if symbol.endswith(".sqlite"):
+                asset = (exchange, symbol.replace(".sqlite", ""))
+            elif ARCHIVE_FORMAT != "sqlite" and columnar_store.symbol_exists(
+                symbol, exchange, ARCHIVE_FORMAT
+            ):
+                asset = (exchange, symbol)
+            else:
+                continue
+            if asset not in all_assets:
+                all_assets.append(asset)
 
     return all_assets
 
@@ -41,6 +65,9 @@ def update_klines_to_db(df, symbol, exchange) -> str:
     Returns:
         str: The path to the db
     """
+    if ARCHIVE_FORMAT != "sqlite":
+        return columnar_store.write_klines(df, symbol, exchange, ARCHIVE_FORMAT)
+
     # create the archive path if it doesn't exist
     if not os.path.exists(ARCHIVE_PATH):
         os.makedirs(ARCHIVE_PATH)
@@ -51,11 +78,19 @@ def update_klines_to_db(df, symbol, exchange) -> str:
     # create the symbol path if it doesn't exist
     symbol_path = f"{exchange_path}/{symbol}.sqlite"
 
+    df = standardize_df(df)
+    rows = zip(
+        to_epoch_ms(df.index).tolist(),
+        *[df[col].astype(float).tolist() for col in KLINE_COLUMNS],
+    )
+
     # Use context manager to ensure connection is always closed
-    with connect_to_db(symbol_path, create=True) as engine:
-        df = standardize_df(df)
-        df.to_sql(
-            "klines", con=engine, if_exists="append", index=True, index_label="date"
+    with connect_to_klines_db(symbol_path, create=True) as conn:
+        # rows that are already stored are replaced, so overlapping updates don't add duplicates
+        conn.executemany(
+            "INSERT OR REPLACE INTO klines (date, open, close, high, low, volume) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
         )
 
     return symbol_path
@@ -82,6 +117,108 @@ def connect_to_db(db_path: str, create: bool = False) -> sqlite3.Connection:
     return conn
 
 
+def connect_to_klines_db(db_path: str, create: bool = False) -> sqlite3.Connection:
+    """
+    Connect to a symbol's sqlite archive, creating or migrating the klines table to the current schema
+
+    Args:
+        db_path (str): The path to the .sqlite file
+        create (bool, optional): Create the file if it doesn't exist. Defaults to False.
+
+    Returns:
+        sqlite3.Connection: The connection to the database
+    """
+    conn = connect_to_db(db_path, create=create)
+    migrate_klines_table(conn)
+    return conn
+
+
+def migrate_klines_table(conn: sqlite3.Connection):
+    """
+    Bring the klines table up to KLINES_SCHEMA_VERSION in place
+
+    Args:
+        conn (sqlite3.Connection): The connection to the symbol's archive
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= KLINES_SCHEMA_VERSION:
+        return
+
+    # the whole migration is one transaction, so a failure leaves the old table as it was.
+    # IMMEDIATE takes the write lock first, another connection might be migrating it at the same time
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < KLINES_SCHEMA_VERSION:
+            _migrate_klines_v0(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _migrate_klines_v0(conn: sqlite3.Connection):
+    has_klines = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'klines'"
+    ).fetchone()
+
+    if has_klines:
+        conn.execute("ALTER TABLE klines RENAME TO klines_v0")
+
+    conn.execute("""
+        CREATE TABLE klines (
+            date INTEGER PRIMARY KEY,
+            open REAL,
+            close REAL,
+            high REAL,
+            low REAL,
+            volume REAL
+        ) WITHOUT ROWID
+        """)
+
+    if has_klines:
+        # text dates to epoch ms, the last copy of a duplicated date wins like standardize_df.
+        # dates that can't be parsed are dropped
+        conn.execute("""
+            INSERT OR REPLACE INTO klines (date, open, close, high, low, volume)
+            SELECT
+                CAST(ROUND((julianday(date) - 2440587.5) * 86400000) AS INTEGER),
+                open, close, high, low, volume
+            FROM klines_v0
+            WHERE julianday(date) IS NOT NULL
+            ORDER BY rowid
+            """)
+        conn.execute("DROP TABLE klines_v0")
+
+    conn.execute(f"PRAGMA user_version = {KLINES_SCHEMA_VERSION}")
+
+
+def to_epoch_ms(dates) -> np.ndarray:
+    """
+    Convert dates to milliseconds since the epoch. Naive dates are treated as UTC.
+
+    Args:
+        dates: a single date (str, datetime) or a DatetimeIndex
+
+    Returns:
+        np.ndarray | int: The epoch ms
+    """
+    if isinstance(dates, pd.DatetimeIndex):
+        if dates.tz is not None:
+            dates = dates.tz_convert(None)
+        return dates.as_unit("ns").asi8 // 1_000_000
+
+    ts = pd.Timestamp(dates)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(None)
+    return ts.as_unit("ns").value // 1_000_000
+
+
+def from_epoch_ms(epoch_ms) -> pd.DatetimeIndex:
+    """Convert milliseconds since the epoch to naive UTC dates"""
+    return pd.to_datetime(epoch_ms, unit="ms")
+
+
 def standardize_df(df):
     new_df = df.copy()
 
@@ -134,8 +271,12 @@ def get_kline(
             end_dt = end_date
 
     db_path = f"{ARCHIVE_PATH}/{exchange}/{symbol}.sqlite"
+    if ARCHIVE_FORMAT != "sqlite":
+        exists = columnar_store.symbol_exists(symbol, exchange, ARCHIVE_FORMAT)
+    else:
+        exists = os.path.exists(db_path)
     # if the db exists, if not try and downlaod it
-    if not os.path.exists(db_path):
+    if not exists:
         import fast_trade.archive.update_kline as update_kline
 
         update_kline.update_kline(
@@ -151,32 +292,34 @@ def get_kline(
         if isinstance(end_date, str):
             end_date = datetime.datetime.fromisoformat(end_date)
 
+    if ARCHIVE_FORMAT != "sqlite":
+        df = columnar_store.read_klines(
+            symbol, exchange, start_date, end_date, archive_format=ARCHIVE_FORMAT
+        )
+        return resample(df, freq)
+
     # Use context manager to ensure connection is always closed
-    with connect_to_db(db_path) as conn:
-        query = "SELECT * FROM klines"
+    with connect_to_klines_db(db_path) as conn:
+        query = "SELECT date, open, close, high, low, volume FROM klines"
 
-        # Build WHERE clause conditionally
+        # Build WHERE clause conditionally, the date is the primary key so it's a range scan
         conditions = []
+        params = []
         if start_date is not None:
-            conditions.append(f"date >= '{start_date.isoformat()}'")
+            conditions.append("date >= ?")
+            params.append(to_epoch_ms(start_date))
         if end_date is not None:
-            conditions.append(f"date <= '{end_date.isoformat()}'")
+            conditions.append("date <= ?")
+            params.append(to_epoch_ms(end_date))
 
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY date"
 
-        df = pd.read_sql_query(query, conn)
-        df.date = pd.to_datetime(df.date)
+        df = pd.read_sql_query(query, conn, params=params)
+        df.date = from_epoch_ms(df.date)
         df = df.set_index("date")
         # set the freq of the dataframe
-        df = df.resample(freq).agg(
-            {
-                "open": "first",
-                "high": "max",
-                "low": "min",
-                "close": "last",
-                "volume": "sum",
-            }
-        )
+        df = resample(df, freq)
 
     return df
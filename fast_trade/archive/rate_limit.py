@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+# Binance counts request weight per minute and reports what was used in the X-MBX-USED-WEIGHT-1M header.
+# Coinbase's public endpoints allow about 10 requests a second, with small bursts.
+BINANCE_WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", 6000))
+BINANCE_KLINES_WEIGHT = 2
+COINBASE_REQUESTS_PER_SECOND = float(os.getenv("COINBASE_REQUESTS_PER_SECOND", 10))
+
+RATE_LIMITS = {
+    "binance": {"rate": BINANCE_WEIGHT_LIMIT / 60, "capacity": BINANCE_WEIGHT_LIMIT},
+    "coinbase": {
+        "rate": COINBASE_REQUESTS_PER_SECOND,
+        "capacity": COINBASE_REQUESTS_PER_SECOND * 1.5,
+    },
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket. Each request takes its cost in tokens, and tokens refill at `rate` per second
+    up to `capacity`, so every thread downloading from the same exchange shares one budget.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Block until the tokens are available and take them
+
+        Args:
+            tokens (float): The cost of the request
+
+        Returns:
+            float: The seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                wait = max(
+                    self.paused_until - now, (tokens - self.tokens) / self.rate, 0.001
+                )
+            time.sleep(wait)
+            waited += wait
+
+    def limit_available(self, tokens: float):
+        """Lower the available tokens, ex. when the exchange reports more usage than this bucket knows about"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, tokens)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for a while, ex. after a 429"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def get_rate_limiter(exchange: str) -> TokenBucket:
+    """
+    Get the token bucket shared by every request to the exchange
+
+    Args:
+        exchange (str): The exchange
+
+    Returns:
+        TokenBucket: The exchange's limiter
+    """
+    with _limiters_lock:
+        if exchange not in _limiters:
+            if exchange not in RATE_LIMITS:
+                raise ValueError(f"Exchange {exchange} not supported")
+            _limiters[exchange] = TokenBucket(**RATE_LIMITS[exchange])
+
+        return _limiters[exchange]
+
+
+def record_response(exchange: str, response):
+    """
+    Sync the exchange's limiter with a response. Binance reports the weight used this minute,
+    and both exchanges ask to back off with a 429 (or 418 when Binance bans the ip).
+
+    Args:
+        exchange (str): The exchange
+        response (requests.Response): The response of the request
+    """
+    limiter = get_rate_limiter(exchange)
+
+    used_weight = response.headers.get("X-MBX-USED-WEIGHT-1M")
+    if exchange == "binance" and used_weight is not None:
+        limiter.limit_available(BINANCE_WEIGHT_LIMIT - int(used_weight))
+
+    if response.status_code in [418, 429]:
+        retry_after = response.headers.get("Retry-After")
+        limiter.pause(float(retry_after) if retry_after else 10)
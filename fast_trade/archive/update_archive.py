@@ -1,30 +1,166 @@
 import datetime
 import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from .db_helpers import connect_to_db
+from . import columnar_store
+from .db_helpers import (
+    ARCHIVE_FORMAT,
+    connect_to_klines_db,
+    from_epoch_ms,
+    get_local_assets,
+    update_klines_to_db,
+)
 from .update_kline import update_kline
 
 ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive"))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
 
 
-def update_single_archive(symbol: str, exchange: str):
-    # check the oldest date in the existing archive
+class UpdateArchiveError(Exception):
+    """Some symbols failed to update. stats has the stats of each exchange"""
+
+    def __init__(self, failed: int, stats: dict):
+        self.stats = stats
+        super().__init__(f"Failed to update {failed} symbols")
+
+
+def get_archive_max_date(symbol: str, exchange: str):
+    """Get the last date stored for the symbol, or None if nothing is stored"""
+    if ARCHIVE_FORMAT != "sqlite":
+        return columnar_store.get_max_date(
+            symbol.replace(".sqlite", ""), exchange, ARCHIVE_FORMAT
+        )
+
     if not symbol.endswith(".sqlite"):
         symbol = symbol + ".sqlite"
     path = os.path.join(ARCHIVE_PATH, exchange, symbol)
 
-    now = datetime.datetime.now(datetime.timezone.utc)
-    now = now.replace(second=0, microsecond=0)
-
     # Use context manager to ensure connection is always closed
-    with connect_to_db(path) as db:
-        start_date = db.execute("SELECT max(date) FROM klines").fetchone()[0]
+    with connect_to_klines_db(path) as db:
+        max_date = db.execute("SELECT max(date) FROM klines").fetchone()[0]
+
+    if max_date is None:
+        return None
+    return from_epoch_ms(max_date).to_pydatetime()
+
+
+class DBWriter(threading.Thread):
+    """
+    Writes the chunks of one symbol on its own thread, so the download doesn't wait on the db.
+    The queue is bounded, so a slow db slows the download down instead of piling up chunks in memory.
+    """
+
+    def __init__(self, write_func=None, max_pending: int = 4):
+        super().__init__(daemon=True)
+        self._kline_writer = None
+        if write_func is None and ARCHIVE_FORMAT != "sqlite":
+            # writes each month once instead of once per chunk
+            self._kline_writer = columnar_store.KlineWriter(ARCHIVE_FORMAT)
+            write_func = self._kline_writer.write
+        self.write_func = write_func or update_klines_to_db
+        self.rows_written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def store(self, df, symbol: str, exchange: str):
+        """Queue a chunk to be written, used as the store_func of update_kline"""
+        if self.error is not None:
+            raise self.error
+        self._queue.put((df, symbol, exchange))
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._close_kline_writer()
+                return
+            if self.error is not None:
+                # keep draining so store() never blocks on a dead writer
+                continue
+            df, symbol, exchange = item
+            try:
+                self.write_func(df, symbol, exchange)
+                self.rows_written += len(df.index)
+            except Exception as e:
+                self.error = e
+
+    def _close_kline_writer(self):
+        if self._kline_writer is None or self.error is not None:
+            return
+        try:
+            self._kline_writer.close()
+        except Exception as e:
+            self.error = e
+
+    def close(self):
+        """Wait for the queued chunks to be written"""
+        self._queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class ExchangeStats:
+    """Progress and throughput of the symbols updated from one exchange"""
 
-        if start_date is None:
-            start_date = now - datetime.timedelta(days=7)
+    def __init__(self, exchange: str, total: int):
+        self.exchange = exchange
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.rows = 0
+        self.start_time = time.time()
+
+    def record(self, rows: int = 0, failed: bool = False):
+        if failed:
+            self.failed += 1
         else:
-            start_date = datetime.datetime.fromisoformat(start_date)
+            self.completed += 1
+            self.rows += rows
+
+    def to_dict(self) -> dict:
+        elapsed = time.time() - self.start_time
+        done = self.completed + self.failed
+        return {
+            "exchange": self.exchange,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rows": self.rows,
+            "elapsed": round(elapsed, 2),
+            "symbols_per_min": round(done / elapsed * 60, 2) if elapsed else 0,
+            "rows_per_sec": round(self.rows / elapsed, 2) if elapsed else 0,
+        }
+
+    def __str__(self):
+        stats = self.to_dict()
+        return (
+            f"{stats['exchange']}: {stats['completed'] + stats['failed']}/{stats['total']} symbols"
+            f" ({stats['failed']} failed), {stats['rows']} rows,"
+            f" {stats['rows_per_sec']} rows/s, {stats['symbols_per_min']} symbols/min"
+        )
+
+
+def update_single_archive(symbol: str, exchange: str, store_func=None):
+    """
+    Bring a symbol up to date, starting from the last date in its archive
+
+    Args:
+        symbol (str): The symbol to update
+        exchange (str): The exchange of the symbol
+        store_func (callable, optional): Called with (df, symbol, exchange) to store each chunk.
+            Defaults to update_klines_to_db.
+    """
+    # check the oldest date in the existing archive
+    now = datetime.datetime.now(datetime.timezone.utc)
+    now = now.replace(second=0, microsecond=0)
+
+    start_date = get_archive_max_date(symbol, exchange)
+    if start_date is None:
+        start_date = now - datetime.timedelta(days=7)
 
     actual_symbol = symbol.replace(".sqlite", "")
     print(f"Updating {actual_symbol} from {exchange} from {start_date} to {now}")
@@ -34,25 +170,78 @@ def update_single_archive(symbol: str, exchange: str):
         exchange=exchange,
         start_date=start_date,
         end_date=now,
+        store_func=store_func,
     )
 
 
-def update_archive():
-    """Read the archive and update the klines"""
-    count = 0
+def update_symbol_with_writer(symbol: str, exchange: str) -> int:
+    """Update a symbol, writing its chunks on a DBWriter thread. Returns the number of rows written."""
+    writer = DBWriter()
+    writer.start()
+    try:
+        update_single_archive(symbol, exchange, store_func=writer.store)
+    finally:
+        writer.close()
+
+    return writer.rows_written
+
+
+def update_archive(max_workers: int = None, **kwargs) -> dict:
+    """
+    Read the archive and update the klines of every symbol, several symbols at a time
+
+    Args:
+        max_workers (int, optional): The number of symbols to update at once, defaults to UPDATE_WORKERS.
+            Requests to the same exchange share a rate limiter (see rate_limit.py), so more workers
+            don't go over the exchange's limits.
+
+    Returns:
+        dict: The stats of each exchange
+
+    Raises:
+        UpdateArchiveError: If any symbol failed to update, once the others are done
+    """
+    if max_workers is None:
+        max_workers = UPDATE_WORKERS
     start_time = time.time()
+    assets = get_local_assets()
 
-    for exchange in os.listdir(ARCHIVE_PATH):
-        for symbol in os.listdir(os.path.join(ARCHIVE_PATH, exchange)):
-            if symbol.startswith("_") or not symbol.endswith(".sqlite"):
-                # ignore files that start with an underscore
-                continue
+    stats = {}
+    for exchange, _ in assets:
+        if exchange not in stats:
+            total = len([asset for asset in assets if asset[0] == exchange])
+            stats[exchange] = ExchangeStats(exchange, total)
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {
+            executor.submit(update_symbol_with_writer, symbol, exchange): (
+                exchange,
+                symbol,
+            )
+            for exchange, symbol in assets
+        }
+        for future in as_completed(futures):
+            exchange, symbol = futures[future]
             try:
-                update_single_archive(symbol, exchange)
-                count += 1
+                stats[exchange].record(rows=future.result())
             except Exception as e:
                 print(f"Error updating {symbol} from {exchange}: {e}")
-                raise e
+                stats[exchange].record(failed=True)
+            print(stats[exchange])
 
     updated_time = round(time.time() - start_time, 2)
-    print(f"\n\nUpdated {count} symbols in {updated_time} seconds ✅")
+    print("\n")
+    for exchange_stats in stats.values():
+        print(exchange_stats)
+    count = sum(exchange_stats.completed for exchange_stats in stats.values())
+    failed = sum(exchange_stats.failed for exchange_stats in stats.values())
+    res = {
+        exchange: exchange_stats.to_dict() for exchange, exchange_stats in stats.items()
+    }
+    if failed:
+        print(f"Updated {count} symbols in {updated_time} seconds, {failed} failed ❌")
+        raise UpdateArchiveError(failed, res)
+
+    print(f"Updated {count} symbols in {updated_time} seconds ✅")
+
+    return res
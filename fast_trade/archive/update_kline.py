@@ -4,9 +4,10 @@ import typing
 
 import pandas as pd
 
+from . import columnar_store
 from .binance_api import get_binance_klines
 from .coinbase_api import get_product_candles
-from .db_helpers import update_klines_to_db
+from .db_helpers import ARCHIVE_FORMAT, update_klines_to_db
 
 supported_exchanges = ["binance", "coinbase"]
 
@@ -17,7 +18,23 @@ def update_kline(
     start_date: typing.Optional[typing.Union[str, datetime.datetime]] = None,
     end_date: typing.Optional[typing.Union[str, datetime.datetime]] = None,
     incremental_writes: bool = True,
+    store_func: typing.Optional[typing.Callable] = None,
 ):
+    """
+    Download the klines of a symbol and store them in the archive
+
+    Args:
+        symbol (str): The symbol to download
+        exchange (str): The exchange to download from
+        start_date (str | datetime.datetime, optional): Defaults to 30 days ago
+        end_date (str | datetime.datetime, optional): Defaults to now
+        incremental_writes (bool): Store chunks while downloading instead of only at the end
+        store_func (callable, optional): Called with (df, symbol, exchange) to store the chunks when
+            incremental_writes is True. Defaults to update_klines_to_db.
+
+    Returns:
+        str: The path to the db
+    """
     if exchange not in supported_exchanges:
         raise ValueError(f"Exchange {exchange} not supported")
 
@@ -64,23 +81,41 @@ def update_kline(
         # update the db
         print(msg)
 
+    kline_writer = None
+    if store_func is None and incremental_writes and ARCHIVE_FORMAT != "sqlite":
+        # writes each month once instead of once per downloaded window
+        kline_writer = columnar_store.KlineWriter(ARCHIVE_FORMAT)
+        store_func = kline_writer.write
+    write_func = store_func or update_klines_to_db
     # Use store_func only when incremental_writes is True
-    store_func = update_klines_to_db if incremental_writes else lambda x, y, z: None
-
-    if exchange == "binance":
-        klines, status_obj = get_binance_klines(
-            symbol,
-            curr_date,
-            end_date,
-            status_update,
-            store_func=store_func,
-        )
-    elif exchange == "coinbase":
-        klines, status_obj = get_product_candles(
-            symbol, curr_date, end_date, status_update, store_func=store_func
-        )
-    else:
-        raise ValueError(f"Exchange {exchange} not supported")
+    store_func = write_func if incremental_writes else lambda x, y, z: None
+
+    try:
+        if exchange == "binance":
+            klines, status_obj = get_binance_klines(
+                symbol,
+                curr_date,
+                end_date,
+                status_update,
+                store_func=store_func,
+                # the klines are only needed here when they weren't stored while downloading
+                return_df=not incremental_writes,
+            )
+        elif exchange == "coinbase":
+            klines, status_obj = get_product_candles(
+                symbol,
+                curr_date,
+                end_date,
+                status_update,
+                store_func=store_func,
+                return_df=not incremental_writes,
+            )
+        else:
+            raise ValueError(f"Exchange {exchange} not supported")
+    finally:
+        # keep what was downloaded, even if the download failed part way
+        if kline_writer is not None:
+            kline_writer.close()
 
     # Only write the full DataFrame if incremental writes are disabled
     # When incremental_writes=True, the store_func already wrote chunks during download
@@ -88,11 +123,14 @@ def update_kline(
         db_path = update_klines_to_db(klines, symbol, exchange)
     else:
         # When incremental writes are enabled, we need to determine the db_path
-        # since update_klines_to_db wasn't called at the end
+        # since the store_func doesn't return it
         ARCHIVE_PATH = os.getenv(
             "ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive")
         )
         exchange_path = f"{ARCHIVE_PATH}/{exchange}"
-        db_path = f"{exchange_path}/{symbol}.sqlite"
+        if ARCHIVE_FORMAT != "sqlite":
+            db_path = f"{exchange_path}/{symbol}"
+        else:
+            db_path = f"{exchange_path}/{symbol}.sqlite"
 
     return db_path
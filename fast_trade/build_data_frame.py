@@ -1,12 +1,22 @@
+import json
 import os
 import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Union
 
 import pandas as pd
 
+from .indicator_cache import data_fingerprint, get_indicator_cache, indicator_cache_key
 from .transformers_map import transformers_map
-from .utils import OHLC_AGGREGATION, infer_frequency
+from .utils import OHLC_AGGREGATION, infer_frequency, is_at_freq, resample
+
+# number of resampled dataframes kept for the datapoints with their own freq, 0 disables it
+RESAMPLE_CACHE_SIZE = int(os.getenv("RESAMPLE_CACHE_SIZE", 8))
+
+_resample_cache = OrderedDict()
+_resample_cache_lock = threading.Lock()
 
 
 class TransformerError(Exception):
@@ -59,7 +69,7 @@ def load_basic_df_from_csv(csv_path: str):
     return df
 
 
-def prepare_df(df: pd.DataFrame, backtest: dict):
+def prepare_df(df: pd.DataFrame, backtest: dict, indicator_dtype=None):
     """Prepares the provided dataframe for a backtest by applying the datapoints and splicing based on the given backtest.
         Useful when loading an existing dataframe (ex. from a cache).
 
@@ -67,20 +77,50 @@ def prepare_df(df: pd.DataFrame, backtest: dict):
     ----------
         df: DataFrame, should have all the open, high, low, close, volume data set as headers and indexed by date
         backtest: dict, provides instructions on how to build the dataframe
+        indicator_dtype: optional, see apply_datapoints_to_df
 
     Returns
     ------
         df: DataFrame, with all the datapoints as column headers and trimmed to the provided time frames
     """
 
-    datapoints = backtest.get("datapoints", [])
-
     freq = backtest.get("freq", "1Min")
 
     start_time = backtest.get("start")
     stop_time = backtest.get("stop")
     df = apply_charting_to_df(df, freq, start_time, stop_time)
-    df = apply_transformers_to_dataframe(df, datapoints)
+    df = apply_datapoints_to_df(df, backtest, indicator_dtype=indicator_dtype)
+
+    return df
+
+
+def apply_datapoints_to_df(
+    df: pd.DataFrame, backtest: dict, results: dict = None, indicator_dtype=None
+):
+    """Applies the datapoints and the trailing stop loss to an already charted dataframe.
+        Used by prepare_df and when several backtests share the same charted data.
+
+    Parameters
+    ----------
+        df: DataFrame, charted with apply_charting_to_df
+        backtest: dict, provides the datapoints and trailing_stop_loss
+        results: dict, optional, transformer results shared between backtests, see apply_transformers_to_dataframe
+        indicator_dtype: optional, ex. "float32", stores the float columns of the datapoints as this dtype.
+            The datapoints are still calculated as float64, only the stored result is smaller.
+
+    Returns
+    ------
+        df: DataFrame, with all the datapoints as column headers
+    """
+    datapoints = backtest.get("datapoints", [])
+    data_columns = set(df.columns)
+
+    df = apply_transformers_to_dataframe(df, datapoints, results=results)
+    if indicator_dtype is not None:
+        for column in df.columns:
+            if column not in data_columns and df[column].dtype.kind == "f":
+                df[column] = df[column].astype(indicator_dtype)
+
     trailing_stop_loss = backtest.get("trailing_stop_loss", 0)
     if trailing_stop_loss:
         df["trailing_stop_loss"] = df["close"].cummax() * (
@@ -149,7 +189,9 @@ def apply_charting_to_df(df: pd.DataFrame, freq: str, start_time: str, stop_time
                 stop_time = pd.to_datetime(stop_time)
                 stop_time = stop_time.strftime("%Y-%m-%d %H:%M:%S")
 
-    df = df.resample(freq).agg(OHLC_AGGREGATION).ffill()
+    df = resample(df, freq)
+    if df.isna().values.any():
+        df = df.ffill()
 
     if start_time and stop_time:
         df = df[start_time:stop_time]  # noqa
@@ -164,12 +206,20 @@ def apply_charting_to_df(df: pd.DataFrame, freq: str, start_time: str, stop_time
 def apply_transformers_to_dataframe(
     df: pd.DataFrame,
     transformers: list,
+    results: dict = None,
 ):
     """Applies indications from the backtest to the dataframe
     Parameters
     ----------
         df: dataframe loaded with data
         transformers: list of transformers as dictionary objects
+        results: dict, optional, transformer results keyed by datapoint_key. When given, a datapoint
+            that was already calculated on the same data (ex. by another backtest) is reused instead
+            of being calculated again, and new results are added to it.
+
+        Results are also looked up in the indicator cache (see fast_trade.indicator_cache), keyed by a
+        fingerprint of the ohlcv data and the datapoint_key, so running the same datapoints on the same data
+        again skips the calculation.
 
         transformer detail:
         {
@@ -185,44 +235,190 @@ def apply_transformers_to_dataframe(
     """
 
     base_freq = infer_frequency(df)
-    # set the freq of the dataframe
-    df = df.asfreq(base_freq)
-    # return df
-    for ind in transformers:
-        transformer = ind.get("transformer")
+    # set the freq of the dataframe, once. The results of the transformers are aligned to this index.
+    if is_at_freq(df.index, base_freq):
+        df = df.copy()
+        df.index = pd.DatetimeIndex(df.index, freq=base_freq, copy=True)
+    else:
+        df = df.asfreq(base_freq)
+
+    cache = get_indicator_cache()
+    fingerprint = None
+    if cache is not None or (
+        RESAMPLE_CACHE_SIZE and any(ind.get("freq") for ind in transformers)
+    ):
+        fingerprint = data_fingerprint(df)
+
+    # columns that still have to be forward filled
+    unfilled = []
+    for idx, ind in enumerate(transformers):
         field_name = ind.get("name")
-        freq = ind.get("freq", None)
 
-        # Create a temporary dataframe with the desired frequency
-        if freq:
-            tmp_df = df.resample(freq).agg(OHLC_AGGREGATION).ffill()
+        if depends_on_datapoints(df, ind):
+            # the datapoints it uses have to be filled first
+            df = ffill_columns(df, unfilled)
+            unfilled = []
+            trans_res = calculate_transformer(df, ind)
         else:
-            tmp_df = df
-
-        # make sure the transformer is in the transformers_map
-        if transformer not in transformers_map:
-            raise ValueError(f"Transformer '{transformer}' not a valid transformer.")
-        try:
-            if len(ind.get("args", [])):
-                args = ind.get("args")
-                trans_res = transformers_map[transformer](tmp_df, *args)
-            else:
-                trans_res = transformers_map[transformer](tmp_df)
-        except Exception as e:
-            raise TransformerError(f"Error applying transformer '{transformer}': {e}")
+            trans_res = get_transformer_result(df, ind, results, cache, fingerprint)
+
+        if idx == 0:
+            # the data is filled after the first datapoint, before the next ones use it
+            df = ffill_columns(df, df.columns)
 
         if isinstance(trans_res, pd.DataFrame):
             df = process_res_df(df, ind, trans_res)
-            # resample the dataframe to the base freq
+            unfilled.extend(
+                res_column_name(ind, key) for key in trans_res.keys().values
+            )
 
         elif isinstance(trans_res, pd.Series):
             df[field_name] = trans_res
+            unfilled.append(field_name)
+
+    return ffill_columns(df, unfilled)
 
-        df = df.asfreq(base_freq).ffill()
+
+def ffill_columns(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """Forward fills the given columns of the dataframe, skipping the ones without any missing values.
+    A transformer with its own freq only has a value once per period, the rows in between repeat it.
+    """
+    columns = [col for col in dict.fromkeys(columns) if df[col].hasnans]
+    if columns:
+        df[columns] = df[columns].ffill()
 
     return df
 
 
+def calculate_transformer(df: pd.DataFrame, ind: dict):
+    """Runs a single transformer against the dataframe
+    Parameters
+    ----------
+        df: dataframe loaded with data
+        ind: dict, the transformer detail, see apply_transformers_to_dataframe
+
+    Returns
+    -------
+        the result of the transformer, a Series or DataFrame
+    """
+    transformer = ind.get("transformer")
+    freq = ind.get("freq", None)
+
+    # Create a temporary dataframe with the desired frequency
+    if freq:
+        tmp_df = resample(df, freq)
+        if tmp_df.isna().values.any():
+            tmp_df = tmp_df.ffill()
+    else:
+        tmp_df = df
+
+    # make sure the transformer is in the transformers_map
+    if transformer not in transformers_map:
+        raise ValueError(f"Transformer '{transformer}' not a valid transformer.")
+    try:
+        if len(ind.get("args", [])):
+            args = ind.get("args")
+            trans_res = transformers_map[transformer](tmp_df, *args)
+        else:
+            trans_res = transformers_map[transformer](tmp_df)
+    except Exception as e:
+        raise TransformerError(f"Error applying transformer '{transformer}': {e}")
+
+    return trans_res
+
+
+def get_transformer_result(df: pd.DataFrame, ind: dict, results, cache, fingerprint):
+    """Returns the result of a transformer from the shared results or the indicator cache,
+    calculating it only if neither has it.
+    """
+    key = datapoint_key(ind)
+    if results is not None and key in results:
+        return results[key]
+
+    if cache is not None:
+        cache_key = indicator_cache_key(fingerprint, key)
+        trans_res = cache.get(cache_key)
+        if trans_res is None:
+            trans_res = calculate_transformer(resampled_df(df, ind, fingerprint), ind)
+            cache.set(cache_key, trans_res)
+    else:
+        trans_res = calculate_transformer(resampled_df(df, ind, fingerprint), ind)
+
+    if results is not None:
+        results[key] = trans_res
+
+    return trans_res
+
+
+def resampled_df(df: pd.DataFrame, ind: dict, fingerprint=None) -> pd.DataFrame:
+    """Returns the data resampled to the freq of the transformer, keeping the last RESAMPLE_CACHE_SIZE
+    resampled dataframes by the fingerprint of the data and the freq, so the datapoints with the same freq
+    (ex. the 1h sma and the 1h rsi) and the backtests on the same data only resample it once.
+
+    Parameters
+    ----------
+        df: dataframe loaded with data
+        ind: dict, the transformer detail
+        fingerprint: str, optional, data_fingerprint of the df. Without it nothing is cached.
+
+    Returns
+    -------
+        the resampled dataframe, or the df when the transformer doesn't have a freq
+    """
+    freq = ind.get("freq")
+    if not freq:
+        return df
+
+    if fingerprint is None or not RESAMPLE_CACHE_SIZE:
+        return resample(df, freq).ffill()
+
+    key = (fingerprint, freq)
+    with _resample_cache_lock:
+        if key in _resample_cache:
+            _resample_cache.move_to_end(key)
+            return _resample_cache[key]
+
+    tmp_df = resample(df, freq).ffill()
+
+    with _resample_cache_lock:
+        _resample_cache[key] = tmp_df
+        while len(_resample_cache) > RESAMPLE_CACHE_SIZE:
+            _resample_cache.popitem(last=False)
+
+    return tmp_df
+
+
+def datapoint_key(ind: dict) -> str:
+    """Builds a key that is the same for any datapoints that calculate the same thing,
+    regardless of the name they're given.
+
+    Parameters
+    ----------
+        ind: dict, the transformer detail
+
+    Returns
+    -------
+        str, key made from the transformer, args and freq
+    """
+    return json.dumps(
+        [ind.get("transformer"), ind.get("args", []), ind.get("freq")], default=str
+    )
+
+
+def depends_on_datapoints(df: pd.DataFrame, ind: dict) -> bool:
+    """Checks if a transformer uses another datapoint as an argument (ex. an sma of the rsi column),
+    in which case the result can't be shared with other backtests.
+    """
+    if ind.get("freq"):
+        # resampling only keeps the ohlcv columns
+        return False
+
+    return any(
+        isinstance(arg, str) and arg in df.columns and arg not in OHLC_AGGREGATION
+        for arg in ind.get("args", [])
+    )
+
+
 def process_res_df(df, ind, trans_res):
     """handle if a transformer returns multiple columns
     To manage this, we just add the name of column in a clean
@@ -239,17 +435,29 @@ def process_res_df(df, ind, trans_res):
     df, dataframe, updated dataframe with the new columns
     """
     for key in trans_res.keys().values:
-        i_name = ind.get("name")
-        clean_key = key.lower()
-        clean_key = clean_key.replace(".", "")
-        clean_key = clean_key.replace(" ", "_")
-        # include the name of the transformer in the key
-        df_key = f"{i_name}_{ind.get('transformer')}_{clean_key}"
-        df[df_key] = trans_res[key]
+        df[res_column_name(ind, key)] = trans_res[key]
 
     return df
 
 
+def res_column_name(ind: dict, key: str) -> str:
+    """The name of the column of one of the results of a transformer that returns multiple columns
+    Parameters
+    ----------
+    ind, indicator object
+    key, name of the column returned by the transformer
+
+    Returns
+    -------
+    str, ex. "{name}_bbands_bb_upper"
+    """
+    clean_key = key.lower()
+    clean_key = clean_key.replace(".", "")
+    clean_key = clean_key.replace(" ", "_")
+    # include the name of the transformer in the key
+    return f"{ind.get('name')}_{ind.get('transformer')}_{clean_key}"
+
+
 def detect_time_unit(str_or_int: Union[str, int]):
     """Determines a if a timestamp is really a timestamp and if it
     matches is in seconds or milliseconds
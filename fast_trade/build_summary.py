@@ -1,11 +1,112 @@
 import datetime
 import warnings
 from datetime import UTC
+from functools import cached_property
 
 import numpy as np
 import pandas as pd
 
 from .calculate_perc_missing import calculate_perc_missing
+from .run_analysis import ACTION_LABELS, action_codes
+
+
+def run_lengths(mask: np.ndarray):
+    """Run length encoding of a boolean array
+
+    Returns
+    -------
+        tuple, (start index, length, value) arrays of each run
+    """
+    if not len(mask):
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=bool)
+
+    starts = np.concatenate(([0], np.flatnonzero(mask[1:] != mask[:-1]) + 1))
+    lengths = np.diff(starts, append=len(mask))
+
+    return starts, lengths, mask[starts]
+
+
+def sample_std(values: np.ndarray) -> float:
+    """Standard deviation like pandas, ignoring nan with 1 degree of freedom"""
+    values = values[~np.isnan(values)]
+    if len(values) < 2:
+        return np.nan
+
+    return values.std(ddof=1)
+
+
+class SummaryContext:
+    """The arrays the summary metrics share, each calculated the first time a metric reads it
+
+    Parameters
+    ----------
+        df: dataframe, the backtest with the simulation applied
+        trade_log_df: dataframe, optional, from create_trade_log. Built when it's first used.
+
+    Explainer
+    ---------
+    Many metrics need the same intermediates: the returns, the running peak and drawdowns of the
+    account value, the runs of in_trade and which trades won or lost. They're calculated once here as
+    numpy arrays instead of every metric filtering and grouping the dataframe again.
+    """
+
+    def __init__(self, df: pd.DataFrame, trade_log_df: pd.DataFrame = None):
+        self.df = df
+        if trade_log_df is not None:
+            self.trade_log_df = trade_log_df
+
+    @cached_property
+    def trade_log_df(self) -> pd.DataFrame:
+        return create_trade_log(self.df)
+
+    @cached_property
+    def account_values(self) -> np.ndarray:
+        return self.df["adj_account_value"].to_numpy(dtype=float)
+
+    @cached_property
+    def returns(self) -> np.ndarray:
+        return self.df["adj_account_value_change_perc"].to_numpy(dtype=float)
+
+    @cached_property
+    def running_peak(self) -> np.ndarray:
+        # fmax skips nan like expanding().max()
+        return np.fmax.accumulate(self.account_values)
+
+    @cached_property
+    def drawdowns(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.account_values / self.running_peak - 1.0
+
+    @cached_property
+    def in_trade(self) -> np.ndarray:
+        return self.df["in_trade"].to_numpy(dtype=bool)
+
+    @cached_property
+    def in_trade_runs(self) -> np.ndarray:
+        """The length of each run of rows in a trade"""
+        _, lengths, values = run_lengths(self.in_trade)
+        return lengths[values]
+
+    @cached_property
+    def action_counts(self) -> dict:
+        codes = action_codes(self.df["action"])
+        counts = np.bincount(codes[codes >= 0], minlength=len(ACTION_LABELS))
+        return {
+            label: int(count) for label, count in zip(ACTION_LABELS, counts) if count
+        }
+
+    @cached_property
+    def trade_returns(self) -> np.ndarray:
+        return self.trade_log_df["adj_account_value_change_perc"].to_numpy(dtype=float)
+
+    @cached_property
+    def wins(self) -> np.ndarray:
+        return self.trade_returns > 0
+
+    @cached_property
+    def losses(self) -> np.ndarray:
+        return self.trade_returns < 0
 
 
 def calculate_market_adjusted_returns(df, return_perc, buy_and_hold_perc):
@@ -13,19 +114,22 @@ def calculate_market_adjusted_returns(df, return_perc, buy_and_hold_perc):
     return float(round(return_perc - buy_and_hold_perc, 3))
 
 
-def calculate_position_metrics(df):
+def calculate_position_metrics(df, ctx: SummaryContext = None):
     """Calculate metrics that show how individual positions performed"""
-    in_trade_groups = df[df.in_trade].groupby(
-        (df.in_trade != df.in_trade.shift()).cumsum()
-    )
+    ctx = ctx if ctx is not None else SummaryContext(df)
 
     try:
-        avg_pos_size = float(round(df[df.in_trade].aux.mean(), 3))
-        max_pos_size = float(round(df[df.in_trade].aux.max(), 3))
-        avg_pos_duration = float(round(in_trade_groups.size().mean(), 3))
-        commission_impact = float(
-            round(df.fee.sum() / df.iloc[-1].adj_account_value * 100, 3)
+        in_trade_aux = df["aux"].to_numpy(dtype=float)[ctx.in_trade]
+        in_trade_aux = in_trade_aux[~np.isnan(in_trade_aux)]
+        has_aux = len(in_trade_aux) > 0
+        avg_pos_size = float(round(in_trade_aux.mean(), 3)) if has_aux else np.nan
+        max_pos_size = float(round(in_trade_aux.max(), 3)) if has_aux else np.nan
+        avg_pos_duration = (
+            float(round(ctx.in_trade_runs.mean(), 3))
+            if len(ctx.in_trade_runs)
+            else np.nan
         )
+        commission_impact = float(round(df.fee.sum() / ctx.account_values[-1] * 100, 3))
     except (ZeroDivisionError, ValueError):
         avg_pos_size = 0.0
         max_pos_size = 0.0
@@ -42,10 +146,14 @@ def calculate_position_metrics(df):
     }
 
 
-def calculate_trade_quality(trade_log_df):
+def calculate_trade_quality(trade_log_df, ctx: SummaryContext = None):
     """Calculate metrics that show trade quality beyond win/loss"""
-    wins = trade_log_df[trade_log_df.adj_account_value_change_perc > 0]
-    losses = trade_log_df[trade_log_df.adj_account_value_change_perc < 0]
+    if ctx is None:
+        wins = trade_log_df[trade_log_df.adj_account_value_change_perc > 0]
+        losses = trade_log_df[trade_log_df.adj_account_value_change_perc < 0]
+    else:
+        wins = trade_log_df[ctx.wins]
+        losses = trade_log_df[ctx.losses]
 
     try:
         profit_factor = abs(
@@ -82,19 +190,15 @@ def calculate_trade_quality(trade_log_df):
     }
 
 
-def calculate_market_exposure(df):
+def calculate_market_exposure(df, ctx: SummaryContext = None):
     """Calculate metrics about market exposure"""
+    ctx = ctx if ctx is not None else SummaryContext(df)
+
     try:
-        in_trade_duration = (
-            df[df.in_trade]
-            .groupby((df.in_trade != df.in_trade.shift()).cumsum())
-            .size()
-        )
-        time_in_market = float(round((df.in_trade.sum() / len(df)) * 100, 3))
+        in_trade_duration = ctx.in_trade_runs
+        time_in_market = float(round((ctx.in_trade.sum() / len(df)) * 100, 3))
         avg_duration = (
-            float(round(in_trade_duration.mean(), 3))
-            if not in_trade_duration.empty
-            else 0
+            float(round(in_trade_duration.mean(), 3)) if len(in_trade_duration) else 0
         )
     except (ZeroDivisionError, ValueError):
         time_in_market = 0.0
@@ -106,7 +210,7 @@ def calculate_market_exposure(df):
     }
 
 
-def calculate_effective_trades(df, trade_log_df):
+def calculate_effective_trades(df, trade_log_df, ctx: SummaryContext = None):
     """Calculate trade metrics accounting for commission"""
     # Get the fee values for the trade log indices and convert to percentage terms
     trade_fees = df.loc[trade_log_df.index, "fee"]
@@ -119,7 +223,10 @@ def calculate_effective_trades(df, trade_log_df):
     unprofitable_trades = trade_log_df[
         trade_log_df.adj_account_value_change_perc <= trade_fees_perc
     ]
-    commission_impact = df.fee.sum() / df.iloc[-1].adj_account_value * 100
+    last_value = (
+        ctx.account_values[-1] if ctx is not None else df.iloc[-1].adj_account_value
+    )
+    commission_impact = df.fee.sum() / last_value * 100
 
     return {
         "num_profitable_after_commission": int(len(profitable_trades)),
@@ -128,29 +235,31 @@ def calculate_effective_trades(df, trade_log_df):
     }
 
 
-def calculate_drawdown_metrics(df):
+def calculate_drawdown_metrics(df, ctx: SummaryContext = None):
     """Calculate detailed drawdown metrics"""
+    ctx = ctx if ctx is not None else SummaryContext(df)
+
     try:
-        rolling_max = df.adj_account_value.expanding().max()
-        drawdowns = df.adj_account_value / rolling_max - 1.0
+        drawdowns = ctx.drawdowns
+        if not len(drawdowns):
+            raise ValueError("no account values")
 
-        max_drawdown = float(round(drawdowns.min() * 100, 3))
-        avg_drawdown = float(round(drawdowns.mean() * 100, 3))
+        max_drawdown = float(round(np.nanmin(drawdowns) * 100, 3))
+        avg_drawdown = float(round(np.nanmean(drawdowns) * 100, 3))
 
         # Calculate drawdown duration
-        is_drawdown = drawdowns < 0
-        drawdown_groups = (is_drawdown != is_drawdown.shift()).cumsum()[is_drawdown]
-        durations = drawdown_groups.value_counts()
+        _, lengths, is_drawdown = run_lengths(drawdowns < 0)
+        durations = lengths[is_drawdown]
 
-        max_duration = float(round(durations.max() if not durations.empty else 0, 3))
-        avg_duration = float(round(durations.mean() if not durations.empty else 0, 3))
+        max_duration = float(round(durations.max() if len(durations) else 0, 3))
+        avg_duration = float(round(durations.mean() if len(durations) else 0, 3))
 
         return {
             "max_drawdown_pct": 0.0 if pd.isna(max_drawdown) else max_drawdown,
             "avg_drawdown_pct": 0.0 if pd.isna(avg_drawdown) else avg_drawdown,
             "max_drawdown_duration": 0.0 if pd.isna(max_duration) else max_duration,
             "avg_drawdown_duration": 0.0 if pd.isna(avg_duration) else avg_duration,
-            "current_drawdown": float(round(drawdowns.iloc[-1] * 100, 3)),
+            "current_drawdown": float(round(drawdowns[-1] * 100, 3)),
         }
     except (ValueError, AttributeError):
         return {
@@ -162,14 +271,18 @@ def calculate_drawdown_metrics(df):
         }
 
 
-def calculate_expectancy(trade_log_df):
+def calculate_expectancy(trade_log_df, ctx: SummaryContext = None):
     """Calculate expectancy (expected value per trade)"""
     try:
         if trade_log_df.empty:
             return 0.0
 
-        wins = trade_log_df[trade_log_df.adj_account_value_change_perc > 0]
-        losses = trade_log_df[trade_log_df.adj_account_value_change_perc < 0]
+        if ctx is None:
+            wins = trade_log_df[trade_log_df.adj_account_value_change_perc > 0]
+            losses = trade_log_df[trade_log_df.adj_account_value_change_perc < 0]
+        else:
+            wins = trade_log_df[ctx.wins]
+            losses = trade_log_df[ctx.losses]
 
         if len(trade_log_df) == 0:
             return 0.0
@@ -217,37 +330,39 @@ def calculate_sqn(trade_log_df):
         return 0.0
 
 
-def calculate_risk_metrics(df):
+def calculate_risk_metrics(df, ctx: SummaryContext = None):
     """Calculate risk-adjusted return metrics"""
+    ctx = ctx if ctx is not None else SummaryContext(df)
+
     try:
-        returns = df.adj_account_value_change_perc
+        returns = ctx.returns
+        if not len(returns):
+            raise ValueError("no returns")
 
         # Sortino Ratio (like Sharpe but only for negative returns)
         negative_returns = returns[returns < 0]
         downside_std = float(
-            negative_returns.std() if not negative_returns.empty else 0
+            sample_std(negative_returns) if len(negative_returns) else 0
         )
-        avg_return = float(returns.mean())
+        avg_return = float(np.nanmean(returns))
         sortino_ratio = float(
             round(avg_return / downside_std if downside_std != 0 else 0, 3)
         )
 
         # Calmar Ratio (return / max drawdown)
-        rolling_max = df.adj_account_value.expanding().max()
-        drawdowns = df.adj_account_value / rolling_max - 1.0
-        max_drawdown = abs(float(drawdowns.min()))
+        max_drawdown = abs(float(np.nanmin(ctx.drawdowns)))
         calmar_ratio = float(
             round(avg_return / max_drawdown if max_drawdown != 0 else 0, 3)
         )
 
         # Value at Risk (95th percentile of losses)
-        var_95 = float(round(returns.quantile(0.05), 3))
+        var_95 = float(round(np.nanquantile(returns, 0.05), 3))
 
         return {
             "sortino_ratio": 0.0 if pd.isna(sortino_ratio) else sortino_ratio,
             "calmar_ratio": 0.0 if pd.isna(calmar_ratio) else calmar_ratio,
             "value_at_risk_95": 0.0 if pd.isna(var_95) else var_95,
-            "annualized_volatility": float(round(returns.std() * (252**0.5), 3)),
+            "annualized_volatility": float(round(sample_std(returns) * (252**0.5), 3)),
             "downside_deviation": float(round(downside_std, 3)),
         }
     except (ValueError, AttributeError):
@@ -260,45 +375,34 @@ def calculate_risk_metrics(df):
         }
 
 
-def calculate_trade_streaks(trade_log_df):
+def calculate_trade_streaks(trade_log_df, ctx: SummaryContext = None):
     """Calculate winning and losing streaks"""
     try:
-        trades = trade_log_df.adj_account_value_change_perc > 0
-        streaks = (trades != trades.shift()).cumsum()
-
-        win_streaks = streaks[trades]
-        loss_streaks = streaks[~trades]
-
-        win_streak_counts = win_streaks.value_counts()
-        loss_streak_counts = loss_streaks.value_counts()
-
-        # Calculate current streak by walking backwards from the end
-        current_streak = 0
-        if not trades.empty:
-            last_outcome = trades.iloc[-1]
-            current_streak = 1  # Start with the last trade
-            # Walk backwards until we find a different outcome
-            for i in range(len(trades) - 2, -1, -1):
-                if trades.iloc[i] == last_outcome:
-                    current_streak += 1
-                else:
-                    break
+        if ctx is None:
+            trades = (trade_log_df.adj_account_value_change_perc > 0).to_numpy()
+        else:
+            trades = ctx.wins
+
+        _, lengths, values = run_lengths(trades)
+        win_streak_counts = lengths[values]
+        loss_streak_counts = lengths[~values]
+
+        # the current streak is the last run
+        current_streak = int(lengths[-1]) if len(lengths) else 0
 
         return {
             "current_streak": current_streak,
             "max_win_streak": int(
-                win_streak_counts.max() if not win_streak_counts.empty else 0
+                win_streak_counts.max() if len(win_streak_counts) else 0
             ),
             "max_loss_streak": int(
-                loss_streak_counts.max() if not loss_streak_counts.empty else 0
+                loss_streak_counts.max() if len(loss_streak_counts) else 0
             ),
             "avg_win_streak": float(
-                round(win_streak_counts.mean() if not win_streak_counts.empty else 0, 3)
+                round(win_streak_counts.mean() if len(win_streak_counts) else 0, 3)
             ),
             "avg_loss_streak": float(
-                round(
-                    loss_streak_counts.mean() if not loss_streak_counts.empty else 0, 3
-                )
+                round(loss_streak_counts.mean() if len(loss_streak_counts) else 0, 3)
             ),
         }
     except (ValueError, AttributeError):
@@ -352,28 +456,28 @@ def calculate_time_analysis(df):
         }
 
 
-def build_summary(df, performance_start_time):
-    # Do the easy stuff first
-    equity_peak = round(df["account_value"].max(), 3)
-    equity_final = round(df.iloc[-1]["adj_account_value"], 3)
+def summarize_returns(ctx: SummaryContext):
+    """Returns of the strategy compared to holding the asset"""
+    df = ctx.df
+    return_perc = calculate_return_perc(df)
+    sharpe_ratio = calculate_shape_ratio(df, ctx)
+    buy_and_hold_perc = calculate_buy_and_hold_perc(df)
 
-    initial_value = df.iloc[0]["adj_account_value"]
-    min_value = df["adj_account_value"].min()
-    peak_value = df["adj_account_value"].max()
-    max_drawdown = (
-        round(((min_value - peak_value) / peak_value) * 100, 3)
-        if peak_value > 0
-        else 0.0
-    )
+    return {
+        "return_perc": float(return_perc if not pd.isna(return_perc) else 0),
+        "sharpe_ratio": float(sharpe_ratio if not pd.isna(sharpe_ratio) else 0),  # BETA
+        "buy_and_hold_perc": float(
+            buy_and_hold_perc if not pd.isna(buy_and_hold_perc) else 0
+        ),
+        "market_adjusted_return": calculate_market_adjusted_returns(
+            df, return_perc, buy_and_hold_perc
+        ),
+    }
 
-    performance_stop_time = datetime.datetime.now(UTC)
-    start_date = df.index[0]
-    end_date = df.index[-1]
-    # count the number enter, exit, and hold signals
-    total_enter = len(df[df.action == "e"]) + len(df[df.action == "ae"])
-    total_exit = len(df[df.action == "x"]) + len(df[df.action == "ax"])
-    total_hold = len(df[df.action == "h"])
-    trade_log_df = create_trade_log(df)
+
+def summarize_trade_log(ctx: SummaryContext):
+    """Length, count and returns of the trades"""
+    trade_log_df = ctx.trade_log_df
     total_trades = len(trade_log_df.index)
 
     (
@@ -390,45 +494,16 @@ def build_summary(df, performance_start_time):
         median_trade_perc,
     ) = summarize_trade_perc(trade_log_df)
 
-    total_fees = round(df.fee.sum(), 3)
-    win_trades = trade_log_df[trade_log_df.adj_account_value_change_perc > 0]
-    loss_trades = trade_log_df[trade_log_df.adj_account_value_change_perc < 0]
+    win_trades = trade_log_df[ctx.wins]
+    loss_trades = trade_log_df[ctx.losses]
 
-    (total_num_winning_trades, avg_win_perc, win_perc) = summarize_trades(
+    total_num_winning_trades, avg_win_perc, win_perc = summarize_trades(
         win_trades, total_trades
     )
 
-    (total_num_losing_trades, avg_loss_perc, loss_perc) = summarize_trades(
+    total_num_losing_trades, avg_loss_perc, loss_perc = summarize_trades(
         loss_trades, total_trades
     )
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore", category=RuntimeWarning)
-        return_perc = calculate_return_perc(df)
-        sharpe_ratio = calculate_shape_ratio(df)
-        buy_and_hold_perc = calculate_buy_and_hold_perc(df)
-
-        # Calculate all metrics
-        market_adjusted_return = calculate_market_adjusted_returns(
-            df, return_perc, buy_and_hold_perc
-        )
-        position_metrics = calculate_position_metrics(df)
-        trade_quality = calculate_trade_quality(trade_log_df)
-        market_exposure = calculate_market_exposure(df)
-        effective_trades = calculate_effective_trades(df, trade_log_df)
-
-        # New metrics
-        drawdown_metrics = calculate_drawdown_metrics(df)
-        risk_metrics = calculate_risk_metrics(df)
-        trade_streaks = calculate_trade_streaks(trade_log_df)
-        time_analysis = calculate_time_analysis(df)
-
-        # Trading system quality metrics
-        expectancy = calculate_expectancy(trade_log_df)
-        sqn = calculate_sqn(trade_log_df)
-
-        performance_stop_time = datetime.datetime.now(UTC)
-
-        [perc_missing, total_missing_dates] = calculate_perc_missing(df)
 
     # check if median_time_held is a timedelta object
     if isinstance(median_time_held, datetime.timedelta):
@@ -446,13 +521,7 @@ def build_summary(df, performance_start_time):
         max_trade_time_held = 0
         min_trade_time_held = 0
 
-    summary = {
-        # Original metrics
-        "return_perc": float(return_perc if not pd.isna(return_perc) else 0),
-        "sharpe_ratio": float(sharpe_ratio if not pd.isna(sharpe_ratio) else 0),  # BETA
-        "buy_and_hold_perc": float(
-            buy_and_hold_perc if not pd.isna(buy_and_hold_perc) else 0
-        ),
+    return {
         "median_trade_len": median_time_held if not pd.isna(median_time_held) else 0,
         "mean_trade_len": (
             mean_trade_time_held if not pd.isna(mean_trade_time_held) else 0
@@ -480,59 +549,263 @@ def build_summary(df, performance_start_time):
         "num_trades": int(total_trades if not pd.isna(total_trades) else 0),
         "win_perc": float(win_perc if not pd.isna(win_perc) else 0),
         "loss_perc": float(loss_perc if not pd.isna(loss_perc) else 0),
+    }
+
+
+def summarize_equity(ctx: SummaryContext):
+    """Peak, final value and drawdown of the account"""
+    df = ctx.df
+    equity_peak = round(df["account_value"].max(), 3)
+    equity_final = round(ctx.account_values[-1], 3)
+
+    min_value = np.nanmin(ctx.account_values)
+    peak_value = np.nanmax(ctx.account_values)
+    max_drawdown = (
+        round(((min_value - peak_value) / peak_value) * 100, 3)
+        if peak_value > 0
+        else 0.0
+    )
+    total_fees = round(df.fee.sum(), 3)
+
+    return {
         "equity_peak": float(equity_peak if not pd.isna(equity_peak) else 0),
         "equity_final": float(equity_final if not pd.isna(equity_final) else 0),
         "max_drawdown": float(max_drawdown if not pd.isna(max_drawdown) else 0),
         "total_fees": float(total_fees if not pd.isna(total_fees) else 0),
-        "first_tic": start_date.strftime("%Y-%m-%d %H:%M:%S"),
-        "last_tic": end_date.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def summarize_data(ctx: SummaryContext):
+    """Dates covered by the backtest and how much data is missing"""
+    df = ctx.df
+    [perc_missing, total_missing_dates] = calculate_perc_missing(df)
+
+    return {
+        "first_tic": df.index[0].strftime("%Y-%m-%d %H:%M:%S"),
+        "last_tic": df.index[-1].strftime("%Y-%m-%d %H:%M:%S"),
         "total_tics": len(df.index),
         "perc_missing": float(perc_missing if not pd.isna(perc_missing) else 0),
         "total_missing": int(
             total_missing_dates if not pd.isna(total_missing_dates) else 0
         ),
-        "test_duration": round(
-            (performance_stop_time - performance_start_time).total_seconds(), 3
-        ),
-        "num_of_enter_signals": total_enter,
-        "num_of_exit_signals": total_exit,
-        "num_of_hold_signals": total_hold,
-        # New metrics
-        "market_adjusted_return": market_adjusted_return,
-        "position_metrics": position_metrics,
-        "trade_quality": trade_quality,
-        "market_exposure": market_exposure,
-        "effective_trades": effective_trades,
-        "drawdown_metrics": drawdown_metrics,
-        "risk_metrics": risk_metrics,
-        "trade_streaks": trade_streaks,
-        "time_analysis": time_analysis,
-        # Trading system quality metrics
-        "expectancy": expectancy,
-        "sqn": sqn,
     }
 
-    return summary, trade_log_df
 
+def summarize_signals(ctx: SummaryContext):
+    """Count the number enter, exit, and hold signals"""
+    counts = ctx.action_counts
+    return {
+        "num_of_enter_signals": counts.get("e", 0) + counts.get("ae", 0),
+        "num_of_exit_signals": counts.get("x", 0) + counts.get("ax", 0),
+        "num_of_hold_signals": counts.get("h", 0),
+    }
 
-def create_trade_log(df):
-    """Construct per-trade rows with aggregated performance metrics"""
 
-    trade_log_df = df.reset_index()
-    trade_log_df = trade_log_df.groupby(
-        (trade_log_df["in_trade"] != trade_log_df["in_trade"].shift()).cumsum()
-    ).first()
+def summarize_system_quality(ctx: SummaryContext):
+    """Trading system quality metrics"""
+    return {
+        "expectancy": calculate_expectancy(ctx.trade_log_df, ctx),
+        "sqn": calculate_sqn(ctx.trade_log_df),
+    }
+
 
-    index_name = df.index.name if df.index.name else None
-    if index_name and index_name in trade_log_df.columns:
-        trade_log_df = trade_log_df.set_index(index_name)
-    elif "date" in trade_log_df.columns:
-        trade_log_df = trade_log_df.set_index("date")
+# each group calculates a few keys of the summary, see build_summary
+METRIC_GROUPS = {
+    "returns": summarize_returns,
+    "trades": summarize_trade_log,
+    "equity": summarize_equity,
+    "data": summarize_data,
+    "signals": summarize_signals,
+    "position_metrics": lambda ctx: {
+        "position_metrics": calculate_position_metrics(ctx.df, ctx)
+    },
+    "trade_quality": lambda ctx: {
+        "trade_quality": calculate_trade_quality(ctx.trade_log_df, ctx)
+    },
+    "market_exposure": lambda ctx: {
+        "market_exposure": calculate_market_exposure(ctx.df, ctx)
+    },
+    "effective_trades": lambda ctx: {
+        "effective_trades": calculate_effective_trades(ctx.df, ctx.trade_log_df, ctx)
+    },
+    "drawdown_metrics": lambda ctx: {
+        "drawdown_metrics": calculate_drawdown_metrics(ctx.df, ctx)
+    },
+    "risk_metrics": lambda ctx: {"risk_metrics": calculate_risk_metrics(ctx.df, ctx)},
+    "trade_streaks": lambda ctx: {
+        "trade_streaks": calculate_trade_streaks(ctx.trade_log_df, ctx)
+    },
+    "time_analysis": lambda ctx: {"time_analysis": calculate_time_analysis(ctx.df)},
+    "system_quality": summarize_system_quality,
+}
+
+METRIC_GROUP_KEYS = {
+    "returns": [
+        "return_perc",
+        "sharpe_ratio",
+        "buy_and_hold_perc",
+        "market_adjusted_return",
+    ],
+    "trades": [
+        "median_trade_len",
+        "mean_trade_len",
+        "max_trade_held",
+        "min_trade_len",
+        "total_num_winning_trades",
+        "total_num_losing_trades",
+        "avg_win_perc",
+        "avg_loss_perc",
+        "best_trade_perc",
+        "min_trade_perc",
+        "median_trade_perc",
+        "mean_trade_perc",
+        "num_trades",
+        "win_perc",
+        "loss_perc",
+    ],
+    "equity": ["equity_peak", "equity_final", "max_drawdown", "total_fees"],
+    "data": ["first_tic", "last_tic", "total_tics", "perc_missing", "total_missing"],
+    "signals": [
+        "num_of_enter_signals",
+        "num_of_exit_signals",
+        "num_of_hold_signals",
+    ],
+    "position_metrics": ["position_metrics"],
+    "trade_quality": ["trade_quality"],
+    "market_exposure": ["market_exposure"],
+    "effective_trades": ["effective_trades"],
+    "drawdown_metrics": ["drawdown_metrics"],
+    "risk_metrics": ["risk_metrics"],
+    "trade_streaks": ["trade_streaks"],
+    "time_analysis": ["time_analysis"],
+    "system_quality": ["expectancy", "sqn"],
+}
+
+# the order of the keys in the summary
+SUMMARY_KEYS = (
+    METRIC_GROUP_KEYS["returns"][:3]
+    + METRIC_GROUP_KEYS["trades"]
+    + METRIC_GROUP_KEYS["equity"]
+    + METRIC_GROUP_KEYS["data"]
+    + ["test_duration"]
+    + METRIC_GROUP_KEYS["signals"]
+    + ["market_adjusted_return"]
+    + [key for group in list(METRIC_GROUP_KEYS)[5:] for key in METRIC_GROUP_KEYS[group]]
+)
+
+METRIC_KEY_GROUPS = {
+    key: group for group, keys in METRIC_GROUP_KEYS.items() for key in keys
+}
+
+
+def resolve_metric_groups(metrics: list) -> list:
+    """Find the metric groups to calculate
+    Parameters
+    ----------
+        metrics: list of group names (see METRIC_GROUPS) or summary keys, ex. ["returns", "max_drawdown"].
+            Nested keys can be dotted, ex. "drawdown_metrics.max_drawdown_pct". None means every group.
+
+    Returns
+    -------
+        list of group names, in the order of METRIC_GROUPS
+    """
+    if metrics is None:
+        return list(METRIC_GROUPS)
+
+    groups = set()
+    for metric in metrics:
+        if metric in METRIC_GROUPS:
+            groups.add(metric)
+            continue
+
+        key = metric.split(".")[0]
+        if key not in METRIC_KEY_GROUPS:
+            raise ValueError(f"Unknown metric: {metric}")
+        groups.add(METRIC_KEY_GROUPS[key])
+
+    return [group for group in METRIC_GROUPS if group in groups]
+
+
+def infer_metrics_from_rules(rules: list) -> list:
+    """Find the summary keys a backtest's rules compare, ex. [["return_perc", ">", "buy_and_hold_perc"]]
+    needs return_perc and buy_and_hold_perc. Numbers are ignored.
+
+    Returns
+    -------
+        list of summary keys, can be passed to build_summary as metrics
+    """
+    metrics = []
+    for rule in rules or []:
+        for field in [rule[0], rule[2]]:
+            if not isinstance(field, str):
+                continue
+            if field.split(".")[0] in METRIC_KEY_GROUPS and field not in metrics:
+                metrics.append(field)
+
+    return metrics
+
+
+def build_summary(df, performance_start_time, metrics: list = None):
+    """Summarize the performance of a backtest
+    Parameters
+    ----------
+        df: dataframe, the backtest with the simulation applied
+        performance_start_time: datetime, when the backtest started
+        metrics: list, optional, only calculate these metric groups or keys, see resolve_metric_groups.
+            Defaults to every metric.
+
+    Returns
+    -------
+        tuple, (summary dict, trade log dataframe)
+
+    Explainer
+    ---------
+    The metrics are split in groups (METRIC_GROUPS) so screening many backtests, ex. with rules in a sweep,
+    only pays for the metrics it reads. The groups share a SummaryContext, so the returns, drawdowns,
+    in_trade runs and win/loss masks are only calculated once. The trade log is always built.
+    """
+    ctx = SummaryContext(df, create_trade_log(df))
+
+    values = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for group in resolve_metric_groups(metrics):
+            values.update(METRIC_GROUPS[group](ctx))
 
-    trade_log_df = trade_log_df.replace([np.inf, -np.inf], np.nan)
+    performance_stop_time = datetime.datetime.now(UTC)
+    values["test_duration"] = round(
+        (performance_stop_time - performance_start_time).total_seconds(), 3
+    )
 
-    if trade_log_df.empty:
-        return pd.DataFrame()
+    summary = {key: values[key] for key in SUMMARY_KEYS if key in values}
+
+    return summary, ctx.trade_log_df
+
+
+TRADE_LOG_COLUMNS = [
+    "entry_time",
+    "entry_adj_account_value",
+    "exit_adj_account_value",
+    "adj_account_value_change",
+    "adj_account_value_change_perc",
+    "trade_id",
+]
+
+
+def create_trade_log(df):
+    """Construct per-trade rows with aggregated performance metrics
+
+    Explainer
+    ---------
+    A trade starts on the first row of each run of in_trade and ends on the first row after it.
+    The run boundaries come from the rows where in_trade changes, so the entry/exit rows and values
+    are picked with fancy indexing instead of looping over the runs. A trade still open on the
+    last row isn't logged.
+    """
+    if df.empty or "in_trade" not in df.columns:
+        return empty_trade_log(df)
+
+    index_name = df.index.name if df.index.name else None
 
     value_series = None
     if "adj_account_value" in df.columns:
@@ -547,66 +820,71 @@ def create_trade_log(df):
         df["account_value"] = inferred_values
         value_series = inferred_values
 
-    records = []
-    exit_times = []
-    entry_time = None
-    entry_value = np.nan
-    trade_id = 0
-
-    for timestamp, row in trade_log_df.iterrows():
-        in_trade_flag = bool(row.get("in_trade"))
-        if in_trade_flag:
-            entry_time = timestamp
-            if value_series is not None:
-                entry_value = value_series.get(timestamp, np.nan)
-                if not pd.isna(entry_value):
-                    entry_value = float(entry_value)
-        elif entry_time is not None:
-            exit_time = timestamp
-            exit_value = np.nan
-            if value_series is not None:
-                exit_value = value_series.get(exit_time, np.nan)
-                if not pd.isna(exit_value):
-                    exit_value = float(exit_value)
-
-            change = 0.0
-            change_perc = 0.0
-            if not pd.isna(entry_value) and not pd.isna(exit_value):
-                change = exit_value - entry_value
-                change_perc = change / entry_value if entry_value != 0 else 0.0
-
-            record = row.to_dict()
-            record["entry_time"] = entry_time
-            record["entry_adj_account_value"] = (
-                float(entry_value) if not pd.isna(entry_value) else 0.0
-            )
-            record["exit_adj_account_value"] = (
-                float(exit_value) if not pd.isna(exit_value) else 0.0
-            )
-            record["adj_account_value_change"] = change
-            record["adj_account_value_change_perc"] = change_perc
-            record["trade_id"] = trade_id
+    in_trade = np.asarray(df["in_trade"]).astype(bool)
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(in_trade)) + 1))
 
-            records.append(record)
-            exit_times.append(exit_time)
-            trade_id += 1
-            entry_time = None
-            entry_value = np.nan
+    # every run in a trade that has a run after it is a closed trade
+    trade_runs = np.flatnonzero(in_trade[run_starts[:-1]])
+    if not len(trade_runs):
+        return empty_trade_log(df)
 
-    if not records:
-        return pd.DataFrame()
+    entry_idx = run_starts[trade_runs]
+    exit_idx = run_starts[trade_runs + 1]
 
-    trade_records_df = pd.DataFrame(records)
-    trade_records_df["exit_time"] = exit_times
-    trade_records_df = trade_records_df.replace([np.inf, -np.inf], np.nan)
-    trade_records_df = trade_records_df.set_index("exit_time")
+    trade_records_df = df.iloc[exit_idx].copy()
+    if trade_records_df.isna().any().any():
+        # match the groupby().first() of the runs, which takes the first non-null value of each column
+        run_ids = np.repeat(
+            np.arange(len(run_starts)), np.diff(run_starts, append=len(df.index))
+        )
+        run_firsts = df.reset_index(drop=True).groupby(run_ids).first()
+        trade_records_df = trade_records_df.fillna(
+            run_firsts.iloc[trade_runs + 1].set_axis(trade_records_df.index)
+        )
+
+    if value_series is not None:
+        values = value_series.to_numpy(dtype=float)
+        entry_values = values[entry_idx]
+        exit_values = values[exit_idx]
+    else:
+        entry_values = np.full(len(trade_runs), np.nan)
+        exit_values = np.full(len(trade_runs), np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        valid = ~np.isnan(entry_values) & ~np.isnan(exit_values)
+        change = np.where(valid, exit_values - entry_values, 0.0)
+        change_perc = np.where(valid & (entry_values != 0), change / entry_values, 0.0)
 
-    if index_name:
-        trade_records_df.index.name = index_name
+    trade_records_df["entry_time"] = df.index[entry_idx]
+    trade_records_df["entry_adj_account_value"] = np.where(
+        np.isnan(entry_values), 0.0, entry_values
+    )
+    trade_records_df["exit_adj_account_value"] = np.where(
+        np.isnan(exit_values), 0.0, exit_values
+    )
+    trade_records_df["adj_account_value_change"] = change
+    trade_records_df["adj_account_value_change_perc"] = change_perc
+    trade_records_df["trade_id"] = np.arange(len(trade_runs))
+
+    trade_records_df = trade_records_df.replace([np.inf, -np.inf], np.nan)
+    if isinstance(trade_records_df.index, pd.DatetimeIndex):
+        # the exit times aren't evenly spaced, even if the picked rows happen to be
+        trade_records_df.index = pd.DatetimeIndex(trade_records_df.index, freq=None)
+    trade_records_df.index.name = index_name if index_name else "exit_time"
 
     return trade_records_df
 
 
+def empty_trade_log(df):
+    """A trade log without trades, with the columns the summary reads"""
+    columns = list(df.columns) + [
+        column for column in TRADE_LOG_COLUMNS if column not in df.columns
+    ]
+    index = pd.DatetimeIndex([], name=df.index.name if df.index.name else "exit_time")
+
+    return pd.DataFrame(columns=columns, index=index)
+
+
 def summarize_time_held(trade_log_df):
     if trade_log_df.empty:
         zero_delta = datetime.timedelta(0)
@@ -709,13 +987,17 @@ def calculate_buy_and_hold_perc(df):
         return 0.0
 
 
-def calculate_shape_ratio(df):
+def calculate_shape_ratio(df, ctx: SummaryContext = None):
     """Calculate Sharpe ratio with protection against NaN values"""
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
         try:
-            mean_return = df["adj_account_value_change_perc"].mean()
-            std_return = df["adj_account_value_change_perc"].std()
+            if ctx is None:
+                mean_return = df["adj_account_value_change_perc"].mean()
+                std_return = df["adj_account_value_change_perc"].std()
+            else:
+                mean_return = np.nanmean(ctx.returns)
+                std_return = sample_std(ctx.returns)
             if pd.isna(mean_return) or pd.isna(std_return) or std_return == 0:
                 return 0.0
             sharpe_ratio = mean_return / std_return
@@ -9,11 +9,16 @@ from pprint import pprint
 import matplotlib.pyplot as plt
 
 from fast_trade.archive.cli import download_asset, get_assets
+from fast_trade.archive.columnar_store import migrate_archive
 from fast_trade.archive.update_archive import update_archive
 from fast_trade.validate_backtest import validate_backtest
 
 from .cli_helpers import _apply_mods, create_plot, open_strat_file, save
+from .live import LIVE_HISTORY, LIVE_WINDOW, run_live, run_paper
+from .load_test import run_load_test
 from .run_backtest import run_backtest
+from .run_sweep import run_sweep
+from .server import SERVER_MAX_QUEUE, SERVER_WORKERS, create_app
 
 parser = argparse.ArgumentParser(
     description="Fast Trade CLI",
@@ -98,6 +103,145 @@ get_assets_parser.add_argument(
 update_archive_parser = sub_parsers.add_parser(
     "update_archive", help="update the archive"
 )
+update_archive_parser.add_argument(
+    "--workers",
+    help="number of symbols to update at once. Defaults to UPDATE_WORKERS or 8",
+    dest="max_workers",
+    type=int,
+    default=None,
+)
+
+migrate_archive_parser = sub_parsers.add_parser(
+    "migrate_archive",
+    help="copy the .sqlite archive into monthly parquet or arrow files (requires pyarrow)",
+)
+migrate_archive_parser.add_argument(
+    "--format",
+    help="columnar format to migrate to. Set ARCHIVE_FORMAT to the same value to use it.",
+    dest="archive_format",
+    type=str,
+    default="parquet",
+    choices=["parquet", "arrow"],
+)
+migrate_archive_parser.add_argument(
+    "--exchange", help="only migrate this exchange", type=str, default=None
+)
+migrate_archive_parser.add_argument(
+    "--remove-sqlite",
+    help="delete the .sqlite files once they're migrated",
+    dest="remove_sqlite",
+    action="store_true",
+    default=False,
+)
+
+sweep_parser = sub_parsers.add_parser(
+    "sweep", help="run a parameter sweep of a strategy in parallel"
+)
+sweep_parser.add_argument(
+    "strategy",
+    help="path to strategy file",
+    type=str,
+)
+sweep_parser.add_argument(
+    "params",
+    help='path to a json file of the parameters to sweep, ex. {"datapoints.0.args.0": [5, 10, 20]}',
+    type=str,
+)
+sweep_parser.add_argument(
+    "--mode",
+    help="grid tests every combination, random tests --samples random combinations",
+    type=str,
+    default="grid",
+    choices=["grid", "random"],
+)
+sweep_parser.add_argument(
+    "--samples", help="number of combinations in random mode", type=int
+)
+sweep_parser.add_argument(
+    "--workers", help="number of processes. Defaults to the number of cpus", type=int
+)
+sweep_parser.add_argument(
+    "--seed", help="seed for the random mode", type=int, default=None
+)
+sweep_parser.add_argument("--mods", help="Modifiers for strategy/backtest", nargs="*")
+
+live_parser = sub_parsers.add_parser(
+    "live",
+    help="evaluate strategies on each new bar as the archive is updated, with simulated positions",
+)
+paper_parser = sub_parsers.add_parser(
+    "paper",
+    help="replay the archive after a date one bar at a time, with simulated positions",
+)
+for live_mode_parser in [live_parser, paper_parser]:
+    live_mode_parser.add_argument(
+        "strategies", help="paths to strategy files", type=str, nargs="+"
+    )
+    live_mode_parser.add_argument(
+        "--mods", help="Modifiers for the strategies", nargs="*"
+    )
+    live_mode_parser.add_argument(
+        "--history",
+        help=f"number of bars used to seed the datapoints. Defaults to LIVE_HISTORY or {LIVE_HISTORY}",
+        type=int,
+        default=LIVE_HISTORY,
+    )
+    live_mode_parser.add_argument(
+        "--window",
+        help=f"number of recent bars kept in memory. Defaults to LIVE_WINDOW or {LIVE_WINDOW}",
+        type=int,
+        default=LIVE_WINDOW,
+    )
+live_parser.add_argument(
+    "--interval", help="seconds between archive updates", type=float, default=60
+)
+live_parser.add_argument(
+    "--polls", help="stop after this many updates", type=int, default=None
+)
+paper_parser.add_argument(
+    "--start", help="date to start the strategies from", type=str, required=True
+)
+paper_parser.add_argument(
+    "--stop", help="last date to replay, defaults to the end of the archive", type=str
+)
+
+serve_parser = sub_parsers.add_parser(
+    "serve", help="run the http server that runs backtests as jobs"
+)
+serve_parser.add_argument("--host", help="host to bind", type=str, default="127.0.0.1")
+serve_parser.add_argument("--port", help="port to bind", type=int, default=8000)
+serve_parser.add_argument(
+    "--workers",
+    help=f"number of backtest processes. Defaults to SERVER_WORKERS or {SERVER_WORKERS}",
+    type=int,
+    default=SERVER_WORKERS,
+)
+serve_parser.add_argument(
+    "--max_queue",
+    help=f"number of queued backtests before new ones are rejected. Defaults to SERVER_MAX_QUEUE or {SERVER_MAX_QUEUE}",
+    type=int,
+    default=SERVER_MAX_QUEUE,
+)
+
+load_test_parser = sub_parsers.add_parser(
+    "load_test", help="send many backtests to a running server and report the latencies"
+)
+load_test_parser.add_argument("strategy", help="path to strategy file", type=str)
+load_test_parser.add_argument(
+    "--mods", help="Modifiers for strategy/backtest", nargs="*"
+)
+load_test_parser.add_argument(
+    "--url", help="url of the server", type=str, default="http://127.0.0.1:8000"
+)
+load_test_parser.add_argument(
+    "--requests", help="number of backtests to run", type=int, default=100
+)
+load_test_parser.add_argument(
+    "--concurrency", help="number of backtests sent at once", type=int, default=10
+)
+load_test_parser.add_argument(
+    "--timeout", help="seconds to wait for each backtest", type=float, default=60
+)
 
 
 def backtest_helper(*args, **kwargs):
@@ -134,6 +278,104 @@ def backtest_helper(*args, **kwargs):
     pprint(summary)
 
 
+def sweep_helper(*args, **kwargs):
+    strat_obj = open_strat_file(kwargs.get("strategy"))
+    strat_obj = _apply_mods(strat_obj, kwargs.get("mods"))
+    params = open_strat_file(kwargs.get("params"))
+
+    count = 0
+    for result in run_sweep(
+        strat_obj,
+        params,
+        mode=kwargs.get("mode"),
+        samples=kwargs.get("samples"),
+        max_workers=kwargs.get("workers"),
+        seed=kwargs.get("seed"),
+        metrics=["return_perc", "sharpe_ratio", "num_trades", "max_drawdown"],
+    ):
+        summary = result["summary"]
+        pprint(
+            {
+                "params": result["params"],
+                "return_perc": summary.get("return_perc"),
+                "sharpe_ratio": summary.get("sharpe_ratio"),
+                "num_trades": summary.get("num_trades"),
+                "max_drawdown": summary.get("max_drawdown"),
+            }
+        )
+        count += 1
+
+    print(f"{count} backtests passed the rules")
+
+
+def open_strategies(paths, mods):
+    strategies = []
+    for path in paths:
+        strat_obj = _apply_mods(open_strat_file(path), mods)
+        strat_obj.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+        strategies.append(strat_obj)
+
+    return strategies
+
+
+def print_feed_stats(feeds):
+    for feed in feeds:
+        pprint(feed.stats())
+        for strategy in feed.strategies:
+            pprint(strategy.stats())
+
+
+def live_helper(*args, **kwargs):
+    strategies = open_strategies(kwargs.get("strategies"), kwargs.get("mods"))
+
+    feeds = run_live(
+        strategies,
+        interval=kwargs.get("interval"),
+        history=kwargs.get("history"),
+        window=kwargs.get("window"),
+        max_polls=kwargs.get("polls"),
+        on_poll=print_feed_stats,
+    )
+    print_feed_stats(feeds)
+
+
+def paper_helper(*args, **kwargs):
+    strategies = open_strategies(kwargs.get("strategies"), kwargs.get("mods"))
+
+    feeds = run_paper(
+        strategies,
+        kwargs.get("start"),
+        kwargs.get("stop"),
+        history=kwargs.get("history"),
+        window=kwargs.get("window"),
+    )
+    print_feed_stats(feeds)
+
+
+def serve_helper(*args, **kwargs):
+    import uvicorn
+
+    app = create_app(
+        max_workers=kwargs.get("workers"), max_queue=kwargs.get("max_queue")
+    )
+    uvicorn.run(app, host=kwargs.get("host"), port=kwargs.get("port"))
+
+
+def load_test_helper(*args, **kwargs):
+    strat_obj = open_strat_file(kwargs.get("strategy"))
+    strat_obj = _apply_mods(strat_obj, kwargs.get("mods"))
+
+    pprint(
+        run_load_test(
+            kwargs.get("url"),
+            strat_obj,
+            num_requests=kwargs.get("requests"),
+            concurrency=kwargs.get("concurrency"),
+            timeout=kwargs.get("timeout"),
+        )
+    )
+
+
 def validate_helper(args):
     strat_obj = open_strat_file(args.get("strategy"))
     strat_obj = _apply_mods(strat_obj, args.get("mods"))
@@ -147,6 +389,12 @@ command_map = {
     "validate": validate_helper,
     "assets": get_assets,
     "update_archive": update_archive,
+    "migrate_archive": migrate_archive,
+    "sweep": sweep_helper,
+    "live": live_helper,
+    "paper": paper_helper,
+    "serve": serve_helper,
+    "load_test": load_test_helper,
     "-h": parser.print_help,
 }
 
@@ -0,0 +1,222 @@
+import operator as op
+
+import numpy as np
+import pandas as pd
+
+from .run_analysis import (
+    ANY_ENTER_ACTION,
+    ANY_EXIT_ACTION,
+    ENTER_ACTION,
+    EXIT_ACTION,
+    HOLD_ACTION,
+    TSL_ACTION,
+)
+from .utils import coerce_numeric_value
+
+LOGIC_OPERATORS = {
+    ">": np.greater,
+    "<": np.less,
+    "=": np.equal,
+    "!=": np.not_equal,
+    ">=": np.greater_equal,
+    "<=": np.less_equal,
+}
+LOGIC_KEYS = ["exit", "any_exit", "enter", "any_enter"]
+# the same comparisons for single values, which are a lot faster than the numpy ones
+ROW_OPERATORS = {
+    ">": op.gt,
+    "<": op.lt,
+    "=": op.eq,
+    "!=": op.ne,
+    ">=": op.ge,
+    "<=": op.le,
+}
+
+
+def resolve_logic_field(field, df: pd.DataFrame):
+    """Return a comparable value for a logic operand.
+    Numbers (or numeric strings) are returned as scalars, anything else is
+    treated as a column name and returned as a numpy array.
+
+    Parameters
+    ----------
+        field: str, int, float or bool, the operand from the logic
+        df: dataframe with the datapoints calculated
+
+    Returns
+    -------
+        scalar or np.ndarray
+    """
+    coerced = coerce_numeric_value(field)
+
+    if isinstance(coerced, (int, float, bool)):
+        return coerced
+
+    return df[coerced].to_numpy()
+
+
+def logic_columns(backtest: dict) -> list:
+    """The columns the enter and exit logic of the backtest compares
+    Parameters
+    ----------
+        backtest: dict, from prepare_new_backtest
+
+    Returns
+    -------
+        list of the column names, in the order they're first used
+    """
+    columns = []
+    for key in LOGIC_KEYS:
+        for logic in backtest.get(key) or []:
+            for field in [logic[0], logic[2]]:
+                field = coerce_numeric_value(field)
+                if isinstance(field, str) and field not in columns:
+                    columns.append(field)
+
+    return columns
+
+
+def rolling_all(mask: np.ndarray, window: int) -> np.ndarray:
+    """Checks if the mask was true for each of the last `window` rows
+    Parameters
+    ----------
+        mask: np.ndarray, boolean mask
+        window: int, number of rows (including the current one) that must be true
+
+    Returns
+    -------
+        np.ndarray, boolean mask. The first window - 1 rows are always False since
+        there isn't enough history to confirm them.
+
+    Explainer
+    ---------
+    Rather than re-evaluating the logic on a buffer of frames, the number of true
+    rows in the window is the difference of the running count, so the cost is the
+    same for any window size.
+    """
+    counts = np.cumsum(mask, dtype=np.int64)
+    window_counts = counts.copy()
+    window_counts[window:] -= counts[:-window]
+
+    return window_counts == window
+
+
+def compile_single_logic(logic: list, df: pd.DataFrame) -> np.ndarray:
+    """Evaluates a single logic against every row of the dataframe at once
+    Parameters
+    ----------
+        logic: list, [field, operator, field_or_value, (optional) lookback]
+        df: dataframe with the datapoints calculated
+
+    Returns
+    -------
+        np.ndarray, boolean mask with one value per row. When a lookback is given,
+        a row is only true if the logic was true for that many rows in a row.
+    """
+    operator = logic[1]
+    if operator not in LOGIC_OPERATORS:
+        raise ValueError(f"Unsupported operator: {operator}")
+
+    val0 = resolve_logic_field(logic[0], df)
+    val1 = resolve_logic_field(logic[2], df)
+
+    mask = np.asarray(LOGIC_OPERATORS[operator](val0, val1), dtype=bool)
+
+    # comparing two scalars returns a single value, spread it over the frame
+    mask = np.broadcast_to(mask, (len(df.index),))
+
+    lookback = int(logic[3]) if len(logic) > 3 and logic[3] else 0
+    if lookback > 1:
+        mask = rolling_all(mask, lookback)
+
+    return mask
+
+
+def compile_logic_row(logic: list):
+    """Compiles a single logic into a function that evaluates it against one row, ignoring the lookback
+    Parameters
+    ----------
+        logic: list, [field, operator, field_or_value, (optional) lookback]
+
+    Returns
+    -------
+        function, takes a dict of the values of the row and returns a bool, the same as
+        compile_single_logic gives for that row without a lookback
+    """
+    operator = logic[1]
+    if operator not in ROW_OPERATORS:
+        raise ValueError(f"Unsupported operator: {operator}")
+    compare = ROW_OPERATORS[operator]
+
+    val0 = coerce_numeric_value(logic[0])
+    val1 = coerce_numeric_value(logic[2])
+    is_column0 = not isinstance(val0, (int, float, bool))
+    is_column1 = not isinstance(val1, (int, float, bool))
+
+    def evaluate(row: dict) -> bool:
+        return compare(
+            row[val0] if is_column0 else val0, row[val1] if is_column1 else val1
+        )
+
+    return evaluate
+
+
+def compile_logics(logics: list, df: pd.DataFrame, require_any=False) -> np.ndarray:
+    """Combines all the logics into a single boolean mask
+    Parameters
+    ----------
+        logics: list of logics, ex. [["close", ">", "sma"], ["rsi", "<", 30]]
+        df: dataframe with the datapoints calculated
+        require_any: bool, if True any logic can be true, otherwise all must be
+
+    Returns
+    -------
+        np.ndarray, boolean mask with one value per row. An empty list of logics never matches.
+    """
+    if not logics:
+        return np.zeros(len(df.index), dtype=bool)
+
+    masks = [compile_single_logic(logic, df) for logic in logics]
+
+    if require_any:
+        return np.logical_or.reduce(masks)
+
+    return np.logical_and.reduce(masks)
+
+
+def generate_actions(df: pd.DataFrame, backtest: dict) -> np.ndarray:
+    """Vectorized version of run_backtest.determine_action for the whole dataframe
+    Parameters
+    ----------
+        df: dataframe with the datapoints calculated
+        backtest: dict, the backtest with the enter/exit logic
+
+    Returns
+    -------
+        np.ndarray, the int8 code of the action of each row, see run_analysis.ACTION_LABELS.
+        Actions are picked in the same order as determine_action: "tsl" > "x" > "ax" > "e" > "ae" > "h"
+    """
+    conditions = []
+    choices = []
+
+    if backtest.get("trailing_stop_loss"):
+        conditions.append(df["close"].to_numpy() <= df["trailing_stop_loss"].to_numpy())
+        choices.append(TSL_ACTION)
+
+    conditions.append(compile_logics(backtest.get("exit", []), df))
+    choices.append(EXIT_ACTION)
+
+    conditions.append(
+        compile_logics(backtest.get("any_exit", []), df, require_any=True)
+    )
+    choices.append(ANY_EXIT_ACTION)
+
+    conditions.append(compile_logics(backtest.get("enter", []), df))
+    choices.append(ENTER_ACTION)
+
+    conditions.append(
+        compile_logics(backtest.get("any_enter", []), df, require_any=True)
+    )
+    choices.append(ANY_ENTER_ACTION)
+
+    return np.select(conditions, choices, default=HOLD_ACTION).astype(np.int8)
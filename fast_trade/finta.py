@@ -1,18 +1,31 @@
+from contextvars import ContextVar
 from functools import wraps
 
 import numpy as np
 import pandas as pd
 from pandas import DataFrame, Series
 
+from . import finta_kernels
+
+# True while an indicator runs, so the indicators it calls don't validate the frame again
+_validated = ContextVar("finta_validated", default=False)
+
 
 def inputvalidator(input_="ohlc"):
     def dfcheck(func):
         @wraps(func)
         def wrap(*args, **kwargs):
+            if _validated.get():
+                return func(*args, **kwargs)
+
             args = list(args)
             i = 0 if isinstance(args[0], pd.DataFrame) else 1
 
-            args[i] = args[i].rename(columns={c: c.lower() for c in args[i].columns})
+            # renaming copies the frame, skip it when the columns are already lowercase
+            if any(c != c.lower() for c in args[i].columns):
+                args[i] = args[i].rename(
+                    columns={c: c.lower() for c in args[i].columns}
+                )
 
             inputs = {
                 "o": "open",
@@ -31,18 +44,30 @@ def inputvalidator(input_="ohlc"):
                         'Must have a dataframe column named "{0}"'.format(inputs[l])
                     )
 
-            return func(*args, **kwargs)
+            token = _validated.set(True)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _validated.reset(token)
 
+        wrap.validates_input = True
         return wrap
 
     return dfcheck
 
 
+def _sign(series: Series) -> Series:
+    """1 if positive, -1 if negative, otherwise 0 (including nan)"""
+    return (series > 0).astype(int) - (series < 0).astype(int)
+
+
 def apply(decorator):
     def decorate(cls):
         for attr in cls.__dict__:
-            if callable(getattr(cls, attr)):
-                setattr(cls, attr, decorator(getattr(cls, attr)))
+            method = getattr(cls, attr)
+            # methods with their own inputvalidator, ex. "ohlcv", are only validated once
+            if callable(method) and not getattr(method, "validates_input", False):
+                setattr(cls, attr, decorator(method))
 
         return cls
 
@@ -287,23 +312,20 @@ class TA:
         sma = pd.Series(
             ohlc[column].rolling(period).mean(), name="SMA"
         )  # first KAMA is SMA
-        kama = []
-        # Current KAMA = Prior KAMA + smoothing_constant * (Price - Prior KAMA)
-        for s, ma, price in zip(
-            sc.iteritems(), sma.shift().iteritems(), ohlc[column].iteritems()
-        ):
-            try:
-                kama.append(kama[-1] + s[1] * (price[1] - kama[-1]))
-            except (IndexError, TypeError):
-                if pd.notnull(ma[1]):
-                    kama.append(ma[1] + s[1] * (price[1] - ma[1]))
-                else:
-                    kama.append(None)
+        sc = sc.to_numpy(dtype=float)
+        price = ohlc[column].to_numpy(dtype=float)
+        prior_sma = sma.shift().to_numpy(dtype=float)
+
+        kama = np.full(len(price), np.nan)
+        seeds = np.flatnonzero(~np.isnan(prior_sma))
+        if len(seeds):
+            start = seeds[0]
+            # Current KAMA = Prior KAMA + smoothing_constant * (Price - Prior KAMA)
+            kama[start:] = finta_kernels.linear_recurrence(
+                1 - sc[start:], sc[start:] * price[start:], y0=prior_sma[start]
+            )
 
-        sma["KAMA"] = pd.Series(
-            kama, index=sma.index, name="{0} period KAMA.".format(period)
-        )  # apply the kama list to existing index
-        return sma["KAMA"]
+        return pd.Series(kama, index=sma.index, name="{0} period KAMA.".format(period))
 
     @classmethod
     def ZLEMA(
@@ -341,19 +363,9 @@ class TA:
         :period: Specifies the number of Periods used for WMA calculation
         """
 
-        d = (period * (period + 1)) / 2  # denominator
-        weights = np.arange(1, period + 1)
-
-        def linear(w):
-            def _compute(x):
-                return (w * x).sum() / d
-
-            return _compute
-
-        _close = ohlc[column].rolling(period, min_periods=period)
-        wma = _close.apply(linear(weights), raw=True)
+        wma = finta_kernels.wma(ohlc[column].to_numpy(dtype=float), period)
 
-        return pd.Series(wma, name="{0} period WMA.".format(period))
+        return pd.Series(wma, index=ohlc.index, name="{0} period WMA.".format(period))
 
     @classmethod
     def HMA(cls, ohlc: DataFrame, period: int = 16) -> Series:
@@ -373,8 +385,8 @@ class TA:
 
         wmaf = cls.WMA(ohlc, period=half_length)
         wmas = cls.WMA(ohlc, period=period)
-        ohlc["deltawma"] = 2 * wmaf - wmas
-        hma = cls.WMA(ohlc, column="deltawma", period=sqrt_length)
+        deltawma = pd.DataFrame({"deltawma": 2 * wmaf - wmas})
+        hma = cls.WMA(deltawma, column="deltawma", period=sqrt_length)
 
         return pd.Series(hma, name="{0} period HMA.".format(period))
 
@@ -392,20 +404,18 @@ class TA:
             ohlcv["volume"].rolling(window=period).sum()
         )  # floating shares in last N periods
 
-        x = (vol_sum - ohlcv["volume"]) / vol_sum
-        y = (ohlcv["volume"] * ohlcv["close"]) / vol_sum
-
-        evwma = [0]
+        x = ((vol_sum - ohlcv["volume"]) / vol_sum).fillna(0).to_numpy(dtype=float)
+        y = ((ohlcv["volume"] * ohlcv["close"]) / vol_sum).to_numpy(dtype=float)
 
         #  evwma = (evma[-1] * (vol_sum - volume)/vol_sum) + (volume * price / vol_sum)
-        for x, y in zip(x.fillna(0).items(), y.items()):
-            if x[1] == 0 or y[1] == 0:
-                evwma.append(0)
-            else:
-                evwma.append(evwma[-1] * x[1] + y[1])
+        # and it restarts at 0 when either part is 0
+        restart = (x == 0) | (y == 0)
+        evwma = finta_kernels.linear_recurrence(
+            np.where(restart, 0.0, x), np.where(restart, 0.0, y)
+        )
 
         return pd.Series(
-            evwma[1:],
+            evwma,
             index=ohlcv.index,
             name="{0} period EVWMA.".format(period),
         )
@@ -493,12 +503,12 @@ class TA:
         alp = np.exp(-4.6 * (D - 1))
         alp = np.clip(alp, 0.01, 1).values
 
-        filt = c.values
-        for i, x in enumerate(alp):
-            cl = c.values[i]
-            if i < window:
-                continue
-            filt[i] = cl * x + (1 - x) * filt[i - 1]
+        filt = c.to_numpy(dtype=float, copy=True)
+        if len(filt) > window:
+            # filt = close * alp + (1 - alp) * prior filt, after the first window
+            filt[window:] = finta_kernels.linear_recurrence(
+                1 - alp[window:], alp[window:] * filt[window:], y0=filt[window - 1]
+            )
 
         return pd.Series(
             filt, index=ohlc.index, name="{0} period FRAMA.".format(period)
@@ -734,17 +744,9 @@ class TA:
         v1 = pd.Series(0.1 * (cls.RSI(ohlc, rsi_period) - 50), name="v1")
 
         # v2 = WMA(wma_period) of v1
-        d = (wma_period * (wma_period + 1)) / 2  # denominator
-        weights = np.arange(1, wma_period + 1)
-
-        def linear(w):
-            def _compute(x):
-                return (w * x).sum() / d
-
-            return _compute
-
-        _wma = v1.rolling(wma_period, min_periods=wma_period)
-        v2 = _wma.apply(linear(weights), raw=True)
+        v2 = pd.Series(
+            finta_kernels.wma(v1.to_numpy(dtype=float), wma_period), index=v1.index
+        )
 
         ift = pd.Series(((v2**2 - 1) / (v2**2 + 1)), name="IFT_RSI")
 
@@ -830,40 +832,9 @@ class TA:
         SAR trails price as the trend extends over time. The indicator is below prices when prices are rising and above prices when prices are falling.
         In this regard, the indicator stops and reverses when the price trend reverses and breaks above or below the indicator.
         """
-        high, low = ohlc.high, ohlc.low
-
-        # Starting values
-        sig0, xpt0, af0 = True, high[0], af
-        _sar = [low[0] - (high - low).std()]
-
-        for i in range(1, len(ohlc)):
-            sig1, xpt1, af1 = sig0, xpt0, af0
-
-            lmin = min(low[i - 1], low[i])
-            lmax = max(high[i - 1], high[i])
-
-            if sig1:
-                sig0 = low[i] > _sar[-1]
-                xpt0 = max(lmax, xpt1)
-            else:
-                sig0 = high[i] >= _sar[-1]
-                xpt0 = min(lmin, xpt1)
-
-            if sig0 == sig1:
-                sari = _sar[-1] + (xpt1 - _sar[-1]) * af1
-                af0 = min(amax, af1 + af)
-
-                if sig0:
-                    af0 = af0 if xpt0 > xpt1 else af1
-                    sari = min(sari, lmin)
-                else:
-                    af0 = af0 if xpt0 < xpt1 else af1
-                    sari = max(sari, lmax)
-            else:
-                af0 = af
-                sari = xpt0
-
-            _sar.append(sari)
+        _sar = finta_kernels.sar(
+            ohlc.high.to_numpy(dtype=float), ohlc.low.to_numpy(dtype=float), af, amax
+        )
 
         return pd.Series(_sar, index=ohlc.index)
 
@@ -877,65 +848,18 @@ class TA:
         https://virtualizedfrog.wordpress.com/2014/12/09/parabolic-sar-implementation-in-python/
         """
 
-        length = len(ohlc)
-        high, low, close = ohlc.high, ohlc.low, ohlc.close
-        psar = close[0 : len(close)]
-        psarbull = [None] * length
-        psarbear = [None] * length
-        bull = True
-        af = iaf
-        hp = high[0]
-        lp = low[0]
-
-        for i in range(2, length):
-            if bull:
-                psar[i] = psar[i - 1] + af * (hp - psar[i - 1])
-            else:
-                psar[i] = psar[i - 1] + af * (lp - psar[i - 1])
-
-            reverse = False
-
-            if bull:
-                if low[i] < psar[i]:
-                    bull = False
-                    reverse = True
-                    psar[i] = hp
-                    lp = low[i]
-                    af = iaf
-            else:
-                if high[i] > psar[i]:
-                    bull = True
-                    reverse = True
-                    psar[i] = lp
-                    hp = high[i]
-                    af = iaf
-
-            if not reverse:
-                if bull:
-                    if high[i] > hp:
-                        hp = high[i]
-                        af = min(af + iaf, maxaf)
-                    if low[i - 1] < psar[i]:
-                        psar[i] = low[i - 1]
-                    if low[i - 2] < psar[i]:
-                        psar[i] = low[i - 2]
-                else:
-                    if low[i] < lp:
-                        lp = low[i]
-                        af = min(af + iaf, maxaf)
-                    if high[i - 1] > psar[i]:
-                        psar[i] = high[i - 1]
-                    if high[i - 2] > psar[i]:
-                        psar[i] = high[i - 2]
-
-            if bull:
-                psarbull[i] = psar[i]
-            else:
-                psarbear[i] = psar[i]
+        psar, bull, _ = finta_kernels.psar(
+            ohlc.high.to_numpy(dtype=float),
+            ohlc.low.to_numpy(dtype=float),
+            ohlc.close.to_numpy(dtype=float),
+            iaf,
+            maxaf,
+        )
 
+        # psarbull and psarbear have always both held the bullish values, kept for compatibility
         psar = pd.Series(psar, name="psar", index=ohlc.index)
-        psarbear = pd.Series(psarbull, name="psarbear", index=ohlc.index)
-        psarbull = pd.Series(psarbear, name="psarbull", index=ohlc.index)
+        psarbull = pd.Series(bull, name="psarbull", index=ohlc.index)
+        psarbear = pd.Series(bull, name="psarbear", index=ohlc.index)
 
         return pd.concat([psar, psarbull, psarbear], axis=1)
 
@@ -1075,36 +999,30 @@ class TA:
         :period: Specifies the number of Periods used for DMI calculation
         """
 
-        ohlc["up_move"] = ohlc["high"].diff()
-        ohlc["down_move"] = -ohlc["low"].diff()
+        up_move = ohlc["high"].diff()
+        down_move = -ohlc["low"].diff()
 
         # positive Dmi
-        def _dmp(row):
-            if row["up_move"] > row["down_move"] and row["up_move"] > 0:
-                return row["up_move"]
-            else:
-                return 0
-
+        plus = pd.Series(
+            np.where((up_move > down_move) & (up_move > 0), up_move, 0.0),
+            index=ohlc.index,
+        )
         # negative Dmi
-        def _dmn(row):
-            if row["down_move"] > row["up_move"] and row["down_move"] > 0:
-                return row["down_move"]
-            else:
-                return 0
-
-        ohlc["plus"] = ohlc.apply(_dmp, axis=1)
-        ohlc["minus"] = ohlc.apply(_dmn, axis=1)
+        minus = pd.Series(
+            np.where((down_move > up_move) & (down_move > 0), down_move, 0.0),
+            index=ohlc.index,
+        )
 
         diplus = pd.Series(
             100
-            * (ohlc["plus"] / cls.ATR(ohlc, period))
+            * (plus / cls.ATR(ohlc, period))
             .ewm(alpha=1 / period, adjust=adjust)
             .mean(),
             name="DI_PLUS",
         )
         diminus = pd.Series(
             100
-            * (ohlc["minus"] / cls.ATR(ohlc, period))
+            * (minus / cls.ATR(ohlc, period))
             .ewm(alpha=1 / period, adjust=adjust)
             .mean(),
             name="DI_MINUS",
@@ -1279,9 +1197,7 @@ class TA:
         This is because they are stuck with one time frame. The Ultimate Oscillator attempts to correct this fault by incorporating longer
         time frames into the basic formula."""
 
-        k = []  # current low or past close
-        for row, _row in zip(ohlc.itertuples(), ohlc.shift(1).itertuples()):
-            k.append(min(row.low, _row.close))
+        k = np.fmin(ohlc["low"], ohlc["close"].shift(1))  # current low or past close
         bp = pd.Series(ohlc[column] - k, name="bp")  # Buying pressure
 
         Average7 = bp.rolling(window=7).sum() / cls.TR(ohlc).rolling(window=7).sum()
@@ -1466,20 +1382,8 @@ class TA:
         _mf = pd.concat([tp, rmf], axis=1)
         _mf["delta"] = _mf["TP"].diff()
 
-        def pos(row):
-            if row["delta"] > 0:
-                return row["rmf"]
-            else:
-                return 0
-
-        def neg(row):
-            if row["delta"] < 0:
-                return row["rmf"]
-            else:
-                return 0
-
-        _mf["neg"] = _mf.apply(neg, axis=1)
-        _mf["pos"] = _mf.apply(pos, axis=1)
+        _mf["neg"] = np.where(_mf["delta"] < 0, _mf["rmf"], 0.0)
+        _mf["pos"] = np.where(_mf["delta"] > 0, _mf["rmf"], 0.0)
 
         mfratio = pd.Series(
             _mf["pos"].rolling(window=period).sum()
@@ -1505,20 +1409,20 @@ class TA:
         :return pd.Series: result is pandas.Series
         """
 
-        ohlcv["OBV"] = np.nan
+        obv = pd.Series(np.nan, index=ohlcv.index, name="OBV")
 
         neg_change = ohlcv[column] < ohlcv[column].shift(1)
         pos_change = ohlcv[column] >= ohlcv[column].shift(1)
         no_change = ohlcv[column] == ohlcv[column].shift(1)
 
         if pos_change.any():
-            ohlcv.loc[pos_change, "OBV"] = ohlcv["volume"]
+            obv.loc[pos_change] = ohlcv["volume"]
         if neg_change.any():
-            ohlcv.loc[neg_change, "OBV"] = -ohlcv["volume"]
+            obv.loc[neg_change] = -ohlcv["volume"]
         if no_change.any():
-            ohlcv.loc[no_change, "OBV"] = ohlcv["OBV"].shift(1)
+            obv.loc[no_change] = obv.shift(1)
 
-        return pd.Series(ohlcv["OBV"].cumsum(), name="OBV")
+        return pd.Series(obv.cumsum(), name="OBV")
 
     @classmethod
     @inputvalidator(input_="ohlcv")
@@ -1551,10 +1455,7 @@ class TA:
         Alternatively, readings below -40% indicate an oversold condition, which becomes extremely oversold below -60%.
         """
 
-        def sign(a):
-            return (a > 0) - (a < 0)
-
-        r = ohlc[column].diff().apply(sign) * ohlc["volume"]
+        r = _sign(ohlc[column].diff()) * ohlc["volume"]
         dvma = r.ewm(span=period, adjust=adjust).mean()
         vma = ohlc["volume"].ewm(span=period, adjust=adjust).mean()
 
@@ -1576,10 +1477,7 @@ class TA:
         :period: Specifies the number of Periods used for PZO calculation
         """
 
-        def sign(a):
-            return (a > 0) - (a < 0)
-
-        r = ohlc[column].diff().apply(sign) * ohlc[column]
+        r = _sign(ohlc[column].diff()) * ohlc[column]
         cp = pd.Series(r.ewm(span=period, adjust=adjust).mean())
         tc = cls.EMA(ohlc, period)
 
@@ -1674,7 +1572,7 @@ class TA:
         tp_rolling = tp.rolling(window=period, min_periods=0)
         # calculate MAD (Mean Deviation)
         # https://www.khanacademy.org/math/statistics-probability/summarizing-quantitative-data/other-measures-of-spread/a/mean-absolute-deviation-mad-review
-        mad = tp_rolling.apply(lambda s: abs(s - s.mean()).mean(), raw=True)
+        mad = finta_kernels.rolling_mad(tp.to_numpy(dtype=float), period)
         return pd.Series(
             (tp - tp_rolling.mean()) / (constant * mad),
             name="{0} period CCI".format(period),
@@ -1809,6 +1707,7 @@ class TA:
         """Indicator by Colin Twiggs which improves upon CMF.
         source: https://user42.tuxfamily.org/chart/manual/Twiggs-Money-Flow.html"""
 
+        ohlcv = ohlcv.copy()
         ohlcv["ll"] = [min(l, c) for l, c in zip(ohlcv["low"], ohlcv["close"].shift(1))]
         ohlcv["hh"] = [
             max(h, c) for h, c in zip(ohlcv["high"], ohlcv["close"].shift(1))
@@ -1989,13 +1888,9 @@ class TA:
         kc = cls.KC(ohlc, period=period, kc_mult=1.5)
         comb = pd.concat([bb, kc], axis=1)
 
-        def sqz_on(row):
-            if row["BB_LOWER"] > row["KC_LOWER"] and row["BB_UPPER"] < row["KC_UPPER"]:
-                return True
-            else:
-                return False
-
-        comb["SQZ"] = comb.apply(sqz_on, axis=1)
+        comb["SQZ"] = (comb["BB_LOWER"] > comb["KC_LOWER"]) & (
+            comb["BB_UPPER"] < comb["KC_UPPER"]
+        )
 
         return pd.Series(comb["SQZ"], name="{0} period SQZMI".format(period))
 
@@ -2033,15 +1928,14 @@ class TA:
 
         _mf = pd.concat([ohlc["close"], ohlc["volume"], mf], axis=1)
 
-        def vol_shift(row):
-            if row["mf"] > factor * row["close"] / 100:
-                return row["volume"]
-            elif row["mf"] < -factor * row["close"] / 100:
-                return -row["volume"]
-            else:
-                return 0
-
-        _mf["vol_shift"] = _mf.apply(vol_shift, axis=1)
+        _mf["vol_shift"] = np.select(
+            [
+                _mf["mf"] > factor * _mf["close"] / 100,
+                _mf["mf"] < -factor * _mf["close"] / 100,
+            ],
+            [_mf["volume"], -_mf["volume"]],
+            0.0,
+        )
         _sum = _mf["vol_shift"].rolling(window=period).sum()
 
         return pd.Series((_sum / smav) / period * 100)
@@ -2071,7 +1965,7 @@ class TA:
 
         typical = TA.TP(ohlc)
         # historical interday volatility and cutoff
-        inter = typical.apply(np.log).diff()
+        inter = np.log(typical).diff()
         # stdev of linear1
         vinter = inter.rolling(window=30).std()
         cutoff = pd.Series(factor * vinter * ohlc["close"], name="cutoff")
@@ -2085,30 +1979,24 @@ class TA:
         _mp = pd.concat([price_change, cutoff], axis=1)
         _mp.fillna(value=0, inplace=True)
 
-        def _vol_added(row):
-            """Determine the maximum volume to be added"""
-
-            if row["volume"] > vfactor * row["mav"]:
-                return vfactor * row["mav"]
-            else:
-                return row["volume"]
-
-        added_vol = _va.apply(_vol_added, axis=1)
-
-        def _multiplier(row):
-            """
-            Determine whether the volume is up volume (multiplier +1) or
-            down volume (multiplier -1). If price change is smaller than cutoff
-            do not count volume (multipler 0).
-            """
-            if row["pc"] > row["cutoff"]:
-                return 1
-            elif row["pc"] < 0 - row["cutoff"]:
-                return -1
-            else:
-                return 0
+        # the maximum volume to be added
+        added_vol = pd.Series(
+            np.where(
+                _va["volume"] > vfactor * _va["mav"],
+                vfactor * _va["mav"],
+                _va["volume"],
+            ),
+            index=_va.index,
+        )
 
-        multiplier = _mp.apply(_multiplier, axis=1)
+        # up volume (multiplier +1) or down volume (multiplier -1).
+        # If price change is smaller than cutoff do not count volume (multipler 0).
+        multiplier = pd.Series(
+            np.select(
+                [_mp["pc"] > _mp["cutoff"], _mp["pc"] < 0 - _mp["cutoff"]], [1, -1], 0
+            ),
+            index=_mp.index,
+        )
         raw_sum = (multiplier * added_vol).rolling(window=period).sum()
         raw_value = raw_sum / mav.shift()
 
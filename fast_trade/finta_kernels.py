@@ -0,0 +1,299 @@
+"""
+Array kernels for the finta indicators that are recursive or need a python function per window,
+so they can't be written as a single pandas expression. They work on float numpy arrays and return
+preallocated numpy arrays.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# values per block of linear_recurrence, small enough that the running products rarely underflow
+RECURRENCE_BLOCK = 64
+# below this the running product of a block is too small to divide by
+RECURRENCE_TINY = 1e-250
+# windows per block of rolling_mad, so the deviations of a block stay a few MB
+WINDOW_BLOCK = 1 << 14
+
+
+def _recurrence_loop(a: np.ndarray, b: np.ndarray, y0: float = 0.0) -> np.ndarray:
+    out = np.empty(len(a))
+    y = y0
+    for i, (a_i, b_i) in enumerate(zip(a.tolist(), b.tolist())):
+        y = b_i if a_i == 0 else a_i * y + b_i
+        out[i] = y
+
+    return out
+
+
+def linear_recurrence(a: np.ndarray, b: np.ndarray, y0: float = 0.0) -> np.ndarray:
+    """Solves y[i] = a[i] * y[i - 1] + b[i], where each a is between 0 and 1
+    Parameters
+    ----------
+        a: array, the weight of the previous value. 0 restarts the recurrence at b.
+        b: array, the value added at each step
+        y0: float, the value before the first step
+
+    Returns
+    -------
+        array of y, nan from the first nan in a or b on, like a loop would be
+
+    Explainer
+    ---------
+    The values are split into blocks. Inside a block, with P the running product of a since the last
+    restart, y = P * cumsum(b / P) plus the previous block's last value times P. Only the last value of
+    each block is carried in a loop, so the python work is one step per block instead of per value.
+    Blocks where P underflows are solved with the loop.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    size = len(a)
+    out = np.full(size, np.nan)
+
+    nans = np.flatnonzero(np.isnan(a) | np.isnan(b))
+    valid = nans[0] if len(nans) else size
+    if not valid:
+        return out
+
+    num_blocks = -(-valid // RECURRENCE_BLOCK)
+    padded = num_blocks * RECURRENCE_BLOCK
+    a_blocks = np.ones(padded)
+    b_blocks = np.zeros(padded)
+    a_blocks[:valid] = a[:valid]
+    b_blocks[:valid] = b[:valid]
+    a_blocks = a_blocks.reshape(num_blocks, RECURRENCE_BLOCK)
+    b_blocks = b_blocks.reshape(num_blocks, RECURRENCE_BLOCK)
+
+    restarts = a_blocks == 0
+    product = np.cumprod(np.where(restarts, 1.0, a_blocks), axis=1)
+    underflow = product[:, -1] < RECURRENCE_TINY
+    # safe from division by zero, the underflowing blocks are replaced below
+    product[underflow] = 1.0
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        sums = np.cumsum(b_blocks / product, axis=1)
+        # subtract what was summed before the last restart
+        positions = np.arange(RECURRENCE_BLOCK)
+        last_restart = np.maximum.accumulate(np.where(restarts, positions, -1), axis=1)
+        before_restart = np.take_along_axis(
+            np.concatenate([np.zeros((num_blocks, 1)), sums], axis=1),
+            last_restart,
+            axis=1,
+        )
+        before_restart[last_restart < 0] = 0.0
+        local = product * (sums - before_restart)
+
+    # how much of the previous block's last value is left, none after a restart
+    carry = np.where(last_restart < 0, product, 0.0)
+
+    for block in np.flatnonzero(underflow):
+        local[block] = _recurrence_loop(a_blocks[block], b_blocks[block])
+        carry[block] = np.where(
+            last_restart[block] < 0, np.cumprod(a_blocks[block]), 0.0
+        )
+
+    block_starts = np.empty(num_blocks)
+    y = y0
+    for block, (last_local, last_carry) in enumerate(
+        zip(local[:, -1].tolist(), carry[:, -1].tolist())
+    ):
+        block_starts[block] = y
+        y = last_local + last_carry * y
+
+    out[:valid] = (local + carry * block_starts[:, None]).ravel()[:valid]
+
+    return out
+
+
+def wma(values: np.ndarray, period: int) -> np.ndarray:
+    """Weighted moving average, the newest value weighs period and the oldest 1
+    Parameters
+    ----------
+        values: array
+        period: int, the number of values in a window
+
+    Returns
+    -------
+        array of the averages, nan until the first full window and for windows with a nan,
+        like rolling(period, min_periods=period)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+
+    # convolve flips the kernel, so the weights are given oldest last
+    weights = np.arange(period, 0, -1, dtype=np.float64)
+    first = period - 1
+    out[first:] = np.convolve(values, weights, mode="valid") / weights.sum()
+
+    return out
+
+
+def rolling_mad(values: np.ndarray, period: int) -> np.ndarray:
+    """Mean absolute deviation from the mean of each window
+    Parameters
+    ----------
+        values: array
+        period: int, the number of values in a window
+
+    Returns
+    -------
+        array of the deviations. The first period - 1 use the values so far, like rolling(period, min_periods=0).
+        Windows with a nan are nan.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    size = len(values)
+    out = np.empty(size)
+
+    for i in range(min(period - 1, size)):
+        window = values[: i + 1]
+        out[i] = np.abs(window - window.mean()).mean()
+
+    if size < period:
+        return out
+
+    windows = sliding_window_view(values, period)
+    for start in range(0, len(windows), WINDOW_BLOCK):
+        stop = start + WINDOW_BLOCK
+        block = windows[start:stop]
+        deviations = np.abs(block - block.mean(axis=1, keepdims=True))
+        first = period - 1 + start
+        last = first + len(block)
+        out[first:last] = deviations.mean(axis=1)
+
+    return out
+
+
+def sar(
+    high: np.ndarray, low: np.ndarray, af: float = 0.02, amax: float = 0.2
+) -> np.ndarray:
+    """Stop and reverse, see TA.SAR"""
+    size = len(high)
+    out = np.empty(size)
+    if not size:
+        return out
+
+    # like pandas, the std skips nan
+    ranges = high - low
+    ranges = ranges[~np.isnan(ranges)]
+    range_std = ranges.std(ddof=1) if len(ranges) > 1 else np.nan
+    high = high.tolist()
+    low = low.tolist()
+
+    sig0, xpt0, af0 = True, high[0], af
+    sar_i = low[0] - range_std
+    out[0] = sar_i
+
+    for i in range(1, size):
+        sig1, xpt1, af1 = sig0, xpt0, af0
+
+        lmin = min(low[i - 1], low[i])
+        lmax = max(high[i - 1], high[i])
+
+        if sig1:
+            sig0 = low[i] > sar_i
+            xpt0 = max(lmax, xpt1)
+        else:
+            sig0 = high[i] >= sar_i
+            xpt0 = min(lmin, xpt1)
+
+        if sig0 == sig1:
+            sari = sar_i + (xpt1 - sar_i) * af1
+            af0 = min(amax, af1 + af)
+
+            if sig0:
+                af0 = af0 if xpt0 > xpt1 else af1
+                sari = min(sari, lmin)
+            else:
+                af0 = af0 if xpt0 < xpt1 else af1
+                sari = max(sari, lmax)
+        else:
+            af0 = af
+            sari = xpt0
+
+        sar_i = sari
+        out[i] = sari
+
+    return out
+
+
+def psar(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    iaf: float = 0.02,
+    maxaf: float = 0.2,
+):
+    """Parabolic stop and reverse, see TA.PSAR
+
+    Returns
+    -------
+        tuple of arrays, (psar, psar while bullish, psar while bearish), nan when the trend is the other way
+    """
+    size = len(close)
+    out = np.array(close, dtype=np.float64)
+    bull_out = np.full(size, np.nan)
+    bear_out = np.full(size, np.nan)
+    if not size:
+        return out, bull_out, bear_out
+
+    high = high.tolist()
+    low = low.tolist()
+    psar_values = out.tolist()
+
+    bull = True
+    af = iaf
+    hp = high[0]
+    lp = low[0]
+
+    for i in range(2, size):
+        prev = psar_values[i - 1]
+        if bull:
+            psar_i = prev + af * (hp - prev)
+        else:
+            psar_i = prev + af * (lp - prev)
+
+        reverse = False
+
+        if bull:
+            if low[i] < psar_i:
+                bull = False
+                reverse = True
+                psar_i = hp
+                lp = low[i]
+                af = iaf
+        else:
+            if high[i] > psar_i:
+                bull = True
+                reverse = True
+                psar_i = lp
+                hp = high[i]
+                af = iaf
+
+        if not reverse:
+            if bull:
+                if high[i] > hp:
+                    hp = high[i]
+                    af = min(af + iaf, maxaf)
+                if low[i - 1] < psar_i:
+                    psar_i = low[i - 1]
+                if low[i - 2] < psar_i:
+                    psar_i = low[i - 2]
+            else:
+                if low[i] < lp:
+                    lp = low[i]
+                    af = min(af + iaf, maxaf)
+                if high[i - 1] > psar_i:
+                    psar_i = high[i - 1]
+                if high[i - 2] > psar_i:
+                    psar_i = high[i - 2]
+
+        psar_values[i] = psar_i
+        if bull:
+            bull_out[i] = psar_i
+        else:
+            bear_out[i] = psar_i
+
+    out[:] = psar_values
+
+    return out, bull_out, bear_out
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from .utils import OHLC_AGGREGATION
+
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", os.path.join(os.getcwd(), "ft_archive"))
+INDICATOR_CACHE_MAX_BYTES = int(
+    os.getenv("INDICATOR_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+)
+INDICATOR_CACHE_DISK = os.getenv("INDICATOR_CACHE_DISK", "").lower() in [
+    "1",
+    "true",
+    "yes",
+]
+
+
+class IndicatorCache:
+    """Keeps the results of the transformers so they don't have to be calculated again
+    when the same datapoint is run on the same data, ex. when only the logic of a backtest changed.
+
+    Results are kept in memory up to max_bytes, dropping the least recently used ones first.
+    When disk_path is set, results are also written there as pickles and read back on a memory miss.
+    """
+
+    def __init__(self, max_bytes: int = INDICATOR_CACHE_MAX_BYTES, disk_path=None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+
+    def get(self, key: str):
+        """Returns the cached result or None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+        self._store(key, value)
+
+        return value
+
+    def set(self, key: str, value):
+        """Adds a transformer result to the cache"""
+        self._store(key, value)
+        self._write_disk(key, value)
+
+    def clear(self):
+        """Drops everything kept in memory and resets the counters. Files on disk are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.disk_hits = 0
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counters and the memory used"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _store(self, key: str, value):
+        size = result_nbytes(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def _disk_file(self, key: str) -> str:
+        return os.path.join(self.disk_path, f"{key}.pkl")
+
+    def _read_disk(self, key: str):
+        if not self.disk_path or not os.path.exists(self._disk_file(key)):
+            return None
+        try:
+            return pd.read_pickle(self._disk_file(key))
+        except Exception:
+            # a partially written or corrupt file is just a miss
+            return None
+
+    def _write_disk(self, key: str, value):
+        if not self.disk_path:
+            return
+        tmp_file = f"{self._disk_file(key)}.{os.getpid()}.tmp"
+        pd.to_pickle(value, tmp_file)
+        os.replace(tmp_file, self._disk_file(key))
+
+
+def result_nbytes(value) -> int:
+    """Memory used by a transformer result"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True))
+    return 0
+
+
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """Hashes the ohlcv columns and the index of the dataframe, so the same data charted
+    at the same freq always has the same fingerprint.
+    """
+    columns = [col for col in OHLC_AGGREGATION if col in df.columns]
+    hashed = pd.util.hash_pandas_object(df[columns], index=True)
+
+    return hashlib.blake2b(hashed.to_numpy().tobytes(), digest_size=16).hexdigest()
+
+
+def indicator_cache_key(fingerprint: str, datapoint_key: str) -> str:
+    """Combines the data fingerprint and the datapoint key (transformer, args, freq)"""
+    return hashlib.blake2b(
+        f"{fingerprint}:{datapoint_key}".encode(), digest_size=16
+    ).hexdigest()
+
+
+_cache = IndicatorCache(
+    disk_path=(
+        os.path.join(ARCHIVE_PATH, "_indicator_cache") if INDICATOR_CACHE_DISK else None
+    )
+)
+
+
+def get_indicator_cache():
+    """Returns the cache used by apply_transformers_to_dataframe, or None if it's disabled"""
+    return _cache
+
+
+def set_indicator_cache(cache):
+    """Replaces the cache used by apply_transformers_to_dataframe.
+    Pass None to disable caching, or an IndicatorCache (or any object with get/set) to plug in another store.
+    """
+    global _cache
+    _cache = cache
@@ -0,0 +1,550 @@
+import datetime
+import os
+import time
+from collections import deque
+from datetime import UTC
+
+import numpy as np
+import pandas as pd
+
+from fast_trade.archive.db_helpers import get_kline
+from fast_trade.archive.update_archive import update_single_archive
+
+from .build_data_frame import (
+    apply_charting_to_df,
+    apply_datapoints_to_df,
+    calculate_transformer,
+    datapoint_key,
+    depends_on_datapoints,
+    res_column_name,
+)
+from .compile_logic import LOGIC_KEYS, compile_logic_row
+from .run_analysis import (
+    ACTION_DTYPE,
+    ENTER_ACTIONS,
+    EXIT_ACTIONS,
+    convert_aux_to_base,
+    enter_position,
+    exit_position,
+)
+from .run_backtest import (
+    MissingData,
+    apply_backtest_to_df,
+    check_backtest_errors,
+    prepare_new_backtest,
+)
+from .streaming import create_streaming_indicator
+from .utils import latency_stats
+
+# number of recent bars kept in memory, by the strategies and the datapoints that can't be streamed
+LIVE_WINDOW = int(os.getenv("LIVE_WINDOW", 500))
+# number of bars loaded to seed the datapoints. The ewm based ones need a long history to match a backtest.
+LIVE_HISTORY = int(os.getenv("LIVE_HISTORY", 5000))
+# number of per bar latencies kept for latency_stats
+LATENCY_SAMPLES = 10_000
+
+
+class WindowIndicator:
+    """Runs a transformer that can't be streamed on the last `window` rows, for each new row.
+
+    The value only matches the backtest when the transformer looks back less than `window` rows,
+    ex. a rolling median. A datapoint with its own freq uses the rows so far in the current period.
+    """
+
+    value = None
+
+    def __init__(self, ind: dict, window: int = LIVE_WINDOW):
+        self.ind = ind
+        self.rows = deque(maxlen=window)
+
+    def _calculate(self):
+        df = pd.DataFrame(list(self.rows)).set_index("date")
+        res = calculate_transformer(df, self.ind)
+
+        if isinstance(res, pd.DataFrame):
+            return res.iloc[-1].to_dict()
+        return float(res.iloc[-1])
+
+    def update(self, row: dict):
+        self.rows.append(row)
+        self.value = self._calculate()
+
+        return self.value
+
+    def seed(self, df: pd.DataFrame):
+        start = -self.rows.maxlen
+        tail = df.iloc[start:]
+        self.rows.extend(tail.rename_axis("date").reset_index().to_dict("records"))
+        if len(self.rows):
+            self.value = self._calculate()
+
+        return self.value
+
+
+def create_live_indicator(ind: dict, window: int = LIVE_WINDOW):
+    """The streaming indicator of the datapoint, or a WindowIndicator when it can't be streamed"""
+    try:
+        return create_streaming_indicator(ind)
+    except ValueError:
+        return WindowIndicator(ind, window)
+
+
+def datapoint_columns(ind: dict, value) -> dict:
+    """The columns a datapoint adds to the row, named like apply_transformers_to_dataframe names them"""
+    if isinstance(value, dict):
+        return {res_column_name(ind, key): column for key, column in value.items()}
+
+    return {ind.get("name"): value}
+
+
+class LiveStrategy:
+    """A backtest evaluated one bar at a time, see LiveFeed.
+
+    It's started with a regular backtest of the feed's history, which gives the datapoints,
+    the position and the account to carry forward. After that, each bar only updates the datapoints,
+    evaluates the enter/exit logic on that bar and applies the action to the position.
+    """
+
+    def __init__(self, backtest: dict, feed: "LiveFeed"):
+        self.backtest = prepare_new_backtest(backtest)
+        check_backtest_errors(self.backtest)
+        self.feed = feed
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        # the positions entered and exited since the start
+        self.trades = deque(maxlen=feed.window)
+
+        df = apply_datapoints_to_df(feed.history.copy(), self.backtest)
+        # the position stays open, there is no end
+        df = apply_backtest_to_df(df, {**self.backtest, "exit_on_end": False})
+
+        # datapoints that use the columns of other datapoints can't be shared with other strategies
+        self.datapoints = []
+        for ind in self.backtest.get("datapoints", []):
+            if depends_on_datapoints(df, ind):
+                indicator = create_live_indicator(ind, feed.window)
+                indicator.seed(df)
+                self.datapoints.append((ind, indicator, None))
+            else:
+                self.datapoints.append((ind, None, feed.add_datapoint(ind)))
+
+        start = -feed.window
+        self.rows = deque(df.iloc[start:].to_dict("records"), maxlen=feed.window)
+        self.dates = deque(df.index[start:], maxlen=feed.window)
+        last_row = self.rows[-1] if self.rows else {}
+
+        self.in_trade = bool(last_row.get("in_trade", False))
+        self.aux = float(last_row.get("aux", 0.0))
+        self.account_value = float(
+            last_row.get("account_value", self.backtest["base_balance"])
+        )
+        self.max_close = float(df["close"].max()) if len(df.index) else np.nan
+
+        # each compiled logic, with its last results for the lookback
+        self.logics = {
+            key: [
+                (
+                    compile_logic_row(logic),
+                    deque(
+                        maxlen=max(
+                            int(logic[3]) if len(logic) > 3 and logic[3] else 0, 1
+                        )
+                    ),
+                )
+                for logic in self.backtest.get(key, [])
+            ]
+            for key in LOGIC_KEYS
+        }
+        max_lookback = max(
+            [
+                results.maxlen
+                for logics in self.logics.values()
+                for _, results in logics
+            ],
+            default=1,
+        )
+        for row in list(self.rows)[-max_lookback:]:
+            self.evaluate_logics(row)
+
+    def evaluate_logics(self, row: dict) -> dict:
+        """Adds the row to the results of each logic
+        Returns
+        -------
+            dict, for each of LOGIC_KEYS if its logics match on this row
+        """
+        matches = {}
+        for key in LOGIC_KEYS:
+            results = []
+            for evaluate, window in self.logics[key]:
+                window.append(evaluate(row))
+                results.append(len(window) == window.maxlen and all(window))
+
+            if key in ["any_exit", "any_enter"]:
+                matches[key] = any(results)
+            else:
+                matches[key] = bool(results) and all(results)
+
+        return matches
+
+    def determine_action(self, row: dict, matches: dict) -> str:
+        """The same order as compile_logic.generate_actions"""
+        if self.backtest.get("trailing_stop_loss"):
+            if row["close"] <= row["trailing_stop_loss"]:
+                return "tsl"
+        if matches["exit"]:
+            return "x"
+        if matches["any_exit"]:
+            return "ax"
+        if matches["enter"]:
+            return "e"
+        if matches["any_enter"]:
+            return "ae"
+        return "h"
+
+    def update(self, date, bar: dict) -> dict:
+        """Evaluates the strategy on a new bar
+        Parameters
+        ----------
+            date: the date of the bar
+            bar: dict, the ohlcv of the bar
+
+        Returns
+        -------
+            dict, the row of the bar, like a row of the backtest's dataframe, with the datapoints,
+            the action and the account
+        """
+        start = time.perf_counter()
+        last_row = self.rows[-1] if self.rows else {}
+
+        row = dict(bar)
+        for ind, indicator, key in self.datapoints:
+            if indicator is None:
+                value = self.feed.value(key)
+            else:
+                value = indicator.update({"date": date, **row})
+
+            for column, column_value in datapoint_columns(ind, value).items():
+                # the backtest forward fills the datapoints
+                if column_value != column_value:
+                    column_value = last_row.get(column, column_value)
+                row[column] = column_value
+
+        trailing_stop_loss = self.backtest.get("trailing_stop_loss")
+        if trailing_stop_loss:
+            self.max_close = np.fmax(self.max_close, row["close"])
+            row["trailing_stop_loss"] = self.max_close * (1 - float(trailing_stop_loss))
+
+        action = self.determine_action(row, self.evaluate_logics(row))
+        close = float(row["close"])
+        fee = 0.0
+
+        if action in ENTER_ACTIONS and not self.in_trade:
+            [self.in_trade, self.aux, self.account_value, fee] = enter_position(
+                [self.account_value],
+                self.backtest.get("lot_size_perc"),
+                float(self.backtest.get("base_balance")),
+                self.backtest.get("max_lot_size"),
+                close,
+                float(self.backtest.get("commission")),
+                float(self.backtest.get("slippage", 0)),
+            )
+        elif action in EXIT_ACTIONS and self.in_trade:
+            [self.in_trade, self.aux, self.account_value, fee] = exit_position(
+                [self.account_value],
+                close,
+                self.aux,
+                float(self.backtest.get("commission")),
+                float(self.backtest.get("slippage", 0)),
+            )
+
+        if self.in_trade != bool(last_row.get("in_trade", False)):
+            self.trades.append(
+                {"date": date, "action": action, "close": close, "fee": fee}
+            )
+
+        row["action"] = action
+        row["aux"] = self.aux
+        row["account_value"] = self.account_value
+        row["adj_account_value"] = self.account_value + convert_aux_to_base(
+            self.aux, close
+        )
+        row["in_trade"] = self.in_trade
+        row["fee"] = fee
+
+        self.rows.append(row)
+        self.dates.append(date)
+        self.latencies.append(time.perf_counter() - start)
+
+        return row
+
+    def to_df(self) -> pd.DataFrame:
+        """The rows in memory as a dataframe"""
+        df = pd.DataFrame(list(self.rows), index=pd.DatetimeIndex(list(self.dates)))
+        df.index.name = "date"
+        if "action" in df.columns:
+            df["action"] = pd.Categorical(df["action"], dtype=ACTION_DTYPE)
+
+        return df
+
+    def stats(self) -> dict:
+        return {
+            "name": self.backtest.get("name"),
+            "in_trade": self.in_trade,
+            "adj_account_value": (
+                self.rows[-1]["adj_account_value"] if self.rows else None
+            ),
+            "latency": latency_stats(self.latencies),
+        }
+
+
+class LiveFeed:
+    """The bars of one symbol, exchange and freq, and the strategies that run on them.
+
+    The datapoints are shared, so a datapoint used by many strategies (same transformer, args and freq)
+    is updated once per bar. Strategies have to be added before the first bar.
+    """
+
+    def __init__(
+        self,
+        history: pd.DataFrame,
+        window: int = LIVE_WINDOW,
+        symbol: str = None,
+        exchange: str = None,
+        freq: str = "1Min",
+    ):
+        self.history = history
+        self.window = window
+        self.symbol = symbol
+        self.exchange = exchange
+        self.freq = freq
+        self.last_date = history.index[-1] if len(history.index) else None
+        self.strategies = []
+        self.indicators = {}
+        self.values = {}
+        self.bar = None
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def add_strategy(self, backtest: dict) -> LiveStrategy:
+        if self.bar is not None:
+            raise ValueError("Strategies have to be added before the first bar")
+
+        strategy = LiveStrategy(backtest, self)
+        self.strategies.append(strategy)
+
+        return strategy
+
+    def add_datapoint(self, ind: dict) -> str:
+        """Shares the indicator of the datapoint, creating and seeding it with the history the first time
+        Returns
+        -------
+            str, the key of the datapoint, see value
+        """
+        key = datapoint_key(ind)
+        if key not in self.indicators:
+            indicator = create_live_indicator(ind, self.window)
+            indicator.seed(self.history)
+            self.indicators[key] = indicator
+
+        return key
+
+    def value(self, key: str):
+        """The value of a shared datapoint on the current bar, updating it the first time it's asked for"""
+        if key not in self.values:
+            self.values[key] = self.indicators[key].update(self.bar)
+
+        return self.values[key]
+
+    def update(self, date, bar) -> list:
+        """Evaluates every strategy on a new bar
+        Parameters
+        ----------
+            date: the date of the bar
+            bar: dict or Series, the ohlcv of the bar
+
+        Returns
+        -------
+            list, the row of each strategy, see LiveStrategy.update
+        """
+        start = time.perf_counter()
+        bar = {
+            column: float(bar[column])
+            for column in ["open", "high", "low", "close", "volume"]
+        }
+        self.bar = {"date": date, **bar}
+        self.values = {}
+
+        rows = [strategy.update(date, bar) for strategy in self.strategies]
+
+        self.last_date = date
+        self.latencies.append(time.perf_counter() - start)
+
+        return rows
+
+    def iter_new_bars(self, end_date=None):
+        """Reads the bars after the last one from the archive and evaluates the strategies on each.
+        The newest bar can still be changing, so it's left for the next read.
+
+        Yields
+        ------
+            (date, rows) for each new bar, see update
+        """
+        df = get_kline(
+            self.symbol, self.exchange, self.last_date, end_date, freq=self.freq
+        )
+        # like apply_charting_to_df, the missing bars repeat the one before
+        df = df.ffill()
+
+        if self.last_date is not None:
+            df = df[df.index > self.last_date]
+
+        for date, bar in zip(df.index[:-1], df.iloc[:-1].to_dict("records")):
+            yield date, self.update(date, bar)
+
+    def stats(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "exchange": self.exchange,
+            "freq": self.freq,
+            "strategies": len(self.strategies),
+            "datapoints": len(self.indicators),
+            "last_date": str(self.last_date),
+            "latency": latency_stats(self.latencies),
+        }
+
+
+def create_feeds(
+    backtests: list, end_date, history: int = LIVE_HISTORY, window: int = LIVE_WINDOW
+) -> list:
+    """Loads the history of each symbol, exchange and freq of the backtests and starts their strategies
+    Parameters
+    ----------
+        backtests: list, the backtests to run
+        end_date: datetime, the bars are evaluated live after this date
+        history: int, number of bars before end_date used to seed the datapoints
+        window: int, number of recent bars kept in memory
+
+    Returns
+    -------
+        list of LiveFeed
+    """
+    groups = {}
+    for backtest in backtests:
+        new_backtest = prepare_new_backtest(backtest)
+        check_backtest_errors(new_backtest)
+        key = (
+            new_backtest.get("symbol"),
+            new_backtest.get("exchange"),
+            new_backtest.get("freq", "1Min"),
+        )
+        groups.setdefault(key, []).append(new_backtest)
+
+    feeds = []
+    for (symbol, exchange, freq), group in groups.items():
+        start_date = end_date - pd.Timedelta(freq) * history
+        df = get_kline(symbol, exchange, start_date, end_date, freq=freq)
+        if df.empty:
+            raise MissingData(f"No data found for {symbol} on {exchange}")
+
+        charted_df = apply_charting_to_df(df, freq, None, None)
+        # the newest bar can still be changing
+        feed = LiveFeed(charted_df.iloc[:-1], window, symbol, exchange, freq)
+        for backtest in group:
+            feed.add_strategy(backtest)
+        feeds.append(feed)
+
+    return feeds
+
+
+def print_trades(feed: LiveFeed, date, rows: list):
+    """Prints the strategies that entered or exited a position on the bar"""
+    for strategy, row in zip(feed.strategies, rows):
+        if strategy.trades and strategy.trades[-1]["date"] == date:
+            print(
+                f"{date} {feed.symbol} {strategy.backtest.get('name')}: {row['action']}"
+                f" close={row['close']} adj_account_value={row['adj_account_value']}"
+            )
+
+
+def run_paper(
+    backtests: list,
+    start,
+    stop=None,
+    history: int = LIVE_HISTORY,
+    window: int = LIVE_WINDOW,
+    on_bar=print_trades,
+) -> list:
+    """Replays the archive after start one bar at a time, like the bars were coming in live
+    Parameters
+    ----------
+        backtests: list, the backtests to run
+        start: datetime or str, the strategies start at this date, the bars before seed the datapoints
+        stop: datetime or str, optional, the last bar to replay. Defaults to the end of the archive.
+        history: int, number of bars before start used to seed the datapoints
+        window: int, number of recent bars kept in memory
+        on_bar: callable, called with (feed, date, rows) after each bar, see LiveFeed.update
+
+    Returns
+    -------
+        list of LiveFeed
+    """
+    feeds = create_feeds(
+        backtests, pd.Timestamp(start).to_pydatetime(), history, window
+    )
+    for feed in feeds:
+        for date, rows in feed.iter_new_bars(stop):
+            if on_bar:
+                on_bar(feed, date, rows)
+
+    return feeds
+
+
+def run_live(
+    backtests: list,
+    interval: float = 60,
+    history: int = LIVE_HISTORY,
+    window: int = LIVE_WINDOW,
+    max_polls: int = None,
+    update_archive: bool = True,
+    on_bar=print_trades,
+    on_poll=None,
+) -> list:
+    """Evaluates the strategies on each new bar as the archive is updated
+    Parameters
+    ----------
+        backtests: list, the backtests to run
+        interval: float, seconds between updates of the archive
+        history: int, number of bars used to seed the datapoints
+        window: int, number of recent bars kept in memory
+        max_polls: int, optional, stop after this many updates. Runs until interrupted by default.
+        update_archive: bool, download the new klines of each symbol before reading them
+        on_bar: callable, called with (feed, date, rows) after each bar, see LiveFeed.update
+        on_poll: callable, optional, called with the feeds after each update
+
+    Returns
+    -------
+        list of LiveFeed
+    """
+    if update_archive:
+        for symbol, exchange in {
+            (bt.get("symbol"), bt.get("exchange")) for bt in backtests
+        }:
+            update_single_archive(symbol, exchange)
+
+    now = datetime.datetime.now(UTC).replace(tzinfo=None)
+    feeds = create_feeds(backtests, now, history, window)
+
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        for feed in feeds:
+            if update_archive:
+                update_single_archive(feed.symbol, feed.exchange)
+            for date, rows in feed.iter_new_bars():
+                if on_bar:
+                    on_bar(feed, date, rows)
+        if on_poll:
+            on_poll(feeds)
+
+        polls += 1
+        if max_polls is None or polls < max_polls:
+            time.sleep(interval)
+
+    return feeds
@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .utils import latency_stats
+
+
+def run_single_request(url: str, backtest: dict, timeout: float) -> dict:
+    """Submits the backtest to the server and waits for the summary
+    Returns
+    -------
+        dict, the final status code of the job and the seconds between submitting and the summary
+    """
+    start = time.perf_counter()
+    res = requests.post(f"{url}/backtests", json=backtest, timeout=timeout)
+    if res.status_code != 202:
+        return {"status": res.status_code, "latency": time.perf_counter() - start}
+
+    job_id = res.json()["id"]
+    deadline = start + timeout
+    while True:
+        res = requests.get(
+            f"{url}/backtests/{job_id}",
+            params={"wait": max(min(deadline - time.perf_counter(), 10), 0)},
+            timeout=timeout,
+        )
+        job = res.json()
+        if job.get("status") in ["done", "failed", "cancelled"]:
+            break
+        if time.perf_counter() > deadline:
+            requests.delete(f"{url}/backtests/{job_id}", timeout=timeout)
+            job["status"] = "timeout"
+            break
+
+    return {"status": job.get("status"), "latency": time.perf_counter() - start}
+
+
+def run_load_test(
+    url: str,
+    backtest: dict,
+    num_requests: int = 100,
+    concurrency: int = 10,
+    timeout: float = 60,
+) -> dict:
+    """Sends the same backtest to a running server many times at once
+    Parameters
+    ----------
+        url: str, where the server is running, ex. http://127.0.0.1:8000
+        backtest: dict, the strategy to run
+        num_requests: int, the number of backtests to run
+        concurrency: int, the number of backtests submitted at the same time
+        timeout: float, seconds to wait for each backtest
+
+    Returns
+    -------
+        dict, the throughput, the statuses of the jobs, the latencies in milliseconds
+        and the stats of the server after the test
+    """
+    url = url.rstrip("/")
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda _: run_single_request(url, backtest, timeout),
+                range(num_requests),
+            )
+        )
+
+    duration = time.perf_counter() - start
+    statuses = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "duration": duration,
+        "requests_per_second": num_requests / duration if duration else 0,
+        "statuses": statuses,
+        "latency": latency_stats(
+            [result["latency"] for result in results if result["status"] == "done"],
+            "ms",
+        ),
+        "server": requests.get(f"{url}/stats", timeout=timeout).json(),
+    }
@@ -1,15 +1,42 @@
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
-
-def apply_logic_to_df(df: pd.DataFrame, backtest: dict):
+ENTER_ACTIONS = ["e", "ae"]
+EXIT_ACTIONS = ["x", "ax", "tsl"]
+
+ENTER_SIGNAL = 1
+EXIT_SIGNAL = -1
+HOLD_SIGNAL = 0
+
+# the actions are stored as int8 codes, ACTION_LABELS[code] is the label of the code
+ACTION_LABELS = ["h", "e", "ae", "x", "ax", "tsl"]
+(
+    HOLD_ACTION,
+    ENTER_ACTION,
+    ANY_ENTER_ACTION,
+    EXIT_ACTION,
+    ANY_EXIT_ACTION,
+    TSL_ACTION,
+) = range(len(ACTION_LABELS))
+# the "action" column of the dataframe, a categorical backed by the codes
+ACTION_DTYPE = pd.CategoricalDtype(ACTION_LABELS)
+ACTION_SIGNALS = np.array(
+    [HOLD_SIGNAL, ENTER_SIGNAL, ENTER_SIGNAL, EXIT_SIGNAL, EXIT_SIGNAL, EXIT_SIGNAL],
+    dtype=np.int8,
+)
+
+
+def apply_logic_to_df(df: pd.DataFrame, backtest: dict, vectorized: bool = True):
     """Analyzes the dataframe and runs sort of a market simulation, entering and exiting positions
 
     Parameters
     ----------
         df, dataframe from process_dataframe after the actions have been added
         backtest: dict, contains instructions on when to enter/exit trades
+        vectorized: bool, run the simulation over numpy arrays with simulate_positions.
+            The row by row simulation is kept for parity checks.
 
     Returns
     -------
@@ -33,6 +60,9 @@ def apply_logic_to_df(df: pd.DataFrame, backtest: dict):
 
 
     """
+    if vectorized:
+        return apply_simulation_to_df(df, backtest)
+
     in_trade = False
     account_value = float(backtest.get("base_balance"))  #
     commission = float(backtest.get("commission"))
@@ -54,7 +84,7 @@ def apply_logic_to_df(df: pd.DataFrame, backtest: dict):
         curr_action = row.action
         fee = 0.0
 
-        if curr_action in ["e", "ae"] and not in_trade:
+        if curr_action in ENTER_ACTIONS and not in_trade:
             # this means we should enter the trade
             [in_trade, aux, new_account_value, fee] = enter_position(
                 account_value_list,
@@ -66,7 +96,7 @@ def apply_logic_to_df(df: pd.DataFrame, backtest: dict):
                 slippage,
             )
 
-        if curr_action in ["x", "ax", "tsl"] and in_trade:
+        if curr_action in EXIT_ACTIONS and in_trade:
             # this means we should exit the trade
 
             [in_trade, aux, new_account_value, fee] = exit_position(
@@ -88,7 +118,7 @@ def apply_logic_to_df(df: pd.DataFrame, backtest: dict):
         )
         new_date = df.index[-1] + timedelta(seconds=1)
 
-        new_row = pd.DataFrame(data=[df.iloc[-1]], index=[new_date])
+        new_row = df.iloc[[-1]].set_axis([new_date])
 
         df = pd.concat([df, new_row])
         aux_list.append(aux)
@@ -109,6 +139,223 @@ def apply_logic_to_df(df: pd.DataFrame, backtest: dict):
     return df
 
 
+def apply_simulation_to_df(df: pd.DataFrame, backtest: dict):
+    """Array based version of apply_logic_to_df, see simulate_positions
+
+    Parameters
+    ----------
+        df, dataframe after the actions have been added
+        backtest: dict, contains instructions on when to enter/exit trades
+
+    Returns
+    -------
+        df, returns a dataframe with the new rows processed
+    """
+    close = df["close"].to_numpy(dtype=np.float64)
+    signals = actions_to_signals(df["action"])
+
+    sim = simulate_positions(close, signals, backtest)
+
+    if backtest.get("exit_on_end") and sim["in_trade"].size and sim["in_trade"][-1]:
+        [in_trade, aux, new_account_value, fee] = exit_position(
+            [float(sim["account_value"][-1])],
+            float(close[-1]),
+            float(sim["aux"][-1]),
+            float(backtest.get("commission")),
+            float(backtest.get("slippage", 0)),
+        )
+        new_date = df.index[-1] + timedelta(seconds=1)
+        new_row = df.iloc[[-1]].set_axis([new_date])
+        df = pd.concat([df, new_row])
+
+        sim["aux"] = np.append(sim["aux"], aux)
+        sim["account_value"] = np.append(sim["account_value"], new_account_value)
+        sim["adj_account_value"] = np.append(
+            sim["adj_account_value"],
+            new_account_value + convert_aux_to_base(aux, float(close[-1])),
+        )
+        sim["in_trade"] = np.append(sim["in_trade"], in_trade)
+        sim["fee"] = np.append(sim["fee"], fee)
+
+    df["aux"] = sim["aux"]
+    df["account_value"] = sim["account_value"]
+    df["adj_account_value"] = sim["adj_account_value"]
+    df["in_trade"] = sim["in_trade"]
+    df["fee"] = sim["fee"]
+
+    return df
+
+
+def action_codes(actions) -> np.ndarray:
+    """converts the actions to their int8 codes
+    Parameters
+    ----------
+        actions, the "action" column, an array of codes or an array of the labels ("e", "ae", "x", "ax", "tsl", "h")
+
+    Returns
+    -------
+        np.ndarray, int8 array of the codes, see ACTION_LABELS. Unknown labels are -1
+    """
+    if isinstance(actions, pd.Series):
+        actions = actions.array
+
+    if isinstance(actions, pd.Categorical):
+        if list(actions.categories) == ACTION_LABELS:
+            return np.asarray(actions.codes, dtype=np.int8)
+        actions = np.asarray(actions, dtype=object)
+
+    actions = np.asarray(actions)
+    if actions.dtype.kind in "iu":
+        return actions.astype(np.int8)
+
+    return np.asarray(pd.Categorical(actions, dtype=ACTION_DTYPE).codes, dtype=np.int8)
+
+
+def actions_to_labels(actions) -> np.ndarray:
+    """converts the actions to an array of their labels, ex. df["action"] when the strings are needed
+    Parameters
+    ----------
+        actions, the "action" column or an array of codes
+
+    Returns
+    -------
+        np.ndarray, object array of the labels ("e", "ae", "x", "ax", "tsl", "h")
+    """
+    return np.asarray(
+        pd.Categorical.from_codes(action_codes(actions), dtype=ACTION_DTYPE),
+        dtype=object,
+    )
+
+
+def actions_to_signals(actions) -> np.ndarray:
+    """converts the actions to int8 signals
+    Parameters
+    ----------
+        actions, the "action" column, an array of codes or an array of the labels
+
+    Returns
+    -------
+        np.ndarray, int8 array of ENTER_SIGNAL, EXIT_SIGNAL or HOLD_SIGNAL
+    """
+    codes = action_codes(actions)
+    # unknown actions hold
+    return np.where(codes >= 0, ACTION_SIGNALS[codes], HOLD_SIGNAL).astype(np.int8)
+
+
+def simulate_positions(close: np.ndarray, signals: np.ndarray, backtest: dict):
+    """Runs the market simulation over numpy arrays
+
+    Parameters
+    ----------
+        close, float64 array of the closing prices
+        signals, int8 array of the signals, see actions_to_signals
+        backtest: dict, contains instructions on when to enter/exit trades
+
+    Returns
+    -------
+        dict of arrays: aux, account_value, adj_account_value, in_trade and fee
+
+    Explainer
+    ---------
+    The account only changes when a trade is entered or exited, so instead of walking every row,
+    we jump from an enter signal to the next exit signal (and back) and fill the rows in between.
+    The transactions themselves use enter_position and exit_position so the rounding is the same
+    as the row by row simulation. The adjusted account value is then aux * close for every row at once.
+    """
+    account_value = float(backtest.get("base_balance"))
+    commission = float(backtest.get("commission"))
+    lot_size = backtest.get("lot_size_perc")
+    max_lot_size = backtest.get("max_lot_size")
+    slippage = float(backtest.get("slippage", 0))
+
+    num_rows = len(close)
+    aux_arr = np.zeros(num_rows, dtype=np.float64)
+    account_value_arr = np.empty(num_rows, dtype=np.float64)
+    in_trade_arr = np.zeros(num_rows, dtype=bool)
+    fee_arr = np.zeros(num_rows, dtype=np.float64)
+
+    enter_idx = np.flatnonzero(signals == ENTER_SIGNAL)
+    exit_idx = np.flatnonzero(signals == EXIT_SIGNAL)
+
+    curr_value = account_value
+    pos = 0
+    while pos < num_rows:
+        next_enter = np.searchsorted(enter_idx, pos)
+        if next_enter == len(enter_idx):
+            break
+        enter_at = enter_idx[next_enter]
+        account_value_arr[pos:enter_at] = curr_value
+
+        [_, aux, curr_value, fee] = enter_position(
+            [curr_value],
+            lot_size,
+            account_value,
+            max_lot_size,
+            float(close[enter_at]),
+            commission,
+            slippage,
+        )
+        fee_arr[enter_at] = fee
+
+        next_exit = np.searchsorted(exit_idx, enter_at + 1)
+        exit_at = exit_idx[next_exit] if next_exit < len(exit_idx) else num_rows
+
+        aux_arr[enter_at:exit_at] = aux
+        account_value_arr[enter_at:exit_at] = curr_value
+        in_trade_arr[enter_at:exit_at] = True
+
+        if exit_at < num_rows:
+            [_, _, curr_value, fee] = exit_position(
+                [curr_value], float(close[exit_at]), aux, commission, slippage
+            )
+            account_value_arr[exit_at] = curr_value
+            fee_arr[exit_at] = fee
+
+        pos = exit_at + 1
+
+    if pos < num_rows:
+        account_value_arr[pos:] = curr_value
+
+    position_value = np.where(aux_arr != 0, round_array(aux_arr * close), 0.0)
+
+    return {
+        "aux": aux_arr,
+        "account_value": account_value_arr,
+        "adj_account_value": account_value_arr + position_value,
+        "in_trade": in_trade_arr,
+        "fee": fee_arr,
+    }
+
+
+def round_array(values: np.ndarray, decimals: int = 8) -> np.ndarray:
+    """rounds an array the same way the builtin round does
+    Parameters
+    ----------
+        values, float array to round
+        decimals, number of decimals to keep
+
+    Returns
+    -------
+        np.ndarray, the rounded values
+
+    Explainer
+    ---------
+    np.round scales the values before rounding, so a value that is (almost) exactly halfway can round the other way
+    compared to round(). Those values are rare, so they are rounded one by one with round().
+    """
+    rounded = np.round(values, decimals)
+    scaled = values * 10.0**decimals
+    with np.errstate(invalid="ignore"):
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= 4 * np.abs(
+            np.spacing(scaled)
+        )
+
+    for i in np.flatnonzero(near_half):
+        rounded[i] = round(float(values[i]), decimals)
+
+    return rounded
+
+
 def enter_position(
     account_value_list,
     lot_size,
@@ -6,14 +6,29 @@ import pandas as pd
 
 from fast_trade.archive.db_helpers import get_kline
 
-from .build_data_frame import prepare_df
-from .build_summary import build_summary
+from .build_data_frame import apply_charting_to_df, apply_datapoints_to_df, prepare_df
+from .build_summary import build_summary, infer_metrics_from_rules
+from .compile_logic import generate_actions, logic_columns
 from .evaluate import evaluate_rules
-from .run_analysis import apply_logic_to_df
-from .utils import coerce_numeric_value, extract_error_messages
+from .run_analysis import ACTION_DTYPE, apply_logic_to_df
+from .utils import OHLC_AGGREGATION, coerce_numeric_value, extract_error_messages
 from .validate_backtest import validate_backtest, validate_backtest_with_df
 from fast_trade.utils import parse_logic_expr
 
+# the columns of the result df with return_df="equity", see run_backtest
+EQUITY_COLUMNS = [
+    "close",
+    "action",
+    "aux",
+    "account_value",
+    "adj_account_value",
+    "in_trade",
+    "fee",
+    "adj_account_value_change_perc",
+    "adj_account_value_change",
+]
+RETURN_DF_OPTIONS = ["all", "logic", "equity", "none"]
+
 
 class MissingData(Exception):
     pass
@@ -28,23 +43,184 @@ class BacktestKeyError(Exception):
         super().__init__(f"Backtest Error(s):\n{self.error_msgs}")
 
 
-def run_backtest(backtest: dict, df: pd.DataFrame = pd.DataFrame(), summary=True):
+def run_backtest(
+    backtest: dict,
+    df: pd.DataFrame = pd.DataFrame(),
+    summary=True,
+    metrics=None,
+    return_df="all",
+    indicator_dtype=None,
+):
     """
     Run a backtest on a given dataframe
     Parameters
         backtest: dict, required, object containing the logic to test and other details
         data_path: string or list, required, where to find the csv file of the ohlcv data
         df: pandas dataframe indexed by date
+        metrics: list or "rules", optional, only calculate these metric groups or keys of the summary
+            (see build_summary.METRIC_GROUPS) plus the ones the backtest's rules use. "rules" only
+            calculates the metrics the rules use. Defaults to every metric.
+        return_df: str, the columns of the df that are kept once the logic ran, see select_result_columns.
+            "all" (default) keeps every column, "logic" only the ohlcv, the columns the logic compares
+            and the simulation, "equity" only the close and the simulation, "none" doesn't return the df.
+            The summary and the trade log are built from the kept columns.
+        indicator_dtype: optional, ex. "float32", stores the datapoints as this dtype, see apply_datapoints_to_df
     Returns
         dict
             summary dict, summary of the performace of backtest
-            df dataframe, object used in the backtest
+            df dataframe, object used in the backtest, None with return_df="none"
             trade_log, dataframe of all the rows where transactions happened
     """
 
     performance_start_time = datetime.datetime.now(UTC)
     new_backtest = prepare_new_backtest(backtest)
-    errors = validate_backtest(new_backtest)
+    check_backtest_errors(new_backtest)
+    check_return_df(return_df)
+
+    if df.empty:
+        df = load_backtest_df(new_backtest, new_backtest.get("datapoints", []))
+
+    df = prepare_df(df, new_backtest, indicator_dtype=indicator_dtype)
+
+    return run_prepared_backtest(
+        df, new_backtest, performance_start_time, summary, metrics, return_df
+    )
+
+
+def run_backtests(
+    backtests: list,
+    df: pd.DataFrame = None,
+    summary=True,
+    metrics=None,
+    return_df="all",
+    indicator_dtype=None,
+):
+    """
+    Run many backtests, sharing the data between them
+    Parameters
+        backtests: list, required, the backtest objects to run
+        df: pandas dataframe indexed by date, optional, used for every backtest instead of the archive
+        summary: bool, build the summary for each backtest
+        metrics: list or "rules", optional, see run_backtest
+        return_df: str, see run_backtest. With "none" only the summaries are kept, so the memory
+            used doesn't grow with the number of backtests.
+        indicator_dtype: optional, see run_backtest
+    Returns
+        list of dicts, the same as run_backtest returns, in the same order as the backtests
+
+    Explainer
+    ---------
+    Backtests that use the same data (symbol, exchange, freq and dates) are grouped together. For each
+    group the data is loaded and charted once, and each unique datapoint (transformer, args and freq) is
+    only calculated once, no matter how many backtests use it or what they named it. Only the logic and
+    the simulation run for every backtest.
+    """
+    if df is None:
+        df = pd.DataFrame()
+
+    new_backtests = [prepare_new_backtest(backtest) for backtest in backtests]
+    for new_backtest in new_backtests:
+        check_backtest_errors(new_backtest)
+    check_return_df(return_df)
+
+    groups = {}
+    for idx, new_backtest in enumerate(new_backtests):
+        groups.setdefault(backtest_data_key(new_backtest), []).append(idx)
+
+    results = [None] * len(new_backtests)
+    for idxs in groups.values():
+        group = [new_backtests[idx] for idx in idxs]
+        first = group[0]
+
+        group_df = df
+        if group_df.empty:
+            datapoints = list(
+                itertools.chain(*[bt.get("datapoints", []) for bt in group])
+            )
+            group_df = load_backtest_df(first, datapoints)
+
+        charted_df = apply_charting_to_df(
+            group_df.copy(),
+            first.get("freq", "1Min"),
+            first.get("start"),
+            first.get("stop"),
+        )
+
+        transformer_results = {}
+        for idx, new_backtest in zip(idxs, group):
+            performance_start_time = datetime.datetime.now(UTC)
+            bt_df = apply_datapoints_to_df(
+                charted_df.copy(),
+                new_backtest,
+                results=transformer_results,
+                indicator_dtype=indicator_dtype,
+            )
+            results[idx] = run_prepared_backtest(
+                bt_df,
+                new_backtest,
+                performance_start_time,
+                summary,
+                metrics,
+                return_df,
+            )
+
+    return results
+
+
+def backtest_data_key(backtest: dict) -> tuple:
+    """Backtests with the same key can share the loaded and charted data"""
+    return tuple(
+        str(backtest.get(key))
+        for key in [
+            "symbol",
+            "exchange",
+            "freq",
+            "start_date",
+            "end_date",
+            "start",
+            "stop",
+        ]
+    )
+
+
+def check_return_df(return_df: str):
+    if return_df not in RETURN_DF_OPTIONS:
+        raise ValueError(
+            f"Unsupported return_df: {return_df}, use one of {RETURN_DF_OPTIONS}"
+        )
+
+
+def select_result_columns(df: pd.DataFrame, backtest: dict, return_df: str):
+    """Drops the columns of the result that aren't needed
+    Parameters
+    ----------
+        df: dataframe, after apply_backtest_to_df
+        backtest: dict, from prepare_new_backtest
+        return_df: str, see run_backtest
+
+    Returns
+    -------
+        dataframe with only the columns to keep
+    """
+    if return_df == "all":
+        return df
+
+    columns = EQUITY_COLUMNS
+    if return_df == "logic":
+        columns = (
+            list(OHLC_AGGREGATION)
+            + logic_columns(backtest)
+            + ["trailing_stop_loss"]
+            + EQUITY_COLUMNS
+        )
+    columns = set(columns)
+
+    return df[[column for column in df.columns if column in columns]]
+
+
+def check_backtest_errors(backtest: dict):
+    """Validates the backtest and raises a BacktestKeyError if it isn't valid"""
+    errors = validate_backtest(backtest)
 
     if errors.get("has_error"):
         # find all the keys with values
@@ -57,52 +233,94 @@ def run_backtest(backtest: dict, df: pd.DataFrame = pd.DataFrame(), summary=True
                 # get the errors from the errors dict
                 raise BacktestKeyError(error_msgs)
 
-    if df.empty:
-        # check the local archive for the data
-        # calculate the start and end dates based on the max number of periods in any dp args
-        def get_max_periods(datapoint):
-            args = datapoint.get("args", [])
-            periods = [int(arg) for arg in args if isinstance(arg, int)]
-            if len(periods) == 0:
-                return 0
-            return max(periods)
-
-        args = [get_max_periods(dp) for dp in new_backtest.get("datapoints", [])]
-        max_periods = max(args) if args else 0
-        # print(max_periods)
-        # get the frequency of the backtest
-        freq = new_backtest.get("freq", "1Min")
-        # convert the frequency to a timedelta
-        td_freq = pd.Timedelta(freq)
-
-        start_date = backtest.get("start_date", None)
-        if start_date and not isinstance(start_date, datetime.datetime):
-            start_date = datetime.datetime.fromisoformat(start_date)
-            start_date = start_date - td_freq * max_periods
-
-        # get the data from the local archive
-        df = get_kline(
-            backtest.get("symbol"),
-            backtest.get("exchange"),
-            start_date,
-            backtest.get("end_date"),
-            freq=freq,
-        )
-        print(df)
+
+def load_backtest_df(backtest: dict, datapoints: list) -> pd.DataFrame:
+    """Loads the data for a backtest from the local archive
+
+    Parameters
+        backtest: dict, the backtest with the symbol, exchange, freq and dates
+        datapoints: list, the datapoints that will be calculated, used to load enough
+            data before the start date for the longest period
+    Returns
+        pandas dataframe indexed by date
+    """
+
+    # check the local archive for the data
+    # calculate the start and end dates based on the max number of periods in any dp args
+    max_periods = max_datapoint_periods(datapoints)
+    # get the frequency of the backtest
+    freq = backtest.get("freq", "1Min")
+    # convert the frequency to a timedelta
+    td_freq = pd.Timedelta(freq)
+
+    start_date = backtest.get("start_date", None)
+    if start_date and not isinstance(start_date, datetime.datetime):
+        start_date = datetime.datetime.fromisoformat(start_date)
+        start_date = start_date - td_freq * max_periods
+
+    # get the data from the local archive
+    df = get_kline(
+        backtest.get("symbol"),
+        backtest.get("exchange"),
+        start_date,
+        backtest.get("end_date"),
+        freq=freq,
+    )
 
     if df.empty:
         raise MissingData(
             f"No data found for {backtest.get('symbol')} on {backtest.get('exchange')} or in the given dataframe"
         )
 
-    df = prepare_df(df, new_backtest)
+    return df
+
+
+def max_datapoint_periods(datapoints: list) -> int:
+    """The largest number of periods in the args of the datapoints, 0 if there are none"""
+
+    def get_max_periods(datapoint):
+        args = datapoint.get("args", [])
+        periods = [int(arg) for arg in args if isinstance(arg, int)]
+        if len(periods) == 0:
+            return 0
+        return max(periods)
+
+    args = [get_max_periods(dp) for dp in datapoints]
+    return max(args) if args else 0
+
+
+def run_prepared_backtest(
+    df: pd.DataFrame,
+    new_backtest: dict,
+    performance_start_time,
+    summary=True,
+    metrics=None,
+    return_df="all",
+):
+    """Runs the logic, simulation and summary on a dataframe that already has the datapoints
 
+    Parameters
+        df: pandas dataframe, from prepare_df
+        new_backtest: dict, from prepare_new_backtest
+        performance_start_time: datetime, when the backtest started
+        summary: bool, build the summary
+        metrics: list or "rules", optional, see run_backtest
+        return_df: str, see run_backtest
+    Returns
+        dict, see run_backtest
+    """
     df = apply_backtest_to_df(df, new_backtest)
     # throw an error if the backtest is not valid
     validate_backtest_with_df(new_backtest, df)
+    df = select_result_columns(df, new_backtest, return_df)
+
+    if metrics is not None:
+        # the rules always get the metrics they compare
+        rule_metrics = infer_metrics_from_rules(new_backtest.get("rules", []))
+        metrics = rule_metrics + ([] if metrics == "rules" else list(metrics))
 
     if summary:
-        summary, trade_log = build_summary(df, performance_start_time)
+        summary, trade_log = build_summary(df, performance_start_time, metrics)
     else:
         performance_stop_time = datetime.datetime.now(UTC)
         summary = {
@@ -122,7 +340,7 @@ def run_backtest(backtest: dict, df: pd.DataFrame = pd.DataFrame(), summary=True
     summary["strategy"] = new_backtest
     return {
         "summary": summary,
-        "df": df,
+        "df": None if return_df == "none" else df,
         "trade_df": trade_log,
         "backtest": new_backtest,
     }
@@ -202,16 +420,23 @@ def apply_backtest_to_df(df: pd.DataFrame, backtest: dict):
     return df
 
 
-def process_logic_and_generate_actions(df: pd.DataFrame, backtest: object):
+def process_logic_and_generate_actions(
+    df: pd.DataFrame, backtest: object, vectorized: bool = True
+):
     """
     Parameters
     ----------
         df, dataframe with the datapoints (indicators) calculated
         backtest, backtest object
+        vectorized, bool, compile the logic into whole column masks instead of
+            evaluating it row by row, including the confirmation lookbacks (logic[3]).
+            The row by row path is kept for parity checks.
 
     Returns
     -------
-        df, a modified dataframe with the "actions" added
+        df, a modified dataframe with the "actions" added. The "action" column is a categorical
+            backed by int8 codes (see run_analysis.ACTION_LABELS), use df["action"].astype(str)
+            or run_analysis.actions_to_labels for the strings.
 
     Explainer
     ---------
@@ -219,6 +444,12 @@ def process_logic_and_generate_actions(df: pd.DataFrame, backtest: object):
 
     """
 
+    if vectorized:
+        df["action"] = pd.Categorical.from_codes(
+            generate_actions(df, backtest), dtype=ACTION_DTYPE
+        )
+        return df
+
     """we need to search though all the logics and find the highest confirmation number
     so we know how many frames to pass in
     """
@@ -245,9 +476,9 @@ def process_logic_and_generate_actions(df: pd.DataFrame, backtest: object):
                 last_frames.pop()
             wtf = determine_action(frame, backtest, last_frames)
             actions.append(wtf)
-        df["action"] = actions
     else:
-        df["action"] = [determine_action(frame, backtest) for frame in df.itertuples()]
+        actions = [determine_action(frame, backtest) for frame in df.itertuples()]
+    df["action"] = pd.Categorical(actions, dtype=ACTION_DTYPE)
 
     return df
 
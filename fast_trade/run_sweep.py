@@ -0,0 +1,335 @@
+import copy
+import itertools
+import os
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .build_data_frame import standardize_df
+from .run_backtest import (
+    load_backtest_df,
+    prepare_new_backtest,
+    run_backtest,
+    run_backtests,
+)
+
+SWEEP_COLUMNS = ["open", "high", "low", "close", "volume"]
+# seconds between checks of the cancel event while waiting on the chunks
+CANCEL_POLL = 0.1
+
+# set in each worker by _init_worker
+_worker_shm = None
+_worker_df = None
+
+
+def expand_param_values(values) -> list:
+    """Returns the list of values for a single parameter
+    Parameters
+    ----------
+        values: list of values, or a dict with "start", "stop" and an optional "step" (default 1).
+            The stop value is included when the range lands on it.
+
+    Returns
+    -------
+        list of values
+    """
+    if isinstance(values, dict):
+        start = values["start"]
+        stop = values["stop"]
+        step = values.get("step", 1)
+        expanded = np.arange(start, stop + step / 2, step).tolist()
+        if all(isinstance(v, int) for v in [start, stop, step]):
+            return [int(v) for v in expanded]
+        return [round(v, 10) for v in expanded]
+
+    if not isinstance(values, (list, tuple)):
+        return [values]
+
+    return list(values)
+
+
+def iter_param_sets(params: dict, mode: str = "grid", samples: int = None, seed=None):
+    """Generates the combinations of parameters to test one at a time, see generate_param_sets"""
+    keys = list(params.keys())
+    values = [expand_param_values(params[key]) for key in keys]
+
+    if mode == "grid":
+        for combo in itertools.product(*values):
+            yield dict(zip(keys, combo))
+        return
+
+    if mode == "random":
+        if not samples:
+            raise ValueError("samples is required in random mode")
+        rng = random.Random(seed)
+        for _ in range(samples):
+            yield {key: rng.choice(vals) for key, vals in zip(keys, values)}
+        return
+
+    raise ValueError(f"Unsupported sweep mode: {mode}")
+
+
+def generate_param_sets(
+    params: dict, mode: str = "grid", samples: int = None, seed=None
+):
+    """Generates the combinations of parameters to test
+    Parameters
+    ----------
+        params: dict, dotted path to the values, ex. {"datapoints.0.args.0": [5, 10, 20]}
+        mode: str, "grid" for every combination, "random" to pick `samples` combinations
+        samples: int, number of combinations to pick in random mode
+        seed: optional, seed for the random mode
+
+    Returns
+    -------
+        list of dicts, each one maps the dotted paths to a value
+    """
+    return list(iter_param_sets(params, mode=mode, samples=samples, seed=seed))
+
+
+def set_param(backtest: dict, path: str, value):
+    """Sets a value in the backtest using a dotted path, ex. "datapoints.0.args.0" or "exit.1.2"
+    Parameters
+    ----------
+        backtest: dict, modified in place
+        path: str, dotted path, numbers are used as list indexes
+        value: the value to set
+    """
+    keys = path.split(".")
+    node = backtest
+    for key in keys[:-1]:
+        node = node[int(key)] if isinstance(node, list) else node[key]
+
+    last = keys[-1]
+    if isinstance(node, list):
+        node[int(last)] = value
+    else:
+        node[last] = value
+
+
+def build_sweep_backtest(base_backtest: dict, param_set: dict) -> dict:
+    """Creates a copy of the backtest with the set of parameters"""
+    backtest = copy.deepcopy(base_backtest)
+    for path, value in param_set.items():
+        set_param(backtest, path, value)
+
+    return backtest
+
+
+def build_sweep_backtests(base_backtest: dict, param_sets: list) -> list:
+    """Creates a backtest for each set of parameters"""
+    return [build_sweep_backtest(base_backtest, param_set) for param_set in param_sets]
+
+
+def share_df(df: pd.DataFrame):
+    """Copies the ohlcv data into shared memory so the workers don't each get a pickled copy
+    Parameters
+    ----------
+        df: dataframe indexed by date with the ohlcv columns
+
+    Returns
+    -------
+        tuple, (shared_memory.SharedMemory, spec dict used by attach_df)
+    """
+    num_rows = len(df.index)
+    num_cols = len(SWEEP_COLUMNS)
+    index_bytes = num_rows * 8
+    shm = shared_memory.SharedMemory(
+        create=True, size=max(index_bytes + num_rows * num_cols * 8, 1)
+    )
+
+    index = np.ndarray((num_rows,), dtype=np.int64, buffer=shm.buf)
+    index[:] = pd.DatetimeIndex(df.index).as_unit("ns").asi8
+    values = np.ndarray(
+        (num_rows, num_cols), dtype=np.float64, buffer=shm.buf, offset=index_bytes
+    )
+    values[:] = df[SWEEP_COLUMNS].to_numpy(dtype=np.float64)
+
+    spec = {"name": shm.name, "num_rows": num_rows, "index_name": df.index.name}
+
+    return shm, spec
+
+
+def attach_df(spec: dict):
+    """Builds a dataframe backed by the shared memory created with share_df
+    Returns
+    -------
+        tuple, (shared_memory.SharedMemory, dataframe). The shared memory must be kept open while
+        the dataframe is in use.
+    """
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    num_rows = spec["num_rows"]
+    index_bytes = num_rows * 8
+
+    index = np.ndarray((num_rows,), dtype=np.int64, buffer=shm.buf)
+    values = np.ndarray(
+        (num_rows, len(SWEEP_COLUMNS)),
+        dtype=np.float64,
+        buffer=shm.buf,
+        offset=index_bytes,
+    )
+
+    df = pd.DataFrame(
+        values,
+        index=pd.DatetimeIndex(index.view("datetime64[ns]"), name=spec["index_name"]),
+        columns=SWEEP_COLUMNS,
+        copy=False,
+    )
+
+    return shm, df
+
+
+def _init_worker(spec: dict):
+    global _worker_shm, _worker_df
+    _worker_shm, _worker_df = attach_df(spec)
+
+
+def _run_sweep_chunk(chunk: list, metrics=None, indicator_dtype=None) -> list:
+    """Runs a chunk of [(params, backtest)] in a worker and returns [(params, summary, error)]"""
+    param_sets = [params for params, _ in chunk]
+    backtests = [backtest for _, backtest in chunk]
+    # only the summaries are sent back, the dataframes are dropped as soon as each backtest is done
+    options = {
+        "metrics": metrics,
+        "return_df": "none",
+        "indicator_dtype": indicator_dtype,
+    }
+
+    try:
+        results = run_backtests(backtests, df=_worker_df, **options)
+        return [
+            (params, res["summary"], None) for params, res in zip(param_sets, results)
+        ]
+    except Exception:
+        # find out which backtest failed, the rest of the chunk is still useful
+        pass
+
+    chunk_results = []
+    for params, backtest in chunk:
+        try:
+            res = run_backtest(backtest, df=_worker_df, **options)
+            chunk_results.append((params, res["summary"], None))
+        except Exception as e:
+            chunk_results.append((params, None, str(e)))
+
+    return chunk_results
+
+
+def passes_rules(summary: dict) -> bool:
+    """True if the backtest had no rules or passed all of them"""
+    if not summary["strategy"].get("rules"):
+        return True
+
+    return bool(summary["rules"]["all"])
+
+
+def run_sweep(
+    base_backtest: dict,
+    params: dict,
+    mode: str = "grid",
+    samples: int = None,
+    df: pd.DataFrame = None,
+    max_workers: int = None,
+    chunk_size: int = 10,
+    seed=None,
+    include_failed: bool = False,
+    metrics=None,
+    max_pending: int = None,
+    indicator_dtype=None,
+    cancel: threading.Event = None,
+):
+    """
+    Run a parameter sweep of a backtest in parallel
+    Parameters
+        base_backtest: dict, the backtest to modify
+        params: dict, dotted path of the backtest key to change and the values to test,
+            ex. {"datapoints.0.args.0": [5, 10, 20], "trailing_stop_loss": {"start": 0, "stop": 0.1, "step": 0.05}}
+        mode: str, "grid" tests every combination, "random" tests `samples` random combinations
+        samples: int, number of combinations in random mode
+        df: pandas dataframe indexed by date, optional, otherwise the data is loaded from the archive
+        max_workers: int, number of processes, defaults to the number of cpus
+        chunk_size: int, number of backtests each worker runs at a time (sharing datapoints)
+        seed: optional, seed for the random mode
+        include_failed: bool, also yield the backtests that errored or didn't pass the rules
+        metrics: list or "rules", optional, only calculate these metrics of each summary, see run_backtest.
+            Screening with "rules" skips every metric the rules don't use.
+        max_pending: int, number of chunks given to the workers at a time, defaults to twice the workers
+        indicator_dtype: optional, ex. "float32", stores the datapoints as this dtype, see run_backtest
+        cancel: threading.Event, optional, once it's set the sweep stops without starting another chunk,
+            even while another thread is waiting on the next result
+
+    Yields
+        dict, {"params": dict, "summary": dict, "error": str or None} as soon as each chunk finishes
+
+    Explainer
+    ---------
+    The ohlcv data is loaded once and copied into shared memory, each worker builds a dataframe on top
+    of it instead of unpickling its own copy. Each worker runs its chunk with run_backtests, so the
+    datapoints that don't change are only calculated once per chunk. Results that don't pass the
+    backtest's rules (see evaluate_rules) are dropped.
+
+    The backtests are built as the chunks are submitted, and only max_pending chunks are submitted
+    at a time, so the memory used doesn't grow with the size of the sweep and nothing new is run
+    while the caller isn't reading the results.
+    """
+    if mode == "random" and seed is None:
+        # the combinations are generated twice, once to find the data to load
+        seed = random.randrange(2**32)
+
+    def iter_backtests():
+        for param_set in iter_param_sets(params, mode=mode, samples=samples, seed=seed):
+            yield param_set, build_sweep_backtest(base_backtest, param_set)
+
+    if df is None or df.empty:
+        datapoints = itertools.chain.from_iterable(
+            bt.get("datapoints", []) for _, bt in iter_backtests()
+        )
+        load_backtest = prepare_new_backtest(base_backtest)
+        if "freq" in params:
+            load_backtest["freq"] = "1Min"
+        df = load_backtest_df(load_backtest, datapoints)
+    elif not isinstance(df.index, pd.DatetimeIndex):
+        df = standardize_df(df)
+
+    work = iter_backtests()
+    chunks = iter(lambda: list(itertools.islice(work, chunk_size)), [])
+    if max_pending is None:
+        max_pending = 2 * (max_workers or os.cpu_count() or 1)
+
+    shm, spec = share_df(df)
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(spec,)
+    )
+    try:
+        pending = {
+            executor.submit(_run_sweep_chunk, chunk, metrics, indicator_dtype)
+            for chunk in itertools.islice(chunks, max_pending)
+        }
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=None if cancel is None else CANCEL_POLL,
+                return_when=FIRST_COMPLETED,
+            )
+            if cancel is not None and cancel.is_set():
+                return
+            # keep the workers busy while the caller reads the results
+            for chunk in itertools.islice(chunks, len(done)):
+                pending.add(
+                    executor.submit(_run_sweep_chunk, chunk, metrics, indicator_dtype)
+                )
+
+            for future in done:
+                for params_set, summary, error in future.result():
+                    passed = error is None and passes_rules(summary)
+                    if passed or include_failed:
+                        yield {"params": params_set, "summary": summary, "error": error}
+    finally:
+        # stop the remaining work if the caller stopped reading the results
+        executor.shutdown(wait=True, cancel_futures=True)
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,581 @@
+"""
+HTTP service for running backtests as jobs.
+
+    POST   /backtests              run a backtest, the body is the strategy. Returns the job id.
+    GET    /backtests/{id}         the status of the job, and the summary once it's done.
+                                   ?wait=seconds waits for the job to finish first.
+    GET    /backtests/{id}/stream  the status of the job as newline delimited json, until it's finished
+    DELETE /backtests/{id}         cancel the job
+    POST   /sweeps                 run a parameter sweep, the body is {"strategy": ..., "params": ...}.
+                                   Streams each result that passed the rules as newline delimited json,
+                                   or as server sent events with ?format=sse
+    GET    /stats                  queue depth, the number of jobs in each status and their latencies
+
+The jobs run on a bounded pool of processes. Each process keeps the klines it loaded (see load_cached_klines)
+and the indicator cache (see fast_trade.indicator_cache), so repeated requests for the same symbol
+skip loading the archive and calculating the datapoints again.
+
+A sweep runs on its own pool of processes, see run_sweep. The results are sent as the workers finish them
+and new backtests only start while the client keeps reading, so a sweep of any size uses the same memory.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import functools
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+import anyio
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from .run_backtest import (
+    BacktestKeyError,
+    backtest_data_key,
+    check_backtest_errors,
+    load_backtest_df,
+    max_datapoint_periods,
+    prepare_new_backtest,
+    run_backtest,
+)
+from .run_sweep import build_sweep_backtest, iter_param_sets, run_sweep
+from .utils import latency_stats
+
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", os.cpu_count() or 1))
+# number of jobs waiting for a worker before new ones are rejected
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", 100))
+# number of finished jobs kept for polling
+SERVER_MAX_JOBS = int(os.getenv("SERVER_MAX_JOBS", 1000))
+# number of sweeps running at the same time
+SERVER_MAX_SWEEPS = int(os.getenv("SERVER_MAX_SWEEPS", 1))
+SWEEP_OPTIONS = [
+    "mode",
+    "samples",
+    "seed",
+    "chunk_size",
+    "metrics",
+    "include_failed",
+    "indicator_dtype",
+]
+# number of loaded klines kept by each process
+KLINE_CACHE_SIZE = int(os.getenv("KLINE_CACHE_SIZE", 16))
+# longest ?wait of a poll, in seconds
+MAX_WAIT = 60
+LATENCY_SAMPLES = 10_000
+
+FINAL_STATUSES = ["done", "failed", "cancelled"]
+
+_kline_cache = OrderedDict()
+_kline_cache_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ExecutorBroken(Exception):
+    pass
+
+
+def jsonable(value):
+    """Converts a summary to values json can encode, nan and inf become None"""
+    if isinstance(value, dict):
+        return {str(key): jsonable(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(val) for val in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, pd.Timedelta):
+        return value.total_seconds()
+
+    return str(value)
+
+
+def load_cached_klines(backtest: dict) -> pd.DataFrame:
+    """load_backtest_df, keeping the last KLINE_CACHE_SIZE loaded klines of the process in memory
+    Parameters
+    ----------
+        backtest: dict, from prepare_new_backtest
+
+    Returns
+    -------
+        pandas dataframe indexed by date, shared with the cache so it shouldn't be modified
+    """
+    datapoints = backtest.get("datapoints", [])
+    key = (backtest_data_key(backtest), max_datapoint_periods(datapoints))
+
+    with _kline_cache_lock:
+        if key in _kline_cache:
+            _kline_cache.move_to_end(key)
+            return _kline_cache[key]
+
+    df = load_backtest_df(backtest, datapoints)
+
+    with _kline_cache_lock:
+        _kline_cache[key] = df
+        while len(_kline_cache) > KLINE_CACHE_SIZE:
+            _kline_cache.popitem(last=False)
+
+    return df
+
+
+def run_backtest_job(backtest: dict, metrics=None) -> dict:
+    """Runs a backtest in a worker process
+    Returns
+    -------
+        dict, the summary, see jsonable
+    """
+    df = load_cached_klines(prepare_new_backtest(backtest))
+    result = run_backtest(backtest, df=df.copy(), metrics=metrics, return_df="none")
+
+    return jsonable(result["summary"])
+
+
+class Job:
+    def __init__(self, backtest: dict, metrics=None):
+        self.id = uuid.uuid4().hex
+        self.backtest = backtest
+        self.metrics = metrics
+        self.status = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.summary = None
+        self.error = None
+        self.future = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "summary": self.summary,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Runs the jobs on the executor, max_workers at a time.
+
+    The jobs wait in a queue of at most max_queue, instead of the executor's unbounded one,
+    so the queue depth is known, new jobs are rejected when it's full and queued jobs can be cancelled.
+    A running job can't be stopped, cancelling it only drops its result.
+
+    When a worker dies (ex. out of memory) the process pool breaks. The jobs on it fail and
+    the pool is replaced by a new one from executor_factory. Without a factory the queue is broken
+    and new jobs are rejected.
+    """
+
+    def __init__(
+        self,
+        executor,
+        max_workers: int = SERVER_WORKERS,
+        max_queue: int = SERVER_MAX_QUEUE,
+        max_jobs: int = SERVER_MAX_JOBS,
+        executor_factory=None,
+    ):
+        self.executor = executor
+        self.executor_factory = executor_factory
+        self.broken = False
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.pending = deque()
+        self.running = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.run_latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.wait_latencies = deque(maxlen=LATENCY_SAMPLES)
+        # reentrant, a future that's already done runs _finish in _start_next
+        self._lock = threading.RLock()
+
+    def submit(self, backtest: dict, metrics=None) -> Job:
+        job = Job(backtest, metrics)
+
+        with self._lock:
+            if self.broken:
+                raise ExecutorBroken("The workers stopped, restart the server")
+            if len(self.pending) >= self.max_queue:
+                raise QueueFull(f"{len(self.pending)} jobs are already queued")
+            self.jobs[job.id] = job
+            self.pending.append(job)
+            self._drop_old_jobs()
+            self._start_next()
+
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Job:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINAL_STATUSES:
+                return job
+
+            if job.status == "queued":
+                self.pending.remove(job)
+            job.status = "cancelled"
+            job.finished_at = time.time()
+
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+
+            return {
+                "workers": self.max_workers,
+                "running": self.running,
+                "queue_depth": len(self.pending),
+                "max_queue": self.max_queue,
+                "jobs": statuses,
+                "latency": latency_stats(self.latencies, "ms"),
+                "run_latency": latency_stats(self.run_latencies, "ms"),
+                "queue_latency": latency_stats(self.wait_latencies, "ms"),
+            }
+
+    def _start_next(self):
+        while self.running < self.max_workers and self.pending:
+            job = self.pending.popleft()
+            job.status = "running"
+            job.started_at = time.time()
+            self.running += 1
+            try:
+                job.future = self.executor.submit(
+                    run_backtest_job, job.backtest, job.metrics
+                )
+            except BrokenExecutor as e:
+                self.running -= 1
+                job.error = str(e)
+                job.status = "failed"
+                job.finished_at = time.time()
+                if not self._replace_executor():
+                    return
+                continue
+            job.future.add_done_callback(
+                lambda future, job=job: self._finish(job, future)
+            )
+
+    def _finish(self, job: Job, future):
+        with self._lock:
+            self.running -= 1
+
+            if job.status == "running":
+                job.finished_at = time.time()
+                try:
+                    job.summary = future.result()
+                    job.status = "done"
+                    self.latencies.append(job.finished_at - job.submitted_at)
+                    self.run_latencies.append(job.finished_at - job.started_at)
+                    self.wait_latencies.append(job.started_at - job.submitted_at)
+                except Exception as e:
+                    job.error = str(e)
+                    job.status = "failed"
+
+            self._start_next()
+
+    def _replace_executor(self) -> bool:
+        """Swaps the broken executor for a new one, returns False when it can't"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.executor_factory is None:
+            self.broken = True
+            return False
+
+        self.executor = self.executor_factory()
+        return True
+
+    def _drop_old_jobs(self):
+        finished = [
+            job_id for job_id, job in self.jobs.items() if job.status in FINAL_STATUSES
+        ]
+        for job_id in finished[: max(len(self.jobs) - self.max_jobs, 0)]:
+            del self.jobs[job_id]
+
+
+async def homepage(request):
+    return JSONResponse({"hello": "world"})
+
+
+async def submit_backtest(request):
+    try:
+        backtest = await request.json()
+    except json.JSONDecodeError:
+        return JSONResponse({"error": "The body must be a json strategy"}, 400)
+    if not isinstance(backtest, dict):
+        return JSONResponse({"error": "The body must be a json strategy"}, 400)
+
+    try:
+        check_backtest_errors(prepare_new_backtest(backtest))
+    except (BacktestKeyError, TypeError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, 400)
+
+    metrics = request.query_params.get("metrics")
+    try:
+        job = request.app.state.jobs.submit(
+            backtest, metrics.split(",") if metrics else None
+        )
+    except QueueFull as e:
+        return JSONResponse({"error": str(e)}, 429)
+    except ExecutorBroken as e:
+        return JSONResponse({"error": str(e)}, 503)
+
+    return JSONResponse(
+        {
+            "id": job.id,
+            "status": job.status,
+            "queue_depth": len(request.app.state.jobs.pending),
+        },
+        202,
+    )
+
+
+async def wait_for_job(job: Job, timeout: float, statuses=None):
+    """Waits until the job is finished, or has another status than the given ones"""
+    deadline = time.time() + timeout
+    while job.status not in FINAL_STATUSES and time.time() < deadline:
+        if statuses is not None and job.status not in statuses:
+            return
+        await asyncio.sleep(0.02)
+
+
+async def get_backtest(request):
+    job = request.app.state.jobs.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, 404)
+
+    try:
+        wait = min(float(request.query_params.get("wait", 0)), MAX_WAIT)
+    except ValueError:
+        return JSONResponse({"error": "wait must be a number of seconds"}, 400)
+    if wait > 0:
+        await wait_for_job(job, wait)
+
+    return JSONResponse(job.to_dict())
+
+
+async def stream_backtest(request):
+    job = request.app.state.jobs.get(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, 404)
+
+    async def lines():
+        while True:
+            status = job.status
+            yield json.dumps(job.to_dict()) + "\n"
+            if status in FINAL_STATUSES:
+                return
+            await wait_for_job(job, MAX_WAIT, statuses=[status])
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def cancel_backtest(request):
+    job = request.app.state.jobs.cancel(request.path_params["job_id"])
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, 404)
+
+    return JSONResponse(job.to_dict())
+
+
+class SweepResults:
+    """The results of run_sweep, read one at a time from the threadpool.
+    A generator can't be closed while a thread is running it, so close() cancels the sweep
+    and waits for the thread reading it to return first.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.cancel = threading.Event()
+        self._results = run_sweep(*args, cancel=self.cancel, **kwargs)
+        self._lock = threading.Lock()
+
+    def next(self):
+        """The next result, or None once the sweep is done"""
+        with self._lock:
+            return next(self._results, None)
+
+    def close(self):
+        """Stops the sweep, blocking until its workers are shut down"""
+        self.cancel.set()
+        with self._lock:
+            self._results.close()
+
+
+class SweepResponse(StreamingResponse):
+    """Streams the results of a sweep and calls release however the response ends,
+    even when the client disconnected before the first result and the stream was never started.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
+
+
+def format_sweep_result(result: dict, sse: bool = False, event: str = None) -> str:
+    line = json.dumps(jsonable(result))
+    if not sse:
+        return line + "\n"
+
+    return (f"event: {event}\n" if event else "") + f"data: {line}\n\n"
+
+
+async def submit_sweep(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return JSONResponse({"error": "The body must be json"}, 400)
+    if not isinstance(body, dict) or not all(
+        isinstance(body.get(key), dict) for key in ["strategy", "params"]
+    ):
+        return JSONResponse(
+            {"error": 'The body must have a "strategy" and the "params" to sweep'}, 400
+        )
+
+    strategy = body["strategy"]
+    options = {key: body[key] for key in SWEEP_OPTIONS if key in body}
+    try:
+        check_backtest_errors(prepare_new_backtest(strategy))
+        # fail now on params that don't fit the strategy, instead of in the stream
+        param_sets = iter_param_sets(
+            body["params"],
+            **{key: options[key] for key in ["mode", "samples"] if key in options},
+        )
+        check_backtest_errors(
+            prepare_new_backtest(build_sweep_backtest(strategy, next(param_sets)))
+        )
+    except StopIteration:
+        return JSONResponse({"error": "There are no params to sweep"}, 400)
+    except (
+        AttributeError,
+        BacktestKeyError,
+        IndexError,
+        KeyError,
+        TypeError,
+        ValueError,
+    ) as e:
+        return JSONResponse({"error": str(e)}, 400)
+
+    state = request.app.state
+    if state.running_sweeps >= state.max_sweeps:
+        return JSONResponse(
+            {"error": f"{state.running_sweeps} sweeps are already running"}, 429
+        )
+    state.running_sweeps += 1
+
+    accept = request.headers.get("accept", "")
+    sse = request.query_params.get("format") == "sse" or "text/event-stream" in accept
+    results = SweepResults(
+        strategy, body["params"], max_workers=state.max_workers, **options
+    )
+
+    async def lines():
+        count = 0
+        try:
+            while True:
+                # a disconnect doesn't wait for the next result, SweepResponse stops the sweep right away
+                result = await anyio.to_thread.run_sync(
+                    results.next, abandon_on_cancel=True
+                )
+                if result is None:
+                    break
+                count += 1
+                yield format_sweep_result(result, sse)
+            if sse:
+                yield format_sweep_result({"results": count}, sse, "done")
+        except Exception as e:
+            yield format_sweep_result({"error": str(e)}, sse, "error")
+
+    async def release():
+        # stops the workers when the client stopped reading. The sweep only counts as done
+        # once they're stopped, even when the stream is being cancelled
+        try:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(results.close)
+        finally:
+            state.running_sweeps -= 1
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return SweepResponse(lines(), release, media_type=media_type)
+
+
+async def get_stats(request):
+    return JSONResponse(
+        {
+            **request.app.state.jobs.stats(),
+            "sweeps": request.app.state.running_sweeps,
+        }
+    )
+
+
+def create_app(
+    max_workers: int = SERVER_WORKERS,
+    max_queue: int = SERVER_MAX_QUEUE,
+    executor_class=ProcessPoolExecutor,
+    debug: bool = False,
+    max_sweeps: int = SERVER_MAX_SWEEPS,
+) -> Starlette:
+    """Creates the app, with a pool of max_workers processes started with the app.
+    Each sweep starts its own pool of max_workers processes.
+    """
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        executor_factory = functools.partial(executor_class, max_workers=max_workers)
+        app.state.jobs = JobQueue(
+            executor_factory(),
+            max_workers,
+            max_queue,
+            executor_factory=executor_factory,
+        )
+        app.state.max_workers = max_workers
+        app.state.max_sweeps = max_sweeps
+        app.state.running_sweeps = 0
+        try:
+            yield
+        finally:
+            # the executor might have been replaced after a worker died
+            app.state.jobs.executor.shutdown(wait=False, cancel_futures=True)
+
+    return Starlette(
+        debug=debug,
+        routes=[
+            Route("/", homepage),
+            Route("/backtests", submit_backtest, methods=["POST"]),
+            Route("/backtests/{job_id}", get_backtest, methods=["GET"]),
+            Route("/backtests/{job_id}", cancel_backtest, methods=["DELETE"]),
+            Route("/backtests/{job_id}/stream", stream_backtest, methods=["GET"]),
+            Route("/sweeps", submit_sweep, methods=["POST"]),
+            Route("/stats", get_stats),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
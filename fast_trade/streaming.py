@@ -0,0 +1,577 @@
+"""
+Streaming versions of the transformers, for evaluating new bars one at a time.
+
+Each indicator keeps the state it needs between bars, so after being seeded with the history
+a new bar costs O(1) instead of running the transformer on the whole dataframe again.
+They follow the same steps as pandas, so the values match the batch transformers
+in transformers_map up to float rounding.
+"""
+
+import math
+from collections import deque
+
+import pandas as pd
+
+NAN = float("nan")
+
+
+def _divide(a: float, b: float) -> float:
+    """a / b, with the inf and nan of numpy instead of ZeroDivisionError"""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return NAN
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+class _Ewm:
+    """One value at a time version of Series.ewm(...).mean(), with ignore_na=False"""
+
+    def __init__(self, span: float = None, alpha: float = None, adjust: bool = True):
+        # the same center of mass round trip as pandas, so alpha is the same to the last bit
+        if span is not None:
+            com = (span - 1) / 2.0
+        else:
+            com = (1 - alpha) / alpha
+        alpha = 1.0 / (1.0 + com)
+
+        self.old_wt_factor = 1.0 - alpha
+        self.new_wt = 1.0 if adjust else alpha
+        self.adjust = adjust
+        self.old_wt = 1.0
+        self.weighted = None
+
+    def update(self, value: float) -> float:
+        if self.weighted is None:
+            self.weighted = value
+            return value
+
+        is_observation = value == value
+        if self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                # avoid numerical errors on constant series
+                if self.weighted != value:
+                    self.weighted = self.old_wt * self.weighted + self.new_wt * value
+                    self.weighted /= self.old_wt + self.new_wt
+                if self.adjust:
+                    self.old_wt += self.new_wt
+                else:
+                    self.old_wt = 1.0
+        elif is_observation:
+            self.weighted = value
+
+        return self.weighted
+
+
+class _RollingMean:
+    """One value at a time version of Series.rolling(period).mean()"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque()
+        self.nobs = 0
+        self.neg_ct = 0
+        self.sum_x = 0.0
+        self.compensation = 0.0
+        self.num_consecutive_same_value = 0
+        self.prev_value = NAN
+
+    def _add(self, value, sign):
+        y = sign * value - self.compensation
+        t = self.sum_x + y
+        self.compensation = t - self.sum_x - y
+        self.sum_x = t
+
+    def update(self, value: float) -> float:
+        self.window.append(value)
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            if old == old:
+                self.nobs -= 1
+                self._add(old, -1.0)
+                self.neg_ct -= math.copysign(1.0, old) < 0
+
+        if value == value:
+            self.nobs += 1
+            self._add(value, 1.0)
+            self.neg_ct += math.copysign(1.0, value) < 0
+            if value == self.prev_value:
+                self.num_consecutive_same_value += 1
+            else:
+                self.num_consecutive_same_value = 1
+            self.prev_value = value
+
+        if self.nobs < self.period:
+            return NAN
+
+        if self.num_consecutive_same_value >= self.nobs:
+            return self.prev_value
+        result = self.sum_x / self.nobs
+        if (self.neg_ct == 0 and result < 0) or (
+            self.neg_ct == self.nobs and result > 0
+        ):
+            return 0.0
+
+        return result
+
+
+class _RollingStd:
+    """One value at a time version of Series.rolling(period).std()"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.window = deque()
+        self.nobs = 0
+        self.mean_x = 0.0
+        self.ssqdm_x = 0.0
+        self.compensation = 0.0
+        self.num_consecutive_same_value = 0
+        self.prev_value = NAN
+
+    def update(self, value: float) -> float:
+        self.window.append(value)
+        if value == value:
+            if value == self.prev_value:
+                self.num_consecutive_same_value += 1
+            else:
+                self.num_consecutive_same_value = 1
+            self.prev_value = value
+
+            self.nobs += 1
+            prev_mean = self.mean_x - self.compensation
+            y = value - self.compensation
+            t = y - self.mean_x
+            self.compensation = t + self.mean_x - y
+            self.mean_x += t / self.nobs
+            self.ssqdm_x += (value - prev_mean) * (value - self.mean_x)
+
+        if len(self.window) > self.period:
+            old = self.window.popleft()
+            if old == old:
+                self.nobs -= 1
+                if self.nobs:
+                    prev_mean = self.mean_x - self.compensation
+                    y = old - self.compensation
+                    t = y - self.mean_x
+                    self.compensation = t + self.mean_x - y
+                    self.mean_x -= t / self.nobs
+                    self.ssqdm_x -= (old - prev_mean) * (old - self.mean_x)
+                else:
+                    self.mean_x = 0.0
+                    self.ssqdm_x = 0.0
+
+        if self.nobs < self.period or self.nobs <= 1:
+            return NAN
+        if self.num_consecutive_same_value >= self.nobs:
+            return 0.0
+
+        return math.sqrt(max(self.ssqdm_x / (self.nobs - 1), 0.0))
+
+
+class _RollingExtreme:
+    """One value at a time version of Series.rolling(period).max() or .min(),
+    with a deque of the candidates for the extreme, so each value is added and removed once
+    """
+
+    def __init__(self, period: int, is_max: bool = True):
+        self.period = period
+        self.is_max = is_max
+        self.count = 0
+        self.nans = deque()
+        self.candidates = deque()
+
+    def update(self, value: float) -> float:
+        self.count += 1
+        oldest = self.count - self.period
+
+        if value != value:
+            self.nans.append(self.count)
+        else:
+            while self.candidates and (
+                self.candidates[-1][1] <= value
+                if self.is_max
+                else self.candidates[-1][1] >= value
+            ):
+                self.candidates.pop()
+            self.candidates.append((self.count, value))
+
+        while self.nans and self.nans[0] <= oldest:
+            self.nans.popleft()
+        while self.candidates and self.candidates[0][0] <= oldest:
+            self.candidates.popleft()
+
+        if self.count < self.period or self.nans:
+            return NAN
+
+        return self.candidates[0][1]
+
+
+class _Shift:
+    """The value from period bars ago, like Series.shift(period)"""
+
+    def __init__(self, period: int):
+        self.window = deque([NAN] * period, maxlen=period + 1)
+
+    def update(self, value: float) -> float:
+        self.window.append(value)
+        return self.window[0]
+
+
+class StreamingIndicator:
+    """Base class of the streaming indicators.
+
+    Subclasses set inputs, the columns of the bar they read, and implement step,
+    which takes those values and returns the new value of the indicator.
+    The value is a float for the transformers that return a Series, and a dict of
+    column: float for the ones that return a DataFrame.
+    """
+
+    inputs = ("close",)
+
+    value = None
+
+    def step(self, *values):
+        raise NotImplementedError
+
+    def update(self, bar) -> object:
+        """Adds a bar and returns the new value
+        Parameters
+        ----------
+            bar: dict or Series, with the lowercase ohlcv columns
+
+        Returns
+        -------
+            the value of the indicator on that bar
+        """
+        self.value = self.step(*[float(bar[column]) for column in self.inputs])
+
+        return self.value
+
+    def seed(self, df: pd.DataFrame) -> object:
+        """Adds every row of the history, oldest first
+        Parameters
+        ----------
+            df: dataframe, with the lowercase ohlcv columns
+
+        Returns
+        -------
+            the value of the indicator on the last row, None if there are no rows
+        """
+        columns = [df[column].to_numpy(dtype=float).tolist() for column in self.inputs]
+        for values in zip(*columns):
+            self.value = self.step(*values)
+
+        return self.value
+
+
+class SMA(StreamingIndicator):
+    def __init__(self, period: int = 41, column: str = "close"):
+        self.inputs = (column,)
+        self.mean = _RollingMean(period)
+
+    def step(self, value):
+        return self.mean.update(value)
+
+
+class EMA(StreamingIndicator):
+    def __init__(self, period: int = 9, column: str = "close", adjust: bool = True):
+        self.inputs = (column,)
+        self.ema = _Ewm(span=period, adjust=adjust)
+
+    def step(self, value):
+        return self.ema.update(value)
+
+
+class SMMA(StreamingIndicator):
+    def __init__(self, period: int = 42, column: str = "close", adjust: bool = True):
+        self.inputs = (column,)
+        self.ema = _Ewm(alpha=1 / period, adjust=adjust)
+
+    def step(self, value):
+        return self.ema.update(value)
+
+
+class DEMA(StreamingIndicator):
+    def __init__(self, period: int = 9, column: str = "close", adjust: bool = True):
+        # like TA.DEMA, the EMA is always of the close
+        self.ema = _Ewm(span=period)
+        self.ema_ema = _Ewm(span=period, adjust=adjust)
+
+    def step(self, value):
+        ema = self.ema.update(value)
+
+        return 2 * ema - self.ema_ema.update(ema)
+
+
+class TEMA(StreamingIndicator):
+    def __init__(self, period: int = 9, adjust: bool = True):
+        self.ema = _Ewm(span=period)
+        self.ema_ema = _Ewm(span=period, adjust=adjust)
+        self.ema_ema_ema = _Ewm(span=period, adjust=adjust)
+
+    def step(self, value):
+        ema = self.ema.update(value)
+        ema_ema = self.ema_ema.update(ema)
+
+        return 3 * ema - 3 * ema_ema + self.ema_ema_ema.update(ema_ema)
+
+
+class WMA(StreamingIndicator):
+    """Keeps the sum and the weighted sum of the window. They are summed again from the window
+    every period bars, so the rounding of the running sums doesn't build up.
+    """
+
+    def __init__(self, period: int = 9, column: str = "close"):
+        self.inputs = (column,)
+        self.period = period
+        self.divisor = period * (period + 1) / 2
+        self.window = deque([0.0] * period, maxlen=period)
+        self.count = 0
+        # the nans are summed as 0, the window is nan until the last one leaves it
+        self.last_nan = 0
+        self.total = 0.0
+        self.weighted = 0.0
+
+    def step(self, value):
+        self.count += 1
+        if value != value:
+            self.last_nan = self.count
+            value = 0.0
+
+        self.weighted += self.period * value - self.total
+        self.total += value - self.window[0]
+        self.window.append(value)
+
+        if self.count % self.period == 0:
+            self.total = math.fsum(self.window)
+            self.weighted = math.fsum(
+                weight * x for weight, x in enumerate(self.window, 1)
+            )
+
+        if self.count < self.period or self.count - self.last_nan < self.period:
+            return NAN
+
+        return self.weighted / self.divisor
+
+
+class MOM(StreamingIndicator):
+    def __init__(self, period: int = 10, column: str = "close"):
+        self.inputs = (column,)
+        self.shift = _Shift(period)
+
+    def step(self, value):
+        return value - self.shift.update(value)
+
+
+class ROC(StreamingIndicator):
+    def __init__(self, period: int = 12, column: str = "close"):
+        self.inputs = (column,)
+        self.shift = _Shift(period)
+
+    def step(self, value):
+        shifted = self.shift.update(value)
+
+        return _divide(value - shifted, shifted) * 100
+
+
+class RSI(StreamingIndicator):
+    def __init__(self, period: int = 14, column: str = "close", adjust: bool = True):
+        self.inputs = (column,)
+        self.shift = _Shift(1)
+        self.gain = _Ewm(alpha=1.0 / period, adjust=adjust)
+        self.loss = _Ewm(alpha=1.0 / period, adjust=adjust)
+
+    def step(self, value):
+        delta = value - self.shift.update(value)
+        gain = self.gain.update(0.0 if delta < 0 else delta)
+        loss = self.loss.update(abs(0.0 if delta > 0 else delta))
+
+        return 100 - _divide(100, 1 + _divide(gain, loss))
+
+
+class MACD(StreamingIndicator):
+    def __init__(
+        self,
+        period_fast: int = 12,
+        period_slow: int = 26,
+        signal: int = 9,
+        column: str = "close",
+        adjust: bool = True,
+    ):
+        self.inputs = (column,)
+        self.fast = _Ewm(span=period_fast, adjust=adjust)
+        self.slow = _Ewm(span=period_slow, adjust=adjust)
+        self.signal = _Ewm(span=signal, adjust=adjust)
+
+    def step(self, value):
+        macd = self.fast.update(value) - self.slow.update(value)
+
+        return {"MACD": macd, "SIGNAL": self.signal.update(macd)}
+
+
+class PPO(MACD):
+    def step(self, value):
+        slow = self.slow.update(value)
+        ppo = _divide(self.fast.update(value) - slow, slow) * 100
+        signal = self.signal.update(ppo)
+
+        return {"PPO": ppo, "SIGNAL": signal, "HISTO": ppo - signal}
+
+
+class TP(StreamingIndicator):
+    inputs = ("high", "low", "close")
+
+    def step(self, high, low, close):
+        return (high + low + close) / 3
+
+
+class TR(StreamingIndicator):
+    inputs = ("high", "low", "close")
+
+    def __init__(self):
+        self.shift = _Shift(1)
+
+    def step(self, high, low, close):
+        prev_close = self.shift.update(close)
+        # max skips the nan, like DataFrame.max
+        ranges = [
+            r
+            for r in (abs(high - low), abs(high - prev_close), abs(prev_close - low))
+            if r == r
+        ]
+
+        return max(ranges) if ranges else NAN
+
+
+class ATR(TR):
+    def __init__(self, period: int = 14):
+        super().__init__()
+        self.mean = _RollingMean(period)
+
+    def step(self, high, low, close):
+        return self.mean.update(super().step(high, low, close))
+
+
+class BBANDS(StreamingIndicator):
+    def __init__(
+        self,
+        period: int = 20,
+        MA=None,
+        column: str = "close",
+        std_multiplier: float = 2,
+    ):
+        if MA is not None:
+            raise ValueError("BBANDS with a custom MA can't be streamed")
+
+        # like TA.BBANDS, the middle band is always the SMA of the close
+        self.inputs = (column, "close")
+        self.std_multiplier = std_multiplier
+        self.std = _RollingStd(period)
+        self.mean = _RollingMean(period)
+
+    def step(self, value, close):
+        std = self.std.update(value)
+        middle = self.mean.update(close)
+
+        return {
+            "BB_UPPER": middle + (self.std_multiplier * std),
+            "BB_MIDDLE": middle,
+            "BB_LOWER": middle - (self.std_multiplier * std),
+        }
+
+
+class STOCH(StreamingIndicator):
+    inputs = ("high", "low", "close")
+
+    def __init__(self, period: int = 14):
+        self.highest = _RollingExtreme(period, is_max=True)
+        self.lowest = _RollingExtreme(period, is_max=False)
+
+    def step(self, high, low, close):
+        highest_high = self.highest.update(high)
+        lowest_low = self.lowest.update(low)
+
+        return _divide(close - lowest_low, highest_high - lowest_low) * 100
+
+
+class STOCHD(STOCH):
+    def __init__(self, period: int = 3, stoch_period: int = 14):
+        super().__init__(stoch_period)
+        self.mean = _RollingMean(period)
+
+    def step(self, high, low, close):
+        return self.mean.update(super().step(high, low, close))
+
+
+class WILLIAMS(STOCH):
+    def step(self, high, low, close):
+        highest_high = self.highest.update(high)
+        lowest_low = self.lowest.update(low)
+
+        return _divide(highest_high - close, highest_high - lowest_low) * -100
+
+
+class ROLLING_MAX(StreamingIndicator):
+    def __init__(self, periods: int = 10, column: str = "close"):
+        self.inputs = (column,)
+        self.extreme = _RollingExtreme(periods, is_max=True)
+
+    def step(self, value):
+        return self.extreme.update(value)
+
+
+class ROLLING_MIN(ROLLING_MAX):
+    def __init__(self, periods: int = 10, column: str = "close"):
+        self.inputs = (column,)
+        self.extreme = _RollingExtreme(periods, is_max=False)
+
+
+"""
+The transformers that can be streamed, keyed like transformers_map. They take the same args
+as the transformer, without the dataframe.
+"""
+streaming_map = {
+    "sma": SMA,
+    "ema": EMA,
+    "smma": SMMA,
+    "dema": DEMA,
+    "tema": TEMA,
+    "wma": WMA,
+    "mom": MOM,
+    "roc": ROC,
+    "rsi": RSI,
+    "macd": MACD,
+    "ppo": PPO,
+    "tp": TP,
+    "tr": TR,
+    "atr": ATR,
+    "bbands": BBANDS,
+    "stoch": STOCH,
+    "stochd": STOCHD,
+    "williams": WILLIAMS,
+    "rolling_max": ROLLING_MAX,
+    "rolling_min": ROLLING_MIN,
+}
+
+
+def create_streaming_indicator(ind: dict) -> StreamingIndicator:
+    """Creates the streaming indicator of a datapoint
+    Parameters
+    ----------
+        ind: dict, the datapoint detail, see build_data_frame.apply_transformers_to_dataframe
+
+    Returns
+    -------
+        a new StreamingIndicator, to be seeded with the history
+    """
+    transformer = ind.get("transformer")
+    if transformer not in streaming_map:
+        raise ValueError(f"Transformer '{transformer}' can't be streamed.")
+    if ind.get("freq"):
+        raise ValueError(
+            f"Datapoint '{ind.get('name')}' has its own freq and can't be streamed."
+        )
+
+    return streaming_map[transformer](*ind.get("args", []))
@@ -1,7 +1,10 @@
 import re
 from typing import Any, Dict
 
+import numpy as np
 import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Tick
 
 
 def to_dataframe(ticks: list) -> pd.DataFrame:
@@ -24,11 +27,60 @@ OHLC_AGGREGATION = {
 
 
 def resample(df: pd.DataFrame, interval: str) -> pd.DataFrame:
-    """Resample DataFrame by <interval>."""
+    """Resample DataFrame by <interval>.
+    When the data is already at <interval>, one row per period starting from the first period of the day,
+    the resample wouldn't change anything so the ohlcv columns are returned as they are.
+    """
+
+    if is_resampled(df, interval):
+        res = df.reindex(columns=list(OHLC_AGGREGATION))
+        # a new index like a resample, the data might be in shared memory (see run_sweep)
+        res.index = pd.DatetimeIndex(df.index, freq=interval, copy=True)
+        if res["volume"].hasnans:
+            # the sum of an empty period is 0
+            res["volume"] = res["volume"].fillna(0)
+        return res
 
     return df.resample(interval).agg(OHLC_AGGREGATION)
 
 
+def is_at_freq(index: pd.Index, freq: str) -> bool:
+    """Checks if the index has exactly one row every <freq>, with no gaps or duplicates.
+    Only fixed frequencies (ex. 1Min, 4h, 1D) are checked, calendar ones (ex. ME) are never a match.
+    """
+
+    if not isinstance(index, pd.DatetimeIndex) or index.empty:
+        return False
+    if index.tz is not None and str(index.tz) != "UTC":
+        # a day isn't always 24 hours
+        return False
+
+    offset = to_offset(freq)
+    if not isinstance(offset, Tick):
+        return False
+    if index.freq == offset:
+        return True
+
+    step = pd.Timedelta(offset).as_unit(index.unit).value
+    return bool((np.diff(index.asi8) == step).all())
+
+
+def is_resampled(df: pd.DataFrame, interval: str) -> bool:
+    """Checks if resampling the ohlcv data by <interval> would return the same rows,
+    ie. there's a row every <interval> and the first one starts a period (periods start at midnight).
+    """
+
+    if not all(col in df.columns for col in OHLC_AGGREGATION):
+        return False
+    if not is_at_freq(df.index, interval):
+        return False
+
+    first = df.index[0]
+    return (first - first.normalize()) % pd.Timedelta(
+        to_offset(interval)
+    ) == pd.Timedelta(0)
+
+
 def resample_calendar(df: pd.DataFrame, offset: str) -> pd.DataFrame:
     """Resample the DataFrame by calendar offset.
     See http://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#anchored-offsets for compatible offsets.
@@ -218,3 +270,29 @@ def extract_error_messages(error_dict: Dict[str, Any]) -> str:
     traverse_errors(error_dict)
 
     return "\n".join(messages)
+
+
+def latency_stats(latencies, unit: str = "us") -> dict:
+    """Summarizes latencies in seconds
+    Parameters
+    ----------
+        latencies: iterable of seconds
+        unit: str, "us" or "ms", the unit of the stats
+
+    Returns
+    -------
+        dict, the count, mean, p50, p99 and max
+    """
+    scale = {"us": 1e6, "ms": 1e3}[unit]
+    keys = [f"{stat}_{unit}" for stat in ["mean", "p50", "p99", "max"]]
+    if not len(latencies):
+        return {"count": 0, **{key: 0 for key in keys}}
+
+    values = np.fromiter(latencies, dtype=np.float64) * scale
+    p50, p99 = np.percentile(values, [50, 99])
+    stats = [values.mean(), p50, p99, values.max()]
+
+    return {
+        "count": len(values),
+        **{key: round(float(stat), 2) for key, stat in zip(keys, stats)},
+    }
@@ -1,15 +1 @@
-from starlette.applications import Starlette
-from starlette.responses import JSONResponse
-from starlette.routing import Route
-
-
-async def homepage(request):
-    return JSONResponse({"hello": "world"})
-
-
-app = Starlette(
-    debug=True,
-    routes=[
-        Route("/", homepage),
-    ],
-)
+from fast_trade.server import app  # noqa: F401
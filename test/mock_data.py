@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+
+
+def create_mock_ohlcv(size=500, seed=1, flat=None):
+    """A seeded random walk of 1 minute ohlcv bars, indexed by date from 2024-01-01.
+    flat is an optional slice of the bars where the close doesn't move.
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 + rng.standard_normal(size).cumsum()
+    if flat is not None:
+        close[flat] = close[flat.start]
+
+    return pd.DataFrame(
+        {
+            "open": close,
+            "high": close + rng.random(size),
+            "low": close - rng.random(size),
+            "close": close,
+            "volume": rng.random(size) * 100,
+        },
+        index=pd.date_range("2024-01-01", periods=size, freq="1min", name="date"),
+    )
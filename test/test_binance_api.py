@@ -0,0 +1,101 @@
+import datetime
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+from fast_trade.archive import binance_api, rate_limit
+
+
+class MockResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.headers = {}
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+
+def mock_klines_get(url):
+    """Returns a 1 minute kline for every minute in the requested window"""
+    query = parse_qs(urlparse(url).query)
+    start_ms = int(query["startTime"][0])
+    end_ms = int(query["endTime"][0])
+
+    klines = []
+    for date_ms in range(start_ms, end_ms + 1, 60_000):
+        price = str(date_ms / 60_000)
+        klines.append(
+            [date_ms, price, price, price, price, "1.5", date_ms + 59_999, "0", 1]
+        )
+
+    return MockResponse(klines)
+
+
+@pytest.fixture
+def mock_requests(monkeypatch):
+    monkeypatch.setattr(binance_api.requests, "get", mock_klines_get)
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+
+def test_get_kline_windows():
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 2, 6, tzinfo=datetime.timezone.utc)
+
+    res = binance_api.get_kline_windows(start, end)
+
+    assert len(res) == 2
+    assert res[0][1] + 1 == res[1][0]
+    assert res[1][1] + 1 == int(end.timestamp()) * 1000
+
+
+def test_binance_klines_to_array():
+    res = binance_api.binance_klines_to_array(
+        [[60_000, "1.5", "2", "1", "1.75", "10", 119_999, "0", 1]]
+    )
+
+    assert res.dtype == np.float64
+    assert res.tolist() == [[60_000, 1.5, 2, 1, 1.75, 10]]
+
+
+def test_get_binance_klines_stores_each_row_once(mock_requests):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 4, tzinfo=datetime.timezone.utc)
+    stored = []
+
+    res, status = binance_api.get_binance_klines(
+        "BTCUSDT",
+        start,
+        end,
+        store_func=lambda df, symbol, exchange: stored.append(df),
+        max_workers=3,
+        return_df=True,
+    )
+
+    stored_dates = [date for df in stored for date in df.index]
+    assert len(res) == 3 * 24 * 60
+    assert len(stored_dates) == len(res)
+    assert len(set(stored_dates)) == len(res)
+    assert res.index.is_monotonic_increasing
+    assert list(res.columns) == ["open", "high", "low", "close", "volume"]
+    assert res.close.iloc[0] == start.timestamp() / 60
+    assert status["call_count"] == len(binance_api.get_kline_windows(start, end))
+
+
+def test_get_binance_klines_only_stores_by_default(mock_requests):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+    stored = []
+
+    res, status = binance_api.get_binance_klines(
+        "BTCUSDT",
+        start,
+        end,
+        store_func=lambda df, symbol, exchange: stored.append(len(df)),
+    )
+
+    assert res is None
+    assert sum(stored) == 24 * 60
+    assert status["perc_complete"] == 100
@@ -1,16 +1,21 @@
 import pytest
 import pandas as pd
 import datetime
+import importlib
+from collections import OrderedDict
 
+from fast_trade.utils import OHLC_AGGREGATION, is_at_freq, is_resampled, resample
 from fast_trade.build_data_frame import (
     build_data_frame,
     detect_time_unit,
     load_basic_df_from_csv,
     apply_transformers_to_dataframe,
     apply_charting_to_df,
+    datapoint_key,
     prepare_df,
     process_res_df,
 )
+from test.mock_data import create_mock_ohlcv
 
 
 def test_detect_time_unit_s():
@@ -228,6 +233,106 @@ def test_apply_transformers_to_dataframe():
     mock_df.index = pd.to_datetime(mock_df.date, unit="s")
 
 
+def test_apply_transformers_to_dataframe_shared_results():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+    mock_df.index = pd.to_datetime(mock_df.date, unit="s")
+    mock_df = apply_charting_to_df(mock_df, "1Min", None, None)
+    mock_results = {}
+
+    res_1 = apply_transformers_to_dataframe(
+        mock_df.copy(),
+        [{"name": "short", "transformer": "sma", "args": [3]}],
+        results=mock_results,
+    )
+    res_2 = apply_transformers_to_dataframe(
+        mock_df.copy(),
+        [
+            {"name": "sma_3", "transformer": "sma", "args": [3]},
+            {"name": "sma_of_sma", "transformer": "sma", "args": [2, "sma_3"]},
+        ],
+        results=mock_results,
+    )
+
+    # the sma of the sma column depends on the backtest, so it isn't shared
+    assert list(mock_results) == [
+        datapoint_key({"transformer": "sma", "args": [3]}),
+    ]
+    assert res_1["short"].equals(res_2["sma_3"].rename("short"))
+    assert "sma_of_sma" in res_2.columns
+
+
+def test_resample_no_op():
+    mock_df = create_mock_ohlcv()
+    gapped_df = mock_df.drop(mock_df.index[10:20])
+    shifted_df = mock_df.iloc[3:]
+
+    assert is_at_freq(mock_df.index, "1Min")
+    assert not is_at_freq(gapped_df.index, "1Min")
+    assert not is_at_freq(mock_df.index, "ME")
+    assert is_resampled(mock_df, "1Min")
+    assert not is_resampled(mock_df[["close"]], "1Min")
+
+    for df, freq in [
+        (mock_df, "1Min"),
+        (mock_df, "5Min"),
+        (gapped_df, "1Min"),
+        (shifted_df, "5Min"),
+    ]:
+        res = resample(df, freq)
+        expected = df.resample(freq).agg(OHLC_AGGREGATION)
+
+        pd.testing.assert_frame_equal(res, expected)
+        assert res.index.freq == expected.index.freq
+
+
+def test_apply_transformers_to_dataframe_fills_datapoints():
+    mock_df = create_mock_ohlcv()
+
+    res = apply_transformers_to_dataframe(
+        mock_df.drop(mock_df.index[10:20]),
+        [
+            {"name": "sma_5m", "transformer": "sma", "args": [2], "freq": "5Min"},
+            {"name": "sma_of_sma", "transformer": "sma", "args": [2, "sma_5m"]},
+        ],
+    )
+
+    assert res.index.freq == "1Min"
+    assert len(res) == len(mock_df)
+    assert not res["close"].hasnans
+    # the rows in between the 5 minute ones repeat the value before, and the sma of it uses them
+    assert res["sma_5m"].iloc[10:].notna().all()
+    assert res["sma_of_sma"].equals(
+        res["sma_5m"].rolling(2).mean().rename("sma_of_sma")
+    )
+
+
+def test_resample_cache(monkeypatch):
+    build_data_frame_module = importlib.import_module("fast_trade.build_data_frame")
+    monkeypatch.setattr(build_data_frame_module, "_resample_cache", OrderedDict())
+    monkeypatch.setattr(build_data_frame_module, "get_indicator_cache", lambda: None)
+    resamples = []
+
+    def mock_resample(df, freq):
+        resamples.append(is_resampled(df, freq))
+        return resample(df, freq)
+
+    monkeypatch.setattr(build_data_frame_module, "resample", mock_resample)
+
+    mock_df = create_mock_ohlcv()
+    mock_transformers = [
+        {"name": "sma_5m", "transformer": "sma", "args": [2], "freq": "5Min"},
+        {"name": "ema_5m", "transformer": "ema", "args": [2], "freq": "5Min"},
+    ]
+
+    res_1 = apply_transformers_to_dataframe(mock_df.copy(), mock_transformers)
+    res_2 = apply_transformers_to_dataframe(mock_df.copy(), mock_transformers)
+
+    # the 1 minute data is only resampled to 5 minutes once
+    assert resamples.count(False) == 1
+    assert len(build_data_frame_module._resample_cache) == 1
+    assert res_1.equals(res_2)
+
+
 def test_prepare_df():
     mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
     mock_df.index = pd.to_datetime(mock_df.date, unit="s")
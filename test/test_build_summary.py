@@ -3,12 +3,20 @@ import pandas as pd
 import pytest
 from datetime import UTC
 
+import numpy as np
+
 from fast_trade.build_summary import (
+    METRIC_GROUPS,
+    SummaryContext,
     build_summary,
     calculate_buy_and_hold_perc,
+    calculate_drawdown_metrics,
     calculate_return_perc,
     calculate_shape_ratio,
     create_trade_log,
+    infer_metrics_from_rules,
+    resolve_metric_groups,
+    run_lengths,
     summarize_time_held,
     summarize_trade_perc,
     summarize_trades,
@@ -64,6 +72,33 @@ def test_create_trade_log_simple():
     )
 
 
+def test_create_trade_log_entries_and_exits():
+    mock_tl = create_mock_trade_log()
+    mock_tl["in_trade"] = [False, True, True, False, True, False, False, True, True]
+    mock_tl["adj_account_value"] = [100, 100, 104, 110, 110, 99, 99, 99, 101]
+
+    trade_log_df = create_trade_log(mock_tl)
+
+    # the trade still open on the last row isn't logged
+    assert list(trade_log_df.trade_id) == [0, 1]
+    assert list(trade_log_df.entry_time) == [mock_tl.index[1], mock_tl.index[4]]
+    assert list(trade_log_df.index) == [mock_tl.index[3], mock_tl.index[5]]
+    assert list(trade_log_df.entry_adj_account_value) == [100, 110]
+    assert list(trade_log_df.exit_adj_account_value) == [110, 99]
+    assert list(trade_log_df.adj_account_value_change) == [10, -11]
+    assert trade_log_df.adj_account_value_change_perc.tolist() == pytest.approx(
+        [0.1, -0.1]
+    )
+    assert trade_log_df.index.name == "date"
+
+
+def test_create_trade_log_no_closed_trades():
+    mock_tl = create_mock_trade_log()
+    mock_tl["in_trade"] = [False] * 7 + [True] * 2
+
+    assert create_trade_log(mock_tl).empty
+
+
 def test_summarize_time_held():
     trade_log_df = create_trade_log(create_mock_trade_log())
 
@@ -333,3 +368,137 @@ def test_build_summary():
     assert type(res["test_duration"]) is float
     assert len(trade_df.index) == expected_total_trades
     assert res["total_missing"] == 0
+
+
+def create_mock_summary_df():
+    mock_df = create_mock_trade_log()
+    mock_df.close = [10, 11, 11, 9, 9, 10, 11, 90, 11]
+    mock_df["action"] = ["e", "h", "h", "h", "x", "e", "h", "h", "x"]
+    mock_df["account_value"] = [90, 110, 110, 90, 90, 100, 110, 90, 100]
+    mock_df["adj_account_value"] = [90, 110, 110, 90, 90, 100, 110, 90, 100]
+    mock_df["adj_account_value_change"] = mock_df["adj_account_value"].diff()
+    mock_df["adj_account_value_change_perc"] = mock_df["account_value"].pct_change()
+    mock_df["aux"] = [1, 1, 1, 1, 1, 1, 1, 1, 1]
+
+    return mock_df
+
+
+def test_build_summary_metrics_subset():
+    mock_df = create_mock_summary_df()
+    mock_start_time = datetime.datetime.now(UTC)
+    full_res, _ = build_summary(mock_df, mock_start_time)
+
+    res, trade_df = build_summary(
+        mock_df,
+        mock_start_time,
+        metrics=["returns", "drawdown_metrics.max_drawdown_pct"],
+    )
+
+    assert list(res.keys()) == [
+        "return_perc",
+        "sharpe_ratio",
+        "buy_and_hold_perc",
+        "test_duration",
+        "market_adjusted_return",
+        "drawdown_metrics",
+    ]
+    assert res["return_perc"] == full_res["return_perc"]
+    assert res["drawdown_metrics"] == full_res["drawdown_metrics"]
+    assert len(trade_df.index) == full_res["num_trades"]
+
+
+def test_build_summary_every_metric_by_default():
+    mock_df = create_mock_summary_df()
+    mock_start_time = datetime.datetime.now(UTC)
+
+    res, _ = build_summary(mock_df, mock_start_time)
+    res_all, _ = build_summary(mock_df, mock_start_time, metrics=list(METRIC_GROUPS))
+
+    res.pop("test_duration")
+    res_all.pop("test_duration")
+    assert list(res.keys()) == list(res_all.keys())
+    # the mock data is shorter than a day, so the time analysis is all nan
+    res.pop("time_analysis")
+    res_all.pop("time_analysis")
+    assert res == res_all
+
+
+def test_build_summary_no_trades():
+    mock_df = create_mock_summary_df()
+    mock_df["in_trade"] = False
+
+    res, trade_df = build_summary(mock_df, datetime.datetime.now(UTC))
+
+    assert trade_df.empty
+    assert res["num_trades"] == 0
+    assert res["win_perc"] == 0
+    assert res["trade_streaks"]["max_win_streak"] == 0
+
+
+def test_resolve_metric_groups():
+    assert resolve_metric_groups(None) == list(METRIC_GROUPS)
+    assert resolve_metric_groups(["max_drawdown", "sqn", "returns"]) == [
+        "returns",
+        "equity",
+        "system_quality",
+    ]
+
+    with pytest.raises(ValueError):
+        resolve_metric_groups(["not_a_metric"])
+
+
+def test_infer_metrics_from_rules():
+    mock_rules = [
+        ["return_perc", ">", "buy_and_hold_perc"],
+        ["drawdown_metrics.max_drawdown_pct", ">", -10],
+        ["num_trades", ">", "5"],
+    ]
+
+    res = infer_metrics_from_rules(mock_rules)
+
+    assert res == [
+        "return_perc",
+        "buy_and_hold_perc",
+        "drawdown_metrics.max_drawdown_pct",
+        "num_trades",
+    ]
+
+
+def test_run_lengths():
+    starts, lengths, values = run_lengths(np.array([True, True, False, True, False]))
+
+    assert starts.tolist() == [0, 2, 3, 4]
+    assert lengths.tolist() == [2, 1, 1, 1]
+    assert values.tolist() == [True, False, True, False]
+
+
+def test_summary_context_matches_pandas():
+    mock_df = create_mock_summary_df()
+    mock_df["in_trade"] = [True, True, False, True, True, True, False, False, True]
+
+    ctx = SummaryContext(mock_df)
+
+    expected_peak = mock_df.adj_account_value.expanding().max()
+    assert ctx.running_peak.tolist() == expected_peak.tolist()
+    assert (
+        ctx.drawdowns.tolist()
+        == (mock_df.adj_account_value / expected_peak - 1.0).tolist()
+    )
+    assert ctx.in_trade_runs.tolist() == [2, 3, 1]
+    assert ctx.action_counts == {"h": 5, "e": 2, "x": 2}
+    assert (
+        ctx.wins.tolist()
+        == (ctx.trade_log_df.adj_account_value_change_perc > 0).tolist()
+    )
+
+
+def test_calculate_drawdown_metrics():
+    mock_df = create_mock_summary_df()
+
+    res = calculate_drawdown_metrics(mock_df, SummaryContext(mock_df))
+
+    assert res["max_drawdown_pct"] == -18.182
+    assert res["max_drawdown_duration"] == 3
+    assert res["avg_drawdown_duration"] == 2.5
+    assert res["current_drawdown"] == -9.091
+    assert res == calculate_drawdown_metrics(mock_df)
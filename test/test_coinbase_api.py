@@ -0,0 +1,98 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from fast_trade.archive import coinbase_api, rate_limit
+
+
+class MockResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.headers = {}
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+
+def mock_candles_get(url, params=None, headers=None):
+    """Returns a candle for every minute of the window (both ends included, newest first like the api)"""
+    start_s = int(params["start"])
+    end_s = int(params["end"])
+
+    candles = []
+    for date_s in range(end_s - end_s % 60, start_s - 1, -60):
+        price = date_s / 60
+        candles.append([date_s, price - 1, price + 1, price, price, 1.5])
+
+    # the api sometimes repeats candles
+    return MockResponse(candles + candles[:2])
+
+
+@pytest.fixture
+def mock_requests(monkeypatch):
+    monkeypatch.setattr(coinbase_api.requests, "get", mock_candles_get)
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+
+def test_candles_to_records():
+    mock_candles = [
+        [180, 1, 2, 1.5, 1.5, 10],
+        [120, 1, 2, 1.5, 1.75, 10],
+        [120, 1, 2, 1.5, 1.75, 10],
+        [60, 1, 2, 1.5, 1.25, 10],
+    ]
+
+    res = coinbase_api.candles_to_records(mock_candles, 60, 180)
+
+    assert res.dtype == coinbase_api.CANDLE_DTYPE
+    assert list(res["date"]) == [60, 120]
+    assert list(res["close"]) == [1.25, 1.75]
+
+
+def test_candles_to_records_empty():
+    res = coinbase_api.candles_to_records([], 0, 60)
+
+    assert len(res) == 0
+
+
+def test_get_product_candles_stores_each_row_once(mock_requests):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 2, 1, tzinfo=datetime.timezone.utc)
+    stored = []
+
+    res, status = coinbase_api.get_product_candles(
+        "BTC-USD",
+        start,
+        end,
+        store_func=lambda df, symbol, exchange: stored.append(df),
+        max_workers=3,
+        return_df=True,
+    )
+
+    stored_dates = np.concatenate([df.index.to_numpy() for df in stored])
+    assert len(res) == 25 * 60
+    assert len(stored_dates) == len(res)
+    assert len(np.unique(stored_dates)) == len(res)
+    assert res.index.is_monotonic_decreasing
+    assert res.close.iloc[-1] == start.timestamp() / 60
+    assert status["perc_complete"] == 100
+
+
+def test_get_product_candles_only_stores_by_default(mock_requests):
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)
+    stored = []
+
+    res, status = coinbase_api.get_product_candles(
+        "BTC-USD",
+        start,
+        end,
+        store_func=lambda df, symbol, exchange: stored.append(len(df)),
+    )
+
+    assert res is None
+    assert sum(stored) == 12 * 60
+    assert status["perc_complete"] == 100
@@ -0,0 +1,160 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.archive import columnar_store, db_helpers
+
+pytest.importorskip("pyarrow")
+
+
+def create_mock_klines(start="2024-01-31 22:00", rows=240):
+    index = pd.date_range(start, periods=rows, freq="1min", name="date")
+    close = np.arange(rows, dtype=float) + 100
+    return pd.DataFrame(
+        {
+            "open": close,
+            "close": close,
+            "high": close + 1,
+            "low": close - 1,
+            "volume": np.full(rows, 10.0),
+        },
+        index=index,
+    )
+
+
+@pytest.fixture
+def mock_archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar_store, "ARCHIVE_PATH", str(tmp_path))
+    monkeypatch.setattr(db_helpers, "ARCHIVE_PATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("archive_format", ["parquet", "arrow"])
+def test_write_and_read_klines(mock_archive, archive_format):
+    mock_df = create_mock_klines()
+
+    columnar_store.write_klines(mock_df, "BTCUSDT", "binance", archive_format)
+    res = columnar_store.read_klines(
+        "BTCUSDT", "binance", archive_format=archive_format
+    )
+
+    partitions = columnar_store.get_partitions("BTCUSDT", "binance", archive_format)
+    assert [str(month) for month, _ in partitions] == ["2024-01", "2024-02"]
+    pd.testing.assert_frame_equal(res, mock_df, check_freq=False)
+
+
+def test_write_klines_merges_months(mock_archive):
+    mock_df = create_mock_klines()
+    mock_update = mock_df.iloc[-10:].copy()
+    mock_update["close"] = 1.0
+
+    columnar_store.write_klines(mock_df.iloc[:-5], "BTCUSDT", "binance")
+    columnar_store.write_klines(mock_update, "BTCUSDT", "binance")
+    res = columnar_store.read_klines("BTCUSDT", "binance")
+
+    assert len(res) == len(mock_df)
+    assert list(res.close.iloc[-10:]) == [1.0] * 10
+    assert res.index.is_monotonic_increasing
+
+
+def test_kline_writer_writes_each_month_once(mock_archive, monkeypatch):
+    writes = []
+    write_partition = columnar_store.write_partition
+
+    def mock_write_partition(df, path, archive_format):
+        writes.append(path.split("/")[-1])
+        write_partition(df, path, archive_format)
+
+    monkeypatch.setattr(columnar_store, "write_partition", mock_write_partition)
+    mock_df = create_mock_klines()
+    writer = columnar_store.KlineWriter()
+
+    for start in range(0, len(mock_df), 20):
+        writer.write(mock_df.iloc[start : start + 20], "BTCUSDT", "binance")
+    # january is written as soon as february starts, february when the writer is closed
+    assert writes == ["2024-01.parquet"]
+
+    writer.close()
+    res = columnar_store.read_klines("BTCUSDT", "binance")
+
+    assert writes == ["2024-01.parquet", "2024-02.parquet"]
+    pd.testing.assert_frame_equal(res, mock_df, check_freq=False)
+
+
+def test_read_klines_dates_and_columns(mock_archive):
+    mock_df = create_mock_klines()
+    columnar_store.write_klines(mock_df, "BTCUSDT", "binance")
+
+    res = columnar_store.read_klines(
+        "BTCUSDT",
+        "binance",
+        start_date=datetime.datetime(2024, 2, 1),
+        end_date=datetime.datetime(2024, 2, 1, 0, 30),
+        columns=["close"],
+    )
+
+    assert list(res.columns) == ["close"]
+    assert res.index[0] == pd.Timestamp("2024-02-01")
+    assert res.index[-1] == pd.Timestamp("2024-02-01 00:30")
+
+
+def test_read_klines_tz_aware_dates(mock_archive):
+    columnar_store.write_klines(create_mock_klines(), "BTCUSDT", "binance")
+    tz = datetime.timezone(datetime.timedelta(hours=2))
+
+    res = columnar_store.read_klines(
+        "BTCUSDT",
+        "binance",
+        start_date=datetime.datetime(2024, 2, 1, 1, 0, tzinfo=tz),
+        end_date=pd.Timestamp("2024-02-01 00:30", tz="UTC"),
+    )
+
+    # 01:00 at +02:00 is 23:00 UTC, the day before
+    assert res.index[0] == pd.Timestamp("2024-01-31 23:00")
+    assert res.index[-1] == pd.Timestamp("2024-02-01 00:30")
+
+
+def test_get_max_date(mock_archive):
+    assert columnar_store.get_max_date("BTCUSDT", "binance") is None
+
+    columnar_store.write_klines(create_mock_klines(), "BTCUSDT", "binance")
+
+    assert columnar_store.get_max_date("BTCUSDT", "binance") == datetime.datetime(
+        2024, 2, 1, 1, 59
+    )
+
+
+def test_migrate_sqlite_to_columnar(mock_archive, monkeypatch):
+    monkeypatch.setattr(db_helpers, "ARCHIVE_FORMAT", "sqlite")
+    mock_df = create_mock_klines()
+    db_helpers.update_klines_to_db(mock_df, "BTCUSDT", "binance")
+
+    count = columnar_store.migrate_archive("parquet", remove_sqlite=True)
+
+    assert count == 1
+    assert not (mock_archive / "binance" / "BTCUSDT.sqlite").exists()
+    res = columnar_store.read_klines("BTCUSDT", "binance")
+    pd.testing.assert_frame_equal(res, mock_df, check_freq=False)
+
+
+def test_get_kline_from_columnar(mock_archive, monkeypatch):
+    monkeypatch.setattr(db_helpers, "ARCHIVE_FORMAT", "parquet")
+    mock_df = create_mock_klines()
+    db_helpers.update_klines_to_db(mock_df, "BTCUSDT", "binance")
+
+    res = db_helpers.get_kline(
+        "BTCUSDT",
+        "binance",
+        start_date="2024-01-31T23:00:00",
+        end_date="2024-02-01T00:59:00",
+        freq="1h",
+    )
+
+    assert db_helpers.get_local_assets() == [("binance", "BTCUSDT")]
+    assert list(res.index) == [
+        pd.Timestamp("2024-01-31 23:00"),
+        pd.Timestamp("2024-02-01 00:00"),
+    ]
+    assert list(res.volume) == [600.0, 600.0]
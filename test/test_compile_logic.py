@@ -0,0 +1,234 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.compile_logic import (
+    compile_logic_row,
+    compile_logics,
+    compile_single_logic,
+    generate_actions,
+    logic_columns,
+    resolve_logic_field,
+    rolling_all,
+)
+from fast_trade.run_analysis import actions_to_labels
+from fast_trade.run_backtest import process_logic_and_generate_actions
+from test.mock_data import create_mock_ohlcv
+
+
+def create_mock_df(rows=500, seed=42):
+    mock_df = create_mock_ohlcv(size=rows, seed=seed)
+    rng = np.random.default_rng(seed)
+    mock_df["sma"] = mock_df.close.rolling(10).mean()
+    mock_df["ind_1"] = rng.integers(0, 10, rows)
+    mock_df["trailing_stop_loss"] = mock_df.close.cummax() * 0.97
+
+    return mock_df
+
+
+def test_resolve_logic_field_number():
+    mock_df = create_mock_df(rows=5)
+
+    assert resolve_logic_field("50", mock_df) == 50
+    assert resolve_logic_field(1.5, mock_df) == 1.5
+
+
+def test_resolve_logic_field_column():
+    mock_df = create_mock_df(rows=5)
+
+    res = resolve_logic_field("close", mock_df)
+
+    assert list(res) == list(mock_df.close)
+
+
+def test_compile_single_logic():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True).set_index(
+        "date"
+    )
+
+    res = compile_single_logic(["volume", ">", 171000], mock_df)
+
+    assert list(res) == [False, False, False, False, False, True, True, True, True]
+
+
+def test_compile_single_logic_scalars():
+    mock_df = create_mock_df(rows=5)
+
+    res = compile_single_logic([2, ">", 1], mock_df)
+
+    assert list(res) == [True] * 5
+
+
+def test_compile_single_logic_bad_operator():
+    mock_df = create_mock_df(rows=5)
+
+    with pytest.raises(ValueError):
+        compile_single_logic(["close", "~", 1], mock_df)
+
+
+@pytest.mark.parametrize(
+    "logic",
+    [
+        ["close", ">", "sma"],
+        ["sma", "<=", "close"],
+        ["ind_1", "=", 5],
+        ["ind_1", "!=", "5"],
+        [3, ">", 1],
+    ],
+)
+def test_compile_logic_row_matches_compile_single_logic(logic):
+    mock_df = create_mock_df(rows=50)
+    evaluate = compile_logic_row(logic)
+
+    res = [evaluate(row) for row in mock_df.to_dict("records")]
+
+    assert res == list(compile_single_logic(logic, mock_df))
+
+
+def test_compile_logic_row_bad_operator():
+    with pytest.raises(ValueError):
+        compile_logic_row(["close", "~", 1])
+
+
+def test_compile_single_logic_lookback():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True).set_index(
+        "date"
+    )
+    mock_df["ind_1"] = [5, 5, 5, 2, 6, 7, 9, 9, 1]
+
+    res = compile_single_logic(["ind_1", ">", 4, 3], mock_df)
+
+    assert list(res) == [False, False, True, False, False, False, True, True, False]
+
+
+def test_rolling_all():
+    mask = np.array([True, True, False, True, True, True, True])
+
+    assert list(rolling_all(mask, 1)) == list(mask)
+    assert list(rolling_all(mask, 2)) == [False, True, False, False, True, True, True]
+    assert list(rolling_all(mask, 3)) == [False, False, False, False, False, True, True]
+
+
+def test_rolling_all_window_larger_than_mask():
+    mask = np.array([True, True])
+
+    assert list(rolling_all(mask, 5)) == [False, False]
+
+
+def test_compile_logics_empty():
+    mock_df = create_mock_df(rows=5)
+
+    assert not compile_logics([], mock_df).any()
+    assert not compile_logics([], mock_df, require_any=True).any()
+
+
+def test_compile_logics_require_any():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True).set_index(
+        "date"
+    )
+    mock_df["ind_1"] = [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+    res_all = compile_logics([["ind_1", ">", 2], ["ind_1", "<", 5]], mock_df)
+    res_any = compile_logics(
+        [["ind_1", "<", 1], ["ind_1", ">", 8]], mock_df, require_any=True
+    )
+
+    assert list(res_all) == [
+        False,
+        False,
+        False,
+        True,
+        False,
+        False,
+        False,
+        False,
+        False,
+    ]
+    assert list(res_any) == [
+        True,
+        False,
+        False,
+        False,
+        False,
+        False,
+        False,
+        False,
+        True,
+    ]
+
+
+def test_generate_actions_priority():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True).set_index(
+        "date"
+    )
+    mock_df["ind_1"] = [0, 1, 2, 4, 5, 5, 4, 4, 3]
+    mock_backtest = {
+        "exit": [["ind_1", "=", 4]],
+        "any_exit": [],
+        "enter": [["ind_1", ">", 3]],
+        "any_enter": [["ind_1", "=", 0]],
+    }
+
+    res = generate_actions(mock_df, mock_backtest)
+
+    assert res.dtype == np.int8
+    assert list(actions_to_labels(res)) == [
+        "ae",
+        "h",
+        "h",
+        "x",
+        "e",
+        "e",
+        "x",
+        "x",
+        "h",
+    ]
+
+
+@pytest.mark.parametrize(
+    "mock_backtest",
+    [
+        {"enter": [["close", ">", "sma"]], "exit": [["close", "<", "sma"]]},
+        {
+            "enter": [["close", ">", "sma"], ["ind_1", ">=", 5]],
+            "exit": [["ind_1", "=", 0]],
+            "any_enter": [["ind_1", "=", 9], ["volume", ">", "4500"]],
+            "any_exit": [["ind_1", "!=", 3], ["close", "<=", 95.5]],
+        },
+        {
+            "enter": [["close", ">", "sma"]],
+            "exit": [["close", "<", "sma"]],
+            "trailing_stop_loss": 0.03,
+        },
+        {"enter": [], "exit": [], "any_enter": [], "any_exit": []},
+        {"enter": [["close", ">", "sma", 4]], "exit": [["close", "<", "sma", 2]]},
+        {
+            "enter": [["close", ">", "sma", 3], ["ind_1", ">", 2]],
+            "exit": [["ind_1", "<", 5, 2], ["close", "<", "sma", 6]],
+            "any_enter": [["ind_1", "=", 9, 2], ["volume", ">", 4900]],
+            "any_exit": [["ind_1", "<", 3, 3], ["close", "<=", 95.5]],
+            "trailing_stop_loss": 0.03,
+        },
+    ],
+)
+def test_generate_actions_matches_row_by_row(mock_backtest):
+    mock_df = create_mock_df()
+
+    expected = process_logic_and_generate_actions(
+        mock_df.copy(), mock_backtest, vectorized=False
+    )
+    res = process_logic_and_generate_actions(mock_df.copy(), mock_backtest)
+
+    assert list(res.action) == list(expected.action)
+    assert res.action.dtype == "category"
+    assert res.action.cat.codes.dtype == np.int8
+
+
+def test_logic_columns():
+    mock_backtest = {
+        "enter": [["close", ">", "sma"], ["rsi", "<", "30"]],
+        "exit": [["sma", ">", 1.5, 2]],
+        "any_exit": [["close", "<", "bb_lower"]],
+    }
+
+    assert logic_columns(mock_backtest) == ["sma", "close", "bb_lower", "rsi"]
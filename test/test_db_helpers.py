@@ -0,0 +1,149 @@
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.archive import db_helpers, update_archive
+
+
+def create_mock_klines(start="2024-01-01", rows=120):
+    index = pd.date_range(start, periods=rows, freq="1min", name="date")
+    close = np.arange(rows, dtype=float) + 100
+    return pd.DataFrame(
+        {
+            "open": close,
+            "close": close,
+            "high": close + 1,
+            "low": close - 1,
+            "volume": np.full(rows, 10.0),
+        },
+        index=index,
+    )
+
+
+@pytest.fixture
+def mock_archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_helpers, "ARCHIVE_PATH", str(tmp_path))
+    monkeypatch.setattr(db_helpers, "ARCHIVE_FORMAT", "sqlite")
+    monkeypatch.setattr(update_archive, "ARCHIVE_PATH", str(tmp_path))
+    monkeypatch.setattr(update_archive, "ARCHIVE_FORMAT", "sqlite")
+    return tmp_path
+
+
+def test_to_epoch_ms():
+    assert db_helpers.to_epoch_ms("1970-01-01T00:00:01") == 1000
+    assert db_helpers.to_epoch_ms(
+        datetime.datetime(1970, 1, 1, 1, tzinfo=datetime.timezone.utc)
+    ) == (3600 * 1000)
+    assert list(
+        db_helpers.to_epoch_ms(pd.DatetimeIndex(["1970-01-01 00:00:00.005"]))
+    ) == [5]
+
+
+def test_update_klines_to_db_upserts(mock_archive):
+    mock_df = create_mock_klines()
+    mock_update = mock_df.iloc[-10:].copy()
+    mock_update["close"] = 1.0
+
+    db_path = db_helpers.update_klines_to_db(mock_df, "BTCUSDT", "binance")
+    db_helpers.update_klines_to_db(mock_update, "BTCUSDT", "binance")
+
+    with db_helpers.connect_to_klines_db(db_path) as conn:
+        count = conn.execute("SELECT count(*) FROM klines").fetchone()[0]
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        last_close = conn.execute(
+            "SELECT close FROM klines ORDER BY date DESC LIMIT 1"
+        ).fetchone()[0]
+
+    assert count == len(mock_df)
+    assert version == db_helpers.KLINES_SCHEMA_VERSION
+    assert last_close == 1.0
+
+
+def test_migrate_klines_table(mock_archive):
+    mock_df = create_mock_klines()
+    db_path = mock_archive / "legacy.sqlite"
+
+    # the table as it was written before the schema was versioned, with a duplicated row
+    with db_helpers.connect_to_db(str(db_path), create=True) as conn:
+        mock_df.to_sql("klines", con=conn, index=True, index_label="date")
+        mock_df.iloc[:1].assign(close=1.0).to_sql(
+            "klines", con=conn, if_exists="append", index=True, index_label="date"
+        )
+
+    with db_helpers.connect_to_klines_db(str(db_path)) as conn:
+        res = pd.read_sql_query("SELECT * FROM klines ORDER BY date", conn)
+        sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'klines'"
+        ).fetchone()[0]
+
+    assert "WITHOUT ROWID" in sql
+    assert len(res) == len(mock_df)
+    assert list(db_helpers.from_epoch_ms(res.date)) == list(mock_df.index)
+    assert res.close.iloc[0] == 1.0
+
+
+def test_migrate_klines_table_skips_bad_dates(mock_archive):
+    db_path = str(mock_archive / "legacy.sqlite")
+    with db_helpers.connect_to_db(db_path, create=True) as conn:
+        create_mock_klines(rows=2).to_sql(
+            "klines", con=conn, index=True, index_label="date"
+        )
+        conn.execute("INSERT INTO klines (date, close) VALUES ('not a date', 1.0)")
+
+    with db_helpers.connect_to_klines_db(db_path) as conn:
+        count = conn.execute("SELECT count(*) FROM klines").fetchone()[0]
+
+    assert count == 2
+
+
+def test_failed_migration_keeps_the_old_table(mock_archive):
+    db_path = str(mock_archive / "legacy.sqlite")
+    # the copy fails part way, after the table was renamed
+    with db_helpers.connect_to_db(db_path, create=True) as conn:
+        create_mock_klines().drop(columns=["volume"]).to_sql(
+            "klines", con=conn, index=True, index_label="date"
+        )
+
+    with pytest.raises(sqlite3.OperationalError):
+        db_helpers.connect_to_klines_db(db_path)
+
+    with db_helpers.connect_to_db(db_path) as conn:
+        tables = conn.execute("SELECT name FROM sqlite_master").fetchall()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.execute("ALTER TABLE klines ADD COLUMN volume REAL")
+
+    assert [name for (name,) in tables if name.startswith("klines")] == ["klines"]
+    assert version == 0
+
+    # once the table is fixed the migration runs again
+    with db_helpers.connect_to_klines_db(db_path) as conn:
+        count = conn.execute("SELECT count(*) FROM klines").fetchone()[0]
+
+    assert count == len(create_mock_klines())
+
+
+def test_get_kline_date_range(mock_archive):
+    db_helpers.update_klines_to_db(create_mock_klines(), "BTCUSDT", "binance")
+
+    res = db_helpers.get_kline(
+        "BTCUSDT",
+        "binance",
+        start_date="2024-01-01T00:30:00",
+        end_date="2024-01-01T00:59:00",
+    )
+
+    assert len(res) == 30
+    assert res.index[0] == pd.Timestamp("2024-01-01 00:30")
+    assert res.index[-1] == pd.Timestamp("2024-01-01 00:59")
+    assert list(res.columns) == ["open", "high", "low", "close", "volume"]
+
+
+def test_get_archive_max_date(mock_archive):
+    db_helpers.update_klines_to_db(create_mock_klines(), "BTCUSDT", "binance")
+
+    res = update_archive.get_archive_max_date("BTCUSDT", "binance")
+
+    assert res == datetime.datetime(2024, 1, 1, 1, 59)
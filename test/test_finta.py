@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.finta import TA
+from test.mock_data import create_mock_ohlcv
+
+
+def create_flat_ohlcv():
+    mock_df = create_mock_ohlcv(size=400, seed=3, flat=slice(150, 170))
+    rng = np.random.default_rng(3)
+    mock_df["open"] = mock_df.close + rng.standard_normal(len(mock_df)) * 0.1
+
+    return mock_df
+
+
+# the row by row versions of the indicators, as they were written with apply
+def mock_dmi(ohlc, period=14, adjust=True):
+    ohlc = ohlc.copy()
+    ohlc["up_move"] = ohlc["high"].diff()
+    ohlc["down_move"] = -ohlc["low"].diff()
+
+    def _dmp(row):
+        if row["up_move"] > row["down_move"] and row["up_move"] > 0:
+            return row["up_move"]
+        return 0
+
+    def _dmn(row):
+        if row["down_move"] > row["up_move"] and row["down_move"] > 0:
+            return row["down_move"]
+        return 0
+
+    atr = TA.ATR(ohlc, period)
+    plus = (ohlc.apply(_dmp, axis=1) / atr).ewm(alpha=1 / period, adjust=adjust)
+    minus = (ohlc.apply(_dmn, axis=1) / atr).ewm(alpha=1 / period, adjust=adjust)
+
+    return pd.concat(
+        [
+            pd.Series(100 * plus.mean(), name="DI_PLUS"),
+            pd.Series(100 * minus.mean(), name="DI_MINUS"),
+        ],
+        axis=1,
+    )
+
+
+def mock_mfi(ohlc, period=14):
+    tp = TA.TP(ohlc)
+    rmf = pd.Series(tp * ohlc["volume"], name="rmf")
+    _mf = pd.concat([tp, rmf], axis=1)
+    _mf["delta"] = _mf["TP"].diff()
+
+    neg = _mf.apply(lambda row: row["rmf"] if row["delta"] < 0 else 0, axis=1)
+    pos = _mf.apply(lambda row: row["rmf"] if row["delta"] > 0 else 0, axis=1)
+    mfratio = pos.rolling(window=period).sum() / neg.rolling(window=period).sum()
+
+    return pd.Series(100 - (100 / (1 + mfratio)), name="{0} period MFI".format(period))
+
+
+def mock_sign(a):
+    return (a > 0) - (a < 0)
+
+
+def mock_vzo(ohlc, period=14):
+    r = ohlc["close"].diff().apply(mock_sign) * ohlc["volume"]
+    dvma = r.ewm(span=period, adjust=True).mean()
+    vma = ohlc["volume"].ewm(span=period, adjust=True).mean()
+
+    return pd.Series(100 * (dvma / vma), name="VZO")
+
+
+def mock_pzo(ohlc, period=14):
+    r = ohlc["close"].diff().apply(mock_sign) * ohlc["close"]
+    cp = r.ewm(span=period, adjust=True).mean()
+
+    return pd.Series(
+        100 * (cp / TA.EMA(ohlc, period)), name="{} period PZO".format(period)
+    )
+
+
+def mock_sqzmi(ohlc, period=20):
+    bb = TA.BBANDS(ohlc, period=period, MA=TA.SMA(ohlc, period))
+    kc = TA.KC(ohlc, period=period, kc_mult=1.5)
+    comb = pd.concat([bb, kc], axis=1)
+
+    sqz = comb.apply(
+        lambda row: row["BB_LOWER"] > row["KC_LOWER"]
+        and row["BB_UPPER"] < row["KC_UPPER"],
+        axis=1,
+    )
+
+    return pd.Series(sqz, name="{0} period SQZMI".format(period))
+
+
+def mock_fve(ohlc, period=22, factor=0.3):
+    hl2 = (ohlc["high"] + ohlc["low"]) / 2
+    smav = ohlc["volume"].rolling(window=period).mean()
+    mf = pd.Series((ohlc["close"] - hl2 + TA.TP(ohlc).diff()), name="mf")
+    _mf = pd.concat([ohlc["close"], ohlc["volume"], mf], axis=1)
+
+    def vol_shift(row):
+        if row["mf"] > factor * row["close"] / 100:
+            return row["volume"]
+        elif row["mf"] < -factor * row["close"] / 100:
+            return -row["volume"]
+        return 0
+
+    _sum = _mf.apply(vol_shift, axis=1).rolling(window=period).sum()
+
+    return pd.Series((_sum / smav) / period * 100)
+
+
+def mock_vfi(ohlc, period=130, smoothing_factor=3, factor=0.2, vfactor=2.5):
+    typical = TA.TP(ohlc)
+    vinter = typical.apply(np.log).diff().rolling(window=30).std()
+    cutoff = pd.Series(factor * vinter * ohlc["close"], name="cutoff")
+    price_change = pd.Series(typical.diff(), name="pc")
+    mav = pd.Series(ohlc["volume"].rolling(window=period).mean(), name="mav")
+
+    _va = pd.concat([ohlc["volume"], mav.shift()], axis=1)
+    _mp = pd.concat([price_change, cutoff], axis=1).fillna(0)
+
+    def _vol_added(row):
+        if row["volume"] > vfactor * row["mav"]:
+            return vfactor * row["mav"]
+        return row["volume"]
+
+    def _multiplier(row):
+        if row["pc"] > row["cutoff"]:
+            return 1
+        elif row["pc"] < 0 - row["cutoff"]:
+            return -1
+        return 0
+
+    raw_sum = (
+        (_mp.apply(_multiplier, axis=1) * _va.apply(_vol_added, axis=1))
+        .rolling(window=period)
+        .sum()
+    )
+    raw_value = raw_sum / mav.shift()
+
+    return pd.Series(
+        raw_value.ewm(
+            ignore_na=False,
+            min_periods=smoothing_factor - 1,
+            span=smoothing_factor,
+            adjust=True,
+        ).mean(),
+        name="VFI",
+    )
+
+
+@pytest.mark.parametrize(
+    "indicator, mock_indicator",
+    [
+        (TA.DMI, mock_dmi),
+        (TA.MFI, mock_mfi),
+        (TA.VZO, mock_vzo),
+        (TA.PZO, mock_pzo),
+        (TA.SQZMI, mock_sqzmi),
+        (TA.FVE, mock_fve),
+        (TA.VFI, mock_vfi),
+    ],
+)
+def test_matches_row_by_row(indicator, mock_indicator):
+    mock_df = create_flat_ohlcv()
+
+    res = indicator(mock_df.copy())
+    expected = mock_indicator(mock_df.copy())
+
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(res, expected)
+    else:
+        pd.testing.assert_series_equal(res, expected)
+
+
+def test_adx_matches_row_by_row():
+    mock_df = create_flat_ohlcv()
+
+    res = TA.ADX(mock_df)
+
+    dmi = mock_dmi(mock_df)
+    expected = (
+        100
+        * (abs(dmi["DI_PLUS"] - dmi["DI_MINUS"]) / (dmi["DI_PLUS"] + dmi["DI_MINUS"]))
+        .ewm(alpha=1 / 14, adjust=True)
+        .mean()
+    )
+
+    np.testing.assert_array_equal(res.to_numpy(), expected.to_numpy())
+
+
+def test_sqzmi_is_bool():
+    res = TA.SQZMI(create_flat_ohlcv())
+
+    assert res.dtype == bool
+
+
+@pytest.mark.parametrize("indicator", [TA.DMI, TA.HMA, TA.OBV])
+def test_indicators_dont_modify_the_input(indicator):
+    mock_df = create_flat_ohlcv()
+    expected = mock_df.copy()
+
+    indicator(mock_df)
+
+    pd.testing.assert_frame_equal(mock_df, expected)
+
+
+def test_uppercase_columns():
+    mock_df = create_flat_ohlcv()
+
+    res = TA.DEMA(mock_df.rename(columns=str.upper))
+
+    pd.testing.assert_series_equal(res, TA.DEMA(mock_df))
+
+
+def test_frame_renamed_once(monkeypatch):
+    calls = []
+    original_rename = pd.DataFrame.rename
+
+    def mock_rename(self, *args, **kwargs):
+        calls.append(kwargs.get("columns"))
+        return original_rename(self, *args, **kwargs)
+
+    monkeypatch.setattr(pd.DataFrame, "rename", mock_rename)
+    mock_df = create_flat_ohlcv()
+
+    TA.KST(mock_df)
+    assert calls == []
+
+    TA.KST(mock_df.rename(columns=str.upper))
+    # the call above, and the validation of the outer KST call
+    assert len(calls) == 2
+
+
+def test_missing_volume_raises():
+    mock_df = create_flat_ohlcv().drop(columns="volume")
+
+    with pytest.raises(LookupError):
+        TA.EVWMA(mock_df)
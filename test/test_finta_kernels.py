@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade import finta_kernels
+from fast_trade.finta import TA
+from test.mock_data import create_mock_ohlcv
+
+
+def create_flat_ohlcv():
+    # a flat stretch, where the ranges are 0
+    mock_df = create_mock_ohlcv(flat=slice(200, 230))
+    # and some bars without volume
+    mock_df.loc[mock_df.volume < 5, "volume"] = 0
+
+    return mock_df
+
+
+def mock_recurrence_loop(a, b, y0=0.0):
+    out = []
+    y = y0
+    for a_i, b_i in zip(a, b):
+        y = b_i if a_i == 0 else a_i * y + b_i
+        out.append(y)
+    return np.array(out)
+
+
+def test_linear_recurrence():
+    rng = np.random.default_rng(0)
+    mock_a = rng.random(1000)
+    mock_a[rng.random(1000) < 0.02] = 0
+    mock_b = rng.standard_normal(1000)
+
+    res = finta_kernels.linear_recurrence(mock_a, mock_b, y0=5.0)
+
+    np.testing.assert_allclose(res, mock_recurrence_loop(mock_a, mock_b, 5.0))
+
+
+def test_linear_recurrence_underflow():
+    mock_a = np.full(300, 1e-10)
+    mock_b = np.arange(300, dtype=float)
+
+    res = finta_kernels.linear_recurrence(mock_a, mock_b, y0=1.0)
+
+    np.testing.assert_allclose(res, mock_recurrence_loop(mock_a, mock_b, 1.0))
+
+
+def test_linear_recurrence_nan():
+    mock_a = np.full(10, 0.5)
+    mock_b = np.ones(10)
+    mock_b[4] = np.nan
+
+    res = finta_kernels.linear_recurrence(mock_a, mock_b)
+
+    assert not np.isnan(res[:4]).any()
+    assert np.isnan(res[4:]).all()
+
+
+def test_kama_matches_loop():
+    mock_df = create_flat_ohlcv()
+
+    res = TA.KAMA(mock_df)
+
+    er = TA.ER(mock_df, 10)
+    sc = ((er * (2 / 3 - 2 / 31) + 2 / 31) ** 2).tolist()
+    sma = mock_df.close.rolling(20).mean().shift().tolist()
+    expected = []
+    for s, ma, price in zip(sc, sma, mock_df.close.tolist()):
+        if expected and expected[-1] is not None:
+            expected.append(expected[-1] + s * (price - expected[-1]))
+        elif pd.notnull(ma):
+            expected.append(ma + s * (price - ma))
+        else:
+            expected.append(None)
+
+    np.testing.assert_allclose(res, np.array(expected, dtype=float), rtol=1e-9)
+
+
+def test_evwma_matches_loop():
+    mock_df = create_flat_ohlcv()
+
+    res = TA.EVWMA(mock_df)
+
+    vol_sum = mock_df.volume.rolling(20).sum()
+    x = ((vol_sum - mock_df.volume) / vol_sum).fillna(0).tolist()
+    y = (mock_df.volume * mock_df.close / vol_sum).tolist()
+    expected = [0]
+    for x_i, y_i in zip(x, y):
+        expected.append(0 if x_i == 0 or y_i == 0 else expected[-1] * x_i + y_i)
+
+    np.testing.assert_allclose(res, expected[1:], rtol=1e-9)
+
+
+def test_frama_matches_loop():
+    mock_df = create_flat_ohlcv()
+
+    res = TA.FRAMA(mock_df)
+
+    c = mock_df.close
+    n1 = (c.rolling(10).max() - c.rolling(10).min()) / 10
+    n3 = (c.rolling(20).max() - c.rolling(20).min()) / 20
+    D = (np.log(n1 + n1.shift(10)) - np.log(n3)) / np.log(2)
+    alp = np.clip(np.exp(-4.6 * (D - 1)), 0.01, 1).values
+    expected = c.to_numpy(copy=True)
+    for i in range(20, len(expected)):
+        expected[i] = c.iloc[i] * alp[i] + (1 - alp[i]) * expected[i - 1]
+
+    np.testing.assert_allclose(res, expected, rtol=1e-9)
+    # the flat stretch makes the fractal dimension nan, and it stays nan like the loop
+    assert np.isnan(res.iloc[-1])
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 50])
+def test_sar_psar_short_inputs(size):
+    mock_df = create_flat_ohlcv().iloc[:size]
+
+    assert len(TA.SAR(mock_df)) == size
+    assert len(TA.PSAR(mock_df)) == size
+
+
+def test_psar_columns():
+    mock_df = create_flat_ohlcv()
+
+    res = TA.PSAR(mock_df)
+
+    assert list(res.columns) == ["psar", "psarbull", "psarbear"]
+    assert res.psar.iloc[0] == mock_df.close.iloc[0]
+    bullish = res.psarbull.notna()
+    assert bullish.any() and not bullish.all()
+    assert res.psarbull[bullish].equals(res.psar[bullish])
+
+
+@pytest.mark.parametrize("period", [1, 9, 16])
+def test_wma_matches_rolling_apply(period):
+    mock_values = pd.Series(np.random.default_rng(2).standard_normal(200))
+    mock_values[50] = np.nan
+    weights = np.arange(1, period + 1)
+
+    res = finta_kernels.wma(mock_values.to_numpy(), period)
+
+    expected = mock_values.rolling(period, min_periods=period).apply(
+        lambda x: (weights * x).sum() / weights.sum(), raw=True
+    )
+    np.testing.assert_allclose(res, expected, rtol=1e-12)
+
+
+def test_wma_short_input():
+    res = finta_kernels.wma(np.arange(3, dtype=float), 9)
+
+    assert len(res) == 3
+    assert np.isnan(res).all()
+
+
+@pytest.mark.parametrize("size", [5, 200])
+def test_rolling_mad_matches_rolling_apply(size):
+    mock_values = pd.Series(np.random.default_rng(3).standard_normal(size))
+
+    res = finta_kernels.rolling_mad(mock_values.to_numpy(), 20)
+
+    expected = mock_values.rolling(20, min_periods=0).apply(
+        lambda s: abs(s - s.mean()).mean(), raw=True
+    )
+    np.testing.assert_allclose(res, expected, rtol=1e-12)
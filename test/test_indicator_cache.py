@@ -0,0 +1,98 @@
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from fast_trade.build_data_frame import apply_transformers_to_dataframe
+from fast_trade.indicator_cache import (
+    IndicatorCache,
+    data_fingerprint,
+    indicator_cache_key,
+    result_nbytes,
+)
+from test.mock_data import create_mock_ohlcv
+
+
+def test_indicator_cache_get_set():
+    mock_cache = IndicatorCache()
+    mock_series = pd.Series([1.0, 2.0, 3.0])
+
+    assert mock_cache.get("a") is None
+    mock_cache.set("a", mock_series)
+
+    assert mock_cache.get("a") is mock_series
+    stats = mock_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["bytes"] == result_nbytes(mock_series)
+
+
+def test_indicator_cache_evicts_least_recently_used():
+    mock_series = pd.Series(np.zeros(10))
+    size = result_nbytes(mock_series)
+    mock_cache = IndicatorCache(max_bytes=size * 2)
+
+    mock_cache.set("a", mock_series)
+    mock_cache.set("b", mock_series.copy())
+    mock_cache.get("a")
+    mock_cache.set("c", mock_series.copy())
+
+    assert mock_cache.get("a") is not None
+    assert mock_cache.get("b") is None
+    assert mock_cache.get("c") is not None
+    assert mock_cache.stats()["bytes"] <= size * 2
+
+
+def test_indicator_cache_skips_results_over_budget():
+    mock_cache = IndicatorCache(max_bytes=10)
+
+    mock_cache.set("a", pd.Series(np.zeros(100)))
+
+    assert mock_cache.get("a") is None
+    assert mock_cache.stats()["entries"] == 0
+
+
+def test_indicator_cache_disk(tmp_path):
+    mock_series = pd.Series([1.0, 2.0, 3.0], name="sma")
+    IndicatorCache(disk_path=str(tmp_path)).set("a", mock_series)
+
+    mock_cache = IndicatorCache(disk_path=str(tmp_path))
+    res = mock_cache.get("a")
+
+    assert res.equals(mock_series)
+    assert mock_cache.stats()["disk_hits"] == 1
+
+
+def test_data_fingerprint():
+    mock_df = create_mock_ohlcv()
+    mock_df_changed = mock_df.copy()
+    mock_df_changed.iloc[5, 3] += 1
+
+    assert data_fingerprint(mock_df) == data_fingerprint(mock_df.copy())
+    assert data_fingerprint(mock_df) != data_fingerprint(mock_df_changed)
+    assert data_fingerprint(mock_df) != data_fingerprint(mock_df.iloc[1:])
+
+
+def test_indicator_cache_key():
+    assert indicator_cache_key("abc", "sma") == indicator_cache_key("abc", "sma")
+    assert indicator_cache_key("abc", "sma") != indicator_cache_key("abd", "sma")
+
+
+def test_apply_transformers_to_dataframe_uses_cache(monkeypatch):
+    build_data_frame = importlib.import_module("fast_trade.build_data_frame")
+    mock_cache = IndicatorCache()
+    monkeypatch.setattr(build_data_frame, "get_indicator_cache", lambda: mock_cache)
+
+    mock_df = create_mock_ohlcv()
+    mock_transformers = [
+        {"name": "sma_short", "transformer": "sma", "args": [5]},
+        {"name": "rsi", "transformer": "rsi", "args": [14]},
+    ]
+
+    expected = apply_transformers_to_dataframe(mock_df.copy(), mock_transformers)
+    res = apply_transformers_to_dataframe(mock_df.copy(), mock_transformers)
+
+    assert res.equals(expected)
+    assert mock_cache.stats()["misses"] == 2
+    assert mock_cache.stats()["hits"] == 2
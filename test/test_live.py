@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade import live
+from fast_trade.live import LiveFeed, run_paper
+from fast_trade.utils import latency_stats
+from fast_trade.run_backtest import run_backtest
+from test.mock_data import create_mock_ohlcv
+
+
+def create_mock_backtest(**kwargs):
+    return {
+        "name": "mock",
+        "start_date": "2024-01-01",
+        "freq": "1Min",
+        "commission": 0.1,
+        "lot_size": 0.5,
+        "trailing_stop_loss": 0.05,
+        "datapoints": [
+            {"name": "ema_fast", "transformer": "ema", "args": [5]},
+            {"name": "sma_slow", "transformer": "sma", "args": [20]},
+            {"name": "rsi", "transformer": "rsi", "args": [14]},
+            # uses another datapoint
+            {"name": "rsi_sma", "transformer": "sma", "args": [5, "rsi"]},
+            # can't be streamed
+            {"name": "smm", "transformer": "smm", "args": [9]},
+            {"name": "bb", "transformer": "bbands", "args": [20]},
+        ],
+        "enter": [["ema_fast", ">", "sma_slow", 2], ["rsi", ">", "rsi_sma"]],
+        "exit": [["ema_fast", "<", "sma_slow"]],
+        "any_exit": [["close", "<", "bb_bbands_bb_lower"]],
+        "any_enter": [["smm", ">", "bb_bbands_bb_upper"]],
+        **kwargs,
+    }
+
+
+def test_live_matches_backtest():
+    mock_df = create_mock_ohlcv(size=800, seed=5)
+    mock_backtest = create_mock_backtest()
+    expected = run_backtest(mock_backtest, df=mock_df.copy())["df"].iloc[500:]
+
+    feed = LiveFeed(mock_df.iloc[:500].copy(), window=100)
+    strategy = feed.add_strategy(mock_backtest)
+    res = pd.DataFrame(
+        [
+            feed.update(date, bar)[0]
+            for date, bar in zip(
+                mock_df.index[500:], mock_df.iloc[500:].to_dict("records")
+            )
+        ],
+        index=expected.index,
+    )
+
+    assert (expected.action != "h").any()
+    assert list(res.action) == list(expected.action)
+    assert list(res.in_trade) == list(expected.in_trade)
+    for column in [
+        "ema_fast",
+        "rsi_sma",
+        "smm",
+        "bb_bbands_bb_upper",
+        "trailing_stop_loss",
+        "aux",
+        "account_value",
+        "adj_account_value",
+        "fee",
+    ]:
+        np.testing.assert_allclose(res[column], expected[column], rtol=1e-9)
+
+    assert len(strategy.to_df().index) == 100
+    assert strategy.to_df().index[-1] == mock_df.index[-1]
+    assert strategy.trades
+    assert strategy.stats()["latency"]["count"] == 300
+
+
+def test_datapoints_are_shared():
+    mock_df = create_mock_ohlcv(size=100)
+    feed = LiveFeed(mock_df.copy())
+
+    feed.add_strategy(create_mock_backtest())
+    feed.add_strategy(create_mock_backtest(name="other"))
+
+    # rsi_sma depends on the rsi column of each strategy
+    assert len(feed.indicators) == 5
+
+
+def test_add_strategy_after_first_bar():
+    mock_df = create_mock_ohlcv(size=100)
+    feed = LiveFeed(mock_df.iloc[:99].copy())
+    feed.add_strategy(create_mock_backtest())
+    feed.update(mock_df.index[-1], mock_df.iloc[-1])
+
+    with pytest.raises(ValueError):
+        feed.add_strategy(create_mock_backtest())
+
+
+def test_run_paper(monkeypatch):
+    mock_df = create_mock_ohlcv(size=800, seed=5)
+
+    def mock_get_kline(symbol, exchange, start_date=None, end_date=None, freq="1Min"):
+        return mock_df[start_date:end_date]
+
+    monkeypatch.setattr(live, "get_kline", mock_get_kline)
+    bars = []
+
+    feeds = run_paper(
+        [create_mock_backtest(symbol="BTCUSDT", exchange="binance")],
+        "2024-01-01 10:00",
+        history=300,
+        on_bar=lambda feed, date, rows: bars.append(date),
+    )
+
+    # the history ends before start, and the newest bar is left for the next read
+    assert bars == list(mock_df["2024-01-01 10:00":].index[:-1])
+    assert len(feeds[0].history.index) == 300
+    assert feeds[0].stats()["latency"]["count"] == len(bars)
+
+
+def test_latency_stats():
+    res = latency_stats([0.000001] * 99 + [0.001])
+
+    assert res["count"] == 100
+    assert res["p50_us"] == 1
+    assert res["max_us"] == 1000
+    assert latency_stats([])["count"] == 0
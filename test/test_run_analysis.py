@@ -1,7 +1,12 @@
 import pytest
+import numpy as np
 import pandas as pd
 import random
 from fast_trade.run_analysis import (
+    ACTION_DTYPE,
+    action_codes,
+    actions_to_labels,
+    actions_to_signals,
     calculate_new_account_value_on_enter,
     convert_base_to_aux,
     convert_aux_to_base,
@@ -9,6 +14,8 @@ from fast_trade.run_analysis import (
     enter_position,
     exit_position,
     calculate_fee,
+    round_array,
+    simulate_positions,
 )
 
 
@@ -516,3 +523,116 @@ def test_apply_logic_to_df_lot_size():
         1539.8184294100001,
         1539.8184294100001,
     ]
+
+
+def test_actions_to_signals():
+    actions = np.array(["e", "ae", "x", "ax", "tsl", "h"], dtype=object)
+
+    res = actions_to_signals(actions)
+
+    assert res.dtype == np.int8
+    assert list(res) == [1, 1, -1, -1, -1, 0]
+    assert list(actions_to_signals(action_codes(actions))) == list(res)
+    assert list(actions_to_signals(pd.Categorical(actions))) == list(res)
+
+
+def test_action_codes_roundtrip():
+    actions = np.array(["e", "ae", "x", "ax", "tsl", "h"], dtype=object)
+
+    res = action_codes(actions)
+
+    assert res.dtype == np.int8
+    assert list(res) == [1, 2, 3, 4, 5, 0]
+    assert list(actions_to_labels(res)) == list(actions)
+    assert list(action_codes(pd.Series(actions, dtype=ACTION_DTYPE))) == list(res)
+    assert list(action_codes(np.array(["h", "nope"], dtype=object))) == [0, -1]
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_exit_on_end_keeps_dtypes(vectorized):
+    mock_df = pd.DataFrame(
+        {"close": [1.0, 2.0, 3.0]},
+        index=pd.date_range("2024-01-01", periods=3, freq="1min"),
+    )
+    mock_df["action"] = pd.Categorical(["h", "e", "h"], dtype=ACTION_DTYPE)
+    mock_backtest = {
+        "base_balance": 1000,
+        "commission": 0,
+        "lot_size_perc": 1,
+        "max_lot_size": 0,
+        "exit_on_end": True,
+    }
+
+    res = apply_logic_to_df(mock_df, mock_backtest, vectorized=vectorized)
+
+    assert len(res) == 4
+    assert res.action.dtype == ACTION_DTYPE
+    assert res.close.dtype == np.float64
+    assert not res.in_trade.iloc[-1]
+
+
+def test_round_array_matches_round():
+    rng = np.random.default_rng(7)
+    values = rng.random(5000) * rng.choice([1, 100, 10000], 5000)
+    # values that sit right on a rounding boundary
+    values = np.append(values, [0.123456785, 2.675e-8, 1.000000005, 12345.123456785])
+
+    res = round_array(values)
+
+    assert list(res) == [round(float(v), 8) for v in values]
+
+
+def test_simulate_positions_no_trades():
+    close = np.array([1.0, 2.0, 3.0])
+    signals = np.array([0, -1, 0], dtype=np.int8)
+    mock_backtest = {"base_balance": 1000, "commission": 0, "lot_size_perc": 1}
+
+    res = simulate_positions(close, signals, mock_backtest)
+
+    assert list(res["account_value"]) == [1000.0, 1000.0, 1000.0]
+    assert list(res["adj_account_value"]) == [1000.0, 1000.0, 1000.0]
+    assert not res["in_trade"].any()
+
+
+@pytest.mark.parametrize(
+    "mock_backtest",
+    [
+        {
+            "base_balance": 1000,
+            "exit_on_end": True,
+            "commission": 0.0,
+            "lot_size_perc": 1,
+        },
+        {
+            "base_balance": 1000,
+            "exit_on_end": False,
+            "commission": 0.1,
+            "lot_size_perc": 0.5,
+        },
+        {
+            "base_balance": 2500,
+            "exit_on_end": True,
+            "commission": 0.075,
+            "lot_size_perc": 0.8,
+            "max_lot_size": 1500,
+            "slippage": 0.001,
+        },
+    ],
+)
+def test_apply_logic_to_df_matches_row_by_row(mock_backtest):
+    rng = np.random.default_rng(11)
+    rows = 2000
+    mock_df = pd.DataFrame(
+        {"close": np.round(100 + rng.normal(0, 1, rows).cumsum(), 2)},
+        index=pd.date_range("2024-01-01", periods=rows, freq="1min"),
+    )
+    mock_df["action"] = rng.choice(
+        ["e", "ae", "x", "ax", "tsl", "h"], rows, p=[0.03, 0.02, 0.03, 0.01, 0.01, 0.9]
+    )
+
+    expected = apply_logic_to_df(mock_df.copy(), mock_backtest, vectorized=False)
+    res = apply_logic_to_df(mock_df.copy(), mock_backtest)
+
+    assert list(res.index) == list(expected.index)
+    for column in ["aux", "account_value", "adj_account_value", "in_trade", "fee"]:
+        assert list(res[column]) == list(expected[column])
@@ -1,8 +1,14 @@
+import json
+
+import numpy as np
+import pytest
 from numpy import nan
 from fast_trade.run_backtest import (
+    EQUITY_COLUMNS,
     prepare_new_backtest,
     process_logic_and_generate_actions,
     run_backtest,
+    run_backtests,
     take_action,
     clean_field_type,
     process_single_logic,
@@ -12,6 +18,7 @@ from fast_trade.run_backtest import (
 )
 
 from collections import namedtuple
+import importlib
 import pandas as pd
 
 
@@ -877,3 +884,154 @@ def test_apply_backtest_to_df():
 
     assert "adj_account_value_change_perc" in list(res.columns)
     assert "adj_account_value_change" in list(res.columns)
+
+
+def test_run_backtests_matches_run_backtest():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+    mock_backtests = [
+        {
+            "freq": "1Min",
+            "start_date": "2018-04-17",
+            "datapoints": [{"name": "short", "transformer": "sma", "args": [2]}],
+            "enter": [["close", ">", "short"]],
+            "exit": [["close", "<", "short"]],
+        },
+        {
+            "freq": "1Min",
+            "start_date": "2018-04-17",
+            "datapoints": [
+                {"name": "sma_2", "transformer": "sma", "args": [2]},
+                {"name": "ema_3", "transformer": "ema", "args": [3]},
+            ],
+            "enter": [["sma_2", ">", "ema_3"]],
+            "exit": [["sma_2", "<", "ema_3"]],
+            "commission": 0.01,
+        },
+        {
+            "freq": "2Min",
+            "start_date": "2018-04-17",
+            "datapoints": [{"name": "short", "transformer": "sma", "args": [2]}],
+            "enter": [["close", ">", "short"]],
+            "exit": [["close", "<", "short"]],
+        },
+    ]
+
+    res = run_backtests(mock_backtests, df=mock_df.copy(), summary=False)
+
+    assert len(res) == len(mock_backtests)
+    for mock_backtest, batch_res in zip(mock_backtests, res):
+        single_res = run_backtest(mock_backtest, df=mock_df.copy(), summary=False)
+        assert batch_res["df"].equals(single_res["df"])
+        assert batch_res["backtest"] == single_res["backtest"]
+
+
+def test_run_backtests_calculates_datapoints_once(monkeypatch):
+    build_data_frame = importlib.import_module("fast_trade.build_data_frame")
+    monkeypatch.setattr(build_data_frame, "get_indicator_cache", lambda: None)
+
+    calls = []
+    original_calculate = build_data_frame.calculate_transformer
+
+    def mock_calculate(df, ind):
+        calls.append(ind.get("transformer"))
+        return original_calculate(df, ind)
+
+    monkeypatch.setattr(build_data_frame, "calculate_transformer", mock_calculate)
+
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+    mock_backtests = [
+        {
+            "freq": "1Min",
+            "start_date": "2018-04-17",
+            "datapoints": [{"name": f"sma_{i}", "transformer": "sma", "args": [2]}],
+            "enter": [["close", ">", f"sma_{i}"]],
+            "exit": [["close", "<", f"sma_{i}"]],
+        }
+        for i in range(5)
+    ]
+
+    res = run_backtests(mock_backtests, df=mock_df, summary=False)
+
+    assert len(res) == 5
+    assert calls == ["sma"]
+
+
+def test_run_backtest_metrics_from_rules():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+    mock_backtest = {
+        "freq": "1Min",
+        "start_date": "2018-04-17",
+        "datapoints": [{"name": "short", "transformer": "sma", "args": [2]}],
+        "enter": [["close", ">", "short"]],
+        "exit": [["close", "<", "short"]],
+        "rules": [["return_perc", ">=", "buy_and_hold_perc"]],
+    }
+
+    full_res = run_backtest(mock_backtest, df=mock_df.copy())
+    res = run_backtest(mock_backtest, df=mock_df.copy(), metrics="rules")
+
+    assert "sqn" not in res["summary"]
+    assert res["summary"]["return_perc"] == full_res["summary"]["return_perc"]
+    assert res["summary"]["rules"] == full_res["summary"]["rules"]
+
+
+def create_mock_result_backtest():
+    return {
+        "freq": "1Min",
+        "start_date": "2018-04-17",
+        "trailing_stop_loss": 0.05,
+        "datapoints": [
+            {"name": "short", "transformer": "sma", "args": [2]},
+            {"name": "unused", "transformer": "ema", "args": [3]},
+            {"name": "bb", "transformer": "bbands", "args": [3]},
+        ],
+        "enter": [["close", ">", "short"]],
+        "exit": [["close", "<", "bb_bbands_bb_lower"]],
+    }
+
+
+def test_run_backtest_return_df():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+    mock_backtest = create_mock_result_backtest()
+
+    full_res = run_backtest(mock_backtest, df=mock_df.copy())
+    res = {
+        return_df: run_backtest(mock_backtest, df=mock_df.copy(), return_df=return_df)
+        for return_df in ["logic", "equity", "none"]
+    }
+
+    assert "unused" not in res["logic"]["df"].columns
+    assert "bb_bbands_bb_upper" not in res["logic"]["df"].columns
+    assert {"open", "short", "bb_bbands_bb_lower", "trailing_stop_loss"} <= set(
+        res["logic"]["df"].columns
+    )
+    assert list(res["equity"]["df"].columns) == EQUITY_COLUMNS
+    assert res["none"]["df"] is None
+    for mode_res in res.values():
+        pd.testing.assert_frame_equal(
+            mode_res["trade_df"][["adj_account_value", "in_trade"]],
+            full_res["trade_df"][["adj_account_value", "in_trade"]],
+        )
+        summary = {**mode_res["summary"], "test_duration": None}
+        expected = {**full_res["summary"], "test_duration": None}
+        assert json.dumps(summary, default=str) == json.dumps(expected, default=str)
+
+
+def test_run_backtest_bad_return_df():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+
+    with pytest.raises(ValueError):
+        run_backtest(create_mock_result_backtest(), df=mock_df, return_df="nope")
+
+
+def test_run_backtest_indicator_dtype():
+    mock_df = pd.read_csv("./test/ohlcv_data.csv.txt", parse_dates=True)
+
+    res = run_backtest(
+        create_mock_result_backtest(), df=mock_df.copy(), indicator_dtype="float32"
+    )
+
+    for column in ["short", "unused", "bb_bbands_bb_lower"]:
+        assert res["df"][column].dtype == np.float32
+    for column in ["close", "trailing_stop_loss", "adj_account_value"]:
+        assert res["df"][column].dtype == np.float64
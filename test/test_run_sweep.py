@@ -0,0 +1,163 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fast_trade import run_sweep as run_sweep_module
+from fast_trade.run_backtest import run_backtest
+from fast_trade.run_sweep import (
+    attach_df,
+    build_sweep_backtests,
+    expand_param_values,
+    generate_param_sets,
+    run_sweep,
+    set_param,
+    share_df,
+)
+from test.mock_data import create_mock_ohlcv
+
+mock_backtest = {
+    "freq": "1Min",
+    "start_date": "2024-01-01",
+    "exit_on_end": True,
+    "datapoints": [
+        {"name": "short", "transformer": "sma", "args": [5]},
+        {"name": "long", "transformer": "sma", "args": [20]},
+    ],
+    "enter": [["short", ">", "long"]],
+    "exit": [["short", "<", "long"]],
+}
+
+
+def test_expand_param_values():
+    assert expand_param_values([1, 2]) == [1, 2]
+    assert expand_param_values(5) == [5]
+    assert expand_param_values({"start": 2, "stop": 6, "step": 2}) == [2, 4, 6]
+    assert expand_param_values({"start": 0, "stop": 0.1, "step": 0.05}) == [
+        0.0,
+        0.05,
+        0.1,
+    ]
+
+
+def test_generate_param_sets_grid():
+    res = generate_param_sets({"a": [1, 2], "b": ["x", "y"]})
+
+    assert res == [
+        {"a": 1, "b": "x"},
+        {"a": 1, "b": "y"},
+        {"a": 2, "b": "x"},
+        {"a": 2, "b": "y"},
+    ]
+
+
+def test_generate_param_sets_random():
+    res = generate_param_sets({"a": [1, 2, 3]}, mode="random", samples=5, seed=1)
+
+    assert len(res) == 5
+    assert all(param_set["a"] in [1, 2, 3] for param_set in res)
+    assert res == generate_param_sets(
+        {"a": [1, 2, 3]}, mode="random", samples=5, seed=1
+    )
+
+
+def test_generate_param_sets_bad_mode():
+    with pytest.raises(ValueError):
+        generate_param_sets({"a": [1]}, mode="nope")
+
+
+def test_set_param():
+    backtest = {"datapoints": [{"args": [5]}], "exit": [["close", "<", 10]]}
+
+    set_param(backtest, "datapoints.0.args.0", 9)
+    set_param(backtest, "exit.0.2", 20)
+    set_param(backtest, "freq", "5Min")
+
+    assert backtest == {
+        "datapoints": [{"args": [9]}],
+        "exit": [["close", "<", 20]],
+        "freq": "5Min",
+    }
+
+
+def test_build_sweep_backtests_copies_base():
+    res = build_sweep_backtests(mock_backtest, [{"datapoints.0.args.0": 3}])
+
+    assert res[0]["datapoints"][0]["args"] == [3]
+    assert mock_backtest["datapoints"][0]["args"] == [5]
+
+
+def test_share_df_roundtrip():
+    mock_df = create_mock_ohlcv(size=50)
+
+    shm, spec = share_df(mock_df)
+    try:
+        attached_shm, res = attach_df(spec)
+        assert res.equals(mock_df)
+        attached_shm.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_run_sweep_matches_run_backtest():
+    mock_df = create_mock_ohlcv()
+    mock_params = {"datapoints.0.args.0": [3, 5], "datapoints.1.args.0": [10, 20]}
+
+    res = list(
+        run_sweep(mock_backtest, mock_params, df=mock_df, max_workers=2, chunk_size=3)
+    )
+
+    assert len(res) == 4
+    for result in res:
+        backtest = build_sweep_backtests(mock_backtest, [result["params"]])[0]
+        expected = run_backtest(backtest, df=mock_df.copy())["summary"]
+        assert result["error"] is None
+        assert result["summary"]["return_perc"] == expected["return_perc"]
+        assert result["summary"]["num_trades"] == expected["num_trades"]
+
+
+def test_run_sweep_drops_failed_rules():
+    mock_df = create_mock_ohlcv()
+    mock_params = {"datapoints.0.args.0": [3, 5]}
+    rules_backtest = {**mock_backtest, "rules": [["return_perc", ">", 100000]]}
+
+    res = list(run_sweep(rules_backtest, mock_params, df=mock_df, max_workers=1))
+    res_with_failed = list(
+        run_sweep(
+            rules_backtest,
+            mock_params,
+            df=mock_df,
+            max_workers=1,
+            include_failed=True,
+        )
+    )
+
+    assert res == []
+    assert len(res_with_failed) == 2
+
+
+def test_run_sweep_backpressure(monkeypatch):
+    submitted = []
+
+    class MockExecutor(ThreadPoolExecutor):
+        def submit(self, fn, chunk, *args):
+            submitted.append(chunk)
+            return super().submit(fn, chunk, *args)
+
+    monkeypatch.setattr(run_sweep_module, "ProcessPoolExecutor", MockExecutor)
+    mock_params = {"datapoints.0.args.0": list(range(2, 12))}
+
+    results = run_sweep(
+        mock_backtest,
+        mock_params,
+        df=create_mock_ohlcv(),
+        max_workers=1,
+        chunk_size=1,
+        max_pending=2,
+    )
+    next(results)
+
+    # the first two chunks, and one more for each chunk that finished
+    assert len(submitted) <= 4
+    assert len(list(results)) == 9
+    assert len(submitted) == 10
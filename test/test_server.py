@@ -0,0 +1,356 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import anyio
+import numpy as np
+import pandas as pd
+import pytest
+from starlette.requests import ClientDisconnect
+from starlette.testclient import TestClient
+
+from fast_trade import run_sweep, server
+from fast_trade.run_backtest import MissingData
+from fast_trade.server import create_app, jsonable
+from test.mock_data import create_mock_ohlcv
+
+
+def create_mock_backtest(**kwargs):
+    return {
+        "symbol": "MOCK",
+        "exchange": "mock",
+        "start_date": "2024-01-01",
+        "freq": "1Min",
+        "datapoints": [
+            {"name": "ema_fast", "transformer": "ema", "args": [5]},
+            {"name": "sma_slow", "transformer": "sma", "args": [20]},
+        ],
+        "enter": [["ema_fast", ">", "sma_slow"]],
+        "exit": [["ema_fast", "<", "sma_slow"]],
+        **kwargs,
+    }
+
+
+@pytest.fixture
+def mock_loads(monkeypatch):
+    loads = []
+
+    def mock_load_backtest_df(backtest, datapoints):
+        loads.append(backtest.get("symbol"))
+        if backtest.get("symbol") == "MISSING":
+            raise MissingData("No data found for MISSING")
+        return create_mock_ohlcv()
+
+    monkeypatch.setattr(server, "load_backtest_df", mock_load_backtest_df)
+    monkeypatch.setattr(server, "_kline_cache", server.OrderedDict())
+
+    return loads
+
+
+def create_client(**kwargs):
+    return TestClient(
+        create_app(max_workers=1, executor_class=ThreadPoolExecutor, **kwargs)
+    )
+
+
+def test_submit_and_poll(mock_loads):
+    with create_client() as client:
+        res = client.post("/backtests", json=create_mock_backtest())
+        assert res.status_code == 202
+
+        job = client.get(f"/backtests/{res.json()['id']}", params={"wait": 10}).json()
+
+    assert job["status"] == "done"
+    assert job["summary"]["num_trades"] > 0
+    assert job["summary"]["strategy"]["symbol"] == "MOCK"
+
+
+def test_invalid_backtest():
+    with create_client() as client:
+        mock_backtest = create_mock_backtest()
+        del mock_backtest["enter"]
+        res = client.post("/backtests", json=mock_backtest)
+        assert res.status_code == 400
+        assert "error" in res.json()
+
+        assert client.post("/backtests", content="not json").status_code == 400
+        assert client.get("/backtests/missing").status_code == 404
+
+
+def test_failed_backtest(mock_loads):
+    mock_backtest = create_mock_backtest(symbol="MISSING")
+
+    with create_client() as client:
+        job_id = client.post("/backtests", json=mock_backtest).json()["id"]
+        job = client.get(f"/backtests/{job_id}", params={"wait": 10}).json()
+
+    assert job["status"] == "failed"
+    assert "No data found" in job["error"]
+
+
+def test_queue_full_and_cancel(monkeypatch):
+    release = threading.Event()
+
+    def mock_run_backtest_job(backtest, metrics=None):
+        release.wait(10)
+        return {}
+
+    monkeypatch.setattr(server, "run_backtest_job", mock_run_backtest_job)
+
+    with create_client(max_queue=1) as client:
+        running = client.post("/backtests", json=create_mock_backtest()).json()
+        queued = client.post("/backtests", json=create_mock_backtest()).json()
+
+        assert running["status"] == "running"
+        assert queued["status"] == "queued"
+        assert client.post("/backtests", json=create_mock_backtest()).status_code == 429
+
+        stats = client.get("/stats").json()
+        assert stats["queue_depth"] == 1
+        assert stats["running"] == 1
+
+        cancelled = client.delete(f"/backtests/{queued['id']}").json()
+        assert cancelled["status"] == "cancelled"
+        assert client.get("/stats").json()["queue_depth"] == 0
+
+        release.set()
+        job = client.get(f"/backtests/{running['id']}", params={"wait": 10}).json()
+        assert job["status"] == "done"
+        assert client.get("/stats").json()["latency"]["count"] == 1
+
+
+def crash_or_run_backtest_job(backtest, metrics=None):
+    if backtest.get("symbol") == "CRASH":
+        # like a worker killed for running out of memory
+        os._exit(1)
+    return {"symbol": backtest.get("symbol")}
+
+
+def test_worker_crash(monkeypatch):
+    monkeypatch.setattr(server, "run_backtest_job", crash_or_run_backtest_job)
+    app = create_app(max_workers=1, executor_class=ProcessPoolExecutor)
+
+    with TestClient(app) as client:
+        crashed, queued = [
+            client.post("/backtests", json=create_mock_backtest(symbol=symbol)).json()
+            for symbol in ["CRASH", "MOCK"]
+        ]
+        crashed = client.get(f"/backtests/{crashed['id']}", params={"wait": 10}).json()
+        queued = client.get(f"/backtests/{queued['id']}", params={"wait": 10}).json()
+
+        # the pool was replaced, new jobs still run
+        job_id = client.post("/backtests", json=create_mock_backtest()).json()["id"]
+        job = client.get(f"/backtests/{job_id}", params={"wait": 10}).json()
+        stats = client.get("/stats").json()
+
+    assert crashed["status"] == "failed"
+    # it was waiting for the pool that broke
+    assert queued["status"] == "failed"
+    assert job["status"] == "done"
+    assert job["summary"] == {"symbol": "MOCK"}
+    assert stats["running"] == 0
+
+
+class MockBrokenExecutor:
+    def submit(self, *args):
+        raise server.BrokenExecutor("A worker stopped")
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def test_worker_crash_without_executor_factory():
+    jobs = server.JobQueue(MockBrokenExecutor(), max_workers=1)
+
+    job = jobs.submit(create_mock_backtest())
+
+    assert job.status == "failed"
+    assert jobs.running == 0
+    with pytest.raises(server.ExecutorBroken):
+        jobs.submit(create_mock_backtest())
+
+
+def test_stream(mock_loads):
+    with create_client() as client:
+        job_id = client.post("/backtests", json=create_mock_backtest()).json()["id"]
+
+        with client.stream("GET", f"/backtests/{job_id}/stream") as res:
+            lines = [line for line in res.iter_lines() if line]
+
+    assert res.headers["content-type"] == "application/x-ndjson"
+    assert '"status": "done"' in lines[-1]
+
+
+def test_kline_cache(mock_loads):
+    with create_client() as client:
+        for backtest in [
+            create_mock_backtest(),
+            create_mock_backtest(exit=[["ema_fast", "<", 100]]),
+            create_mock_backtest(symbol="OTHER"),
+        ]:
+            job_id = client.post("/backtests", json=backtest).json()["id"]
+            client.get(f"/backtests/{job_id}", params={"wait": 10})
+
+    assert mock_loads == ["MOCK", "OTHER"]
+
+
+def test_jsonable():
+    res = jsonable(
+        {
+            "a": np.float64(np.nan),
+            "b": [np.int64(2), float("inf")],
+            "c": pd.Timestamp("2024-01-01"),
+            "d": pd.Timedelta(minutes=1),
+        }
+    )
+
+    assert res == {"a": None, "b": [2, None], "c": "2024-01-01T00:00:00", "d": 60.0}
+
+
+@pytest.fixture
+def mock_sweep(monkeypatch):
+    monkeypatch.setattr(run_sweep, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(
+        run_sweep, "load_backtest_df", lambda backtest, datapoints: create_mock_ohlcv()
+    )
+
+
+def test_sweep_ndjson(mock_sweep):
+    mock_body = {
+        "strategy": create_mock_backtest(rules=[["num_trades", ">", 0]]),
+        "params": {"datapoints.0.args.0": [3, 5, 8]},
+        "chunk_size": 1,
+    }
+
+    with create_client() as client:
+        with client.stream("POST", "/sweeps", json=mock_body) as res:
+            lines = [json.loads(line) for line in res.iter_lines() if line]
+
+    assert res.headers["content-type"] == "application/x-ndjson"
+    assert sorted(line["params"]["datapoints.0.args.0"] for line in lines) == [3, 5, 8]
+    assert all(line["summary"]["rules"]["all"] for line in lines)
+
+
+def test_sweep_sse_drops_failed_rules(mock_sweep):
+    mock_body = {
+        "strategy": create_mock_backtest(rules=[["return_perc", ">", 100000]]),
+        "params": {"datapoints.0.args.0": [3, 5]},
+    }
+
+    with create_client() as client:
+        with client.stream("POST", "/sweeps?format=sse", json=mock_body) as res:
+            body = "".join(res.iter_text())
+
+    assert res.headers["content-type"].startswith("text/event-stream")
+    assert body == 'event: done\ndata: {"results": 0}\n\n'
+
+
+def create_sweep_scope(spec_version="2.0"):
+    """The scope of a POST /sweeps, to call the app directly and control when the client disconnects"""
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/sweeps",
+        "raw_path": b"/sweeps",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+def test_sweep_stops_when_client_disconnects(mock_sweep, monkeypatch):
+    chunks = []
+    release = threading.Event()
+    run_sweep_chunk = run_sweep._run_sweep_chunk
+
+    def mock_run_sweep_chunk(chunk, *args):
+        chunks.append(chunk)
+        if len(chunks) > 1:
+            # the client disconnects while this chunk is running
+            release.wait(10)
+        return run_sweep_chunk(chunk, *args)
+
+    monkeypatch.setattr(run_sweep, "_run_sweep_chunk", mock_run_sweep_chunk)
+    mock_body = json.dumps(
+        {
+            "strategy": create_mock_backtest(),
+            "params": {"datapoints.0.args.0": list(range(2, 50))},
+            "chunk_size": 1,
+        }
+    ).encode()
+
+    async def disconnect_after_first_line(app):
+        first_line = anyio.Event()
+        messages = [{"type": "http.request", "body": mock_body, "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await first_line.wait()
+            # by now the stream is waiting on the next result
+            await anyio.sleep(0.1)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message.get("body"):
+                first_line.set()
+
+        await app(create_sweep_scope(), receive, send)
+
+    with create_client() as client:
+        threading.Timer(0.5, release.set).start()
+        client.portal.call(disconnect_after_first_line, client.app)
+        # the sweep's workers are stopped by the time it stops counting as running
+        assert client.get("/stats").json()["sweeps"] == 0
+        time.sleep(0.2)
+
+    # the chunk that was running finished, the queued one was cancelled
+    assert len(chunks) == 2
+
+
+def test_sweep_disconnect_before_first_result(mock_sweep):
+    mock_body = {
+        "strategy": create_mock_backtest(),
+        "params": {"datapoints.0.args.0": [3, 5]},
+    }
+
+    async def disconnect_on_start(app):
+        messages = [
+            {"type": "http.request", "body": json.dumps(mock_body).encode()},
+        ]
+
+        async def receive():
+            return messages.pop() if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            # the client is gone before the response starts
+            raise OSError("Connection reset")
+
+        await app(create_sweep_scope("2.4"), receive, send)
+
+    with create_client() as client:
+        with pytest.raises(ClientDisconnect):
+            client.portal.call(disconnect_on_start, client.app)
+
+        assert client.get("/stats").json()["sweeps"] == 0
+        assert client.post("/sweeps", json=mock_body).status_code == 200
+
+
+def test_invalid_sweep():
+    with create_client() as client:
+        for mock_body in [
+            {"strategy": create_mock_backtest()},
+            {
+                "strategy": create_mock_backtest(),
+                "params": {"datapoints.9.args.0": [1]},
+            },
+            {"strategy": create_mock_backtest(), "params": {"a": [1]}, "mode": "nope"},
+        ]:
+            assert client.post("/sweeps", json=mock_body).status_code == 400
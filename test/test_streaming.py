@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fast_trade.streaming import create_streaming_indicator, streaming_map
+from fast_trade.transformers_map import transformers_map
+from test.mock_data import create_mock_ohlcv
+
+
+def create_gapped_ohlcv():
+    # a flat stretch, where the windows are constant
+    mock_df = create_mock_ohlcv(size=600, seed=4, flat=slice(200, 240))
+    mock_df.iloc[200:240, [1, 2]] = mock_df.close.iloc[200]
+    # a missing bar
+    mock_df.iloc[400] = np.nan
+
+    return mock_df
+
+
+def assert_matches_batch(values, batch):
+    if isinstance(batch, pd.DataFrame):
+        res = pd.DataFrame(values, index=batch.index)
+        assert list(res.columns) == list(batch.columns)
+    else:
+        res = pd.Series(values, index=batch.index, dtype=float)
+
+    np.testing.assert_allclose(
+        np.asarray(res, dtype=float), np.asarray(batch, dtype=float), rtol=1e-9
+    )
+
+
+@pytest.mark.parametrize("transformer", list(streaming_map))
+def test_matches_batch(transformer):
+    mock_df = create_gapped_ohlcv()
+    indicator = create_streaming_indicator({"transformer": transformer})
+
+    res = [indicator.update(bar) for bar in mock_df.to_dict("records")]
+
+    assert_matches_batch(res, transformers_map[transformer](mock_df.copy()))
+
+
+@pytest.mark.parametrize(
+    "transformer, args",
+    [
+        ("sma", [1]),
+        ("ema", [5, "close", False]),
+        ("wma", [20]),
+        ("rsi", [7, "open", False]),
+        ("macd", [3, 8, 4, "close", False]),
+        ("bbands", [10, None, "close", 1.5]),
+        ("stochd", [5, 10]),
+        ("rolling_min", [3, "low"]),
+    ],
+)
+def test_matches_batch_with_args(transformer, args):
+    mock_df = create_gapped_ohlcv()
+    indicator = create_streaming_indicator({"transformer": transformer, "args": args})
+
+    res = [indicator.update(bar) for bar in mock_df.to_dict("records")]
+
+    assert_matches_batch(res, transformers_map[transformer](mock_df.copy(), *args))
+
+
+def test_seed_then_update():
+    mock_df = create_gapped_ohlcv()
+    indicator = create_streaming_indicator({"transformer": "macd"})
+
+    seeded = indicator.seed(mock_df.iloc[:-10])
+    res = [indicator.update(bar) for bar in mock_df.iloc[-10:].to_dict("records")]
+
+    batch = transformers_map["macd"](mock_df.copy())
+    assert seeded == pytest.approx(batch.iloc[-11].to_dict())
+    assert_matches_batch(res, batch.iloc[-10:])
+    assert indicator.value == res[-1]
+
+
+def test_create_streaming_indicator_errors():
+    with pytest.raises(ValueError):
+        create_streaming_indicator({"transformer": "kama"})
+
+    with pytest.raises(ValueError):
+        create_streaming_indicator({"transformer": "sma", "freq": "5Min"})
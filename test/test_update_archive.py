@@ -0,0 +1,124 @@
+import time
+
+import pandas as pd
+import pytest
+
+from fast_trade.archive import rate_limit, update_archive
+
+
+class MockResponse:
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_token_bucket_waits_for_tokens():
+    mock_bucket = rate_limit.TokenBucket(rate=100, capacity=2)
+
+    assert mock_bucket.acquire(2) == 0
+    start = time.monotonic()
+    mock_bucket.acquire(1)
+
+    assert time.monotonic() - start >= 0.009
+
+
+def test_token_bucket_pause():
+    mock_bucket = rate_limit.TokenBucket(rate=1000, capacity=10)
+
+    mock_bucket.pause(0.05)
+
+    assert mock_bucket.acquire(1) >= 0.04
+
+
+def test_record_response_binance_weight(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+
+    rate_limit.record_response(
+        "binance",
+        MockResponse(
+            headers={"X-MBX-USED-WEIGHT-1M": str(rate_limit.BINANCE_WEIGHT_LIMIT - 5)}
+        ),
+    )
+
+    assert rate_limit.get_rate_limiter("binance").tokens <= 5
+
+
+def test_get_rate_limiter_unsupported():
+    with pytest.raises(ValueError):
+        rate_limit.get_rate_limiter("nope")
+
+
+def test_db_writer():
+    written = []
+    mock_df = pd.DataFrame({"close": [1.0, 2.0]})
+
+    writer = update_archive.DBWriter(
+        write_func=lambda df, symbol, exchange: written.append((symbol, exchange))
+    )
+    writer.start()
+    writer.store(mock_df, "BTCUSDT", "binance")
+    writer.store(mock_df, "BTCUSDT", "binance")
+    writer.close()
+
+    assert written == [("BTCUSDT", "binance"), ("BTCUSDT", "binance")]
+    assert writer.rows_written == 4
+
+
+def test_db_writer_raises_write_errors():
+    def mock_write(df, symbol, exchange):
+        raise IOError("disk full")
+
+    writer = update_archive.DBWriter(write_func=mock_write)
+    writer.start()
+    writer.store(pd.DataFrame({"close": [1.0]}), "BTCUSDT", "binance")
+
+    with pytest.raises(IOError):
+        writer.close()
+
+
+def test_update_archive_stats(monkeypatch):
+    mock_assets = [
+        ("binance", "BTCUSDT"),
+        ("binance", "ETHUSDT"),
+        ("coinbase", "BTC-USD"),
+    ]
+
+    def mock_update_single_archive(symbol, exchange, store_func=None):
+        if symbol == "ETHUSDT":
+            raise Exception("bad symbol")
+        store_func(pd.DataFrame({"close": [1.0, 2.0, 3.0]}), symbol, exchange)
+
+    monkeypatch.setattr(update_archive, "get_local_assets", lambda: mock_assets)
+    monkeypatch.setattr(
+        update_archive, "update_single_archive", mock_update_single_archive
+    )
+    monkeypatch.setattr(update_archive, "update_klines_to_db", lambda *args: None)
+
+    with pytest.raises(update_archive.UpdateArchiveError) as e:
+        update_archive.update_archive(max_workers=3)
+
+    res = e.value.stats
+    assert str(e.value) == "Failed to update 1 symbols"
+    assert res["binance"]["completed"] == 1
+    assert res["binance"]["failed"] == 1
+    assert res["binance"]["rows"] == 3
+    assert res["coinbase"]["completed"] == 1
+
+
+def test_update_archive_no_failures(monkeypatch):
+    mock_assets = [("binance", "BTCUSDT"), ("binance", "ETHUSDT")]
+
+    def mock_update_single_archive(symbol, exchange, store_func=None):
+        store_func(pd.DataFrame({"close": [1.0, 2.0]}), symbol, exchange)
+
+    monkeypatch.setattr(update_archive, "get_local_assets", lambda: mock_assets)
+    monkeypatch.setattr(
+        update_archive, "update_single_archive", mock_update_single_archive
+    )
+    monkeypatch.setattr(update_archive, "update_klines_to_db", lambda *args: None)
+
+    res = update_archive.update_archive(max_workers=2)
+
+    assert res["binance"]["completed"] == 2
+    assert res["binance"]["failed"] == 0
+    assert res["binance"]["rows"] == 4